@@ -20,6 +20,7 @@ def main():
     
     trips = db["taxi_trips"]
     anomalies = db["anomalies_taxi"]
+    buckets = db["trip_buckets_hourly"]
 
     # Create indexes for taxi_trips
     print("🔨 Creating indexes on taxi_trips...")
@@ -33,12 +34,18 @@ def main():
     anomalies.create_index([("trip_id", ASCENDING)])
     anomalies.create_index([("score", ASCENDING)])
 
+    # Hourly per-zone buckets maintained by the sync (scripts/trip_buckets.py)
+    print("🔨 Creating indexes on trip_buckets_hourly...")
+    buckets.create_index([("hour", ASCENDING), ("pu_location_id", ASCENDING)], unique=True)
+    buckets.create_index([("pu_location_id", ASCENDING), ("hour", ASCENDING)])
+
     print("✅ MongoDB indexes created successfully")
     
     # Print collection stats
     print(f"\n📊 Collection stats:")
     print(f"   taxi_trips:      {trips.count_documents({})} documents")
     print(f"   anomalies_taxi:  {anomalies.count_documents({})} documents")
+    print(f"   trip_buckets_hourly: {buckets.count_documents({})} documents")
     print("="*60)
     
     client.close()
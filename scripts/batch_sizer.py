@@ -0,0 +1,141 @@
+"""
+Adaptive batch sizing for the ETL and sync loops.
+
+AdaptiveBatchSizer replaces hand-tuned constants (CHUNK_SIZE, BATCH_SIZE) with
+a feedback controller:
+
+- Throughput: every WINDOW batches the average rows/sec is compared with the
+  previous window. The size keeps moving in the same direction (x STEP) while
+  throughput clearly improves and turns around otherwise (hill climbing).
+- Latency: a batch slower than the target latency shrinks the size straight
+  away, proportionally to how far over target it was.
+- Hard limits: max_ops caps the rows per batch and max_bytes (with the
+  observed bytes/row) caps the payload, e.g. Mongo's 16 MB / 100k-op bulk
+  limits.
+- Errors: on_error() halves the size; callers retry the failed batch split
+  in two (split_batch) until it goes through.
+
+The chosen sizes are summarised by summary() for db_metrics.
+"""
+import threading
+
+WINDOW = 3
+STEP = 1.25
+# Throughput changes smaller than this are treated as noise
+TOLERANCE = 0.05
+
+
+def split_batch(batch):
+    """Halves of a list or DataFrame (empty halves dropped)."""
+    mid = len(batch) // 2
+    if hasattr(batch, "iloc"):
+        halves = [batch.iloc[:mid], batch.iloc[mid:]]
+    else:
+        halves = [batch[:mid], batch[mid:]]
+    return [half for half in halves if len(half)]
+
+
+class AdaptiveBatchSizer:
+    def __init__(self, name, initial, min_size, max_size, target_seconds,
+                 max_bytes=None, max_ops=None, adaptive=True):
+        self.name = name
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.max_ops = max_ops
+        self.adaptive = adaptive
+
+        self._size = float(min(max(initial, self.min_size), self.max_size))
+        self._direction = 1
+        self._last_rate = None
+        self._window_rows = 0
+        self._window_seconds = 0.0
+        self._window_batches = 0
+        self.bytes_per_row = None
+        self.lock = threading.Lock()
+
+        self.sizes = []
+        self.adjustments = 0
+        self.errors = 0
+
+    @property
+    def size(self):
+        """Rows for the next batch."""
+        with self.lock:
+            size = int(self._size)
+            if self.max_ops:
+                size = min(size, self.max_ops)
+            if self.max_bytes and self.bytes_per_row:
+                # Keep 10% headroom for per-operation overhead
+                size = min(size, int(self.max_bytes * 0.9 / self.bytes_per_row))
+            return max(1, min(size, self.max_size))
+
+    def _resize(self, factor):
+        new = min(max(self._size * factor, self.min_size), self.max_size)
+        if int(new) != int(self._size):
+            self.adjustments += 1
+        self._size = new
+
+    def observe(self, rows, seconds, nbytes=None):
+        """Feed back one completed batch."""
+        if rows <= 0:
+            return
+        with self.lock:
+            self.sizes.append(rows)
+            if nbytes:
+                per_row = nbytes / rows
+                self.bytes_per_row = per_row if self.bytes_per_row is None else \
+                    0.8 * self.bytes_per_row + 0.2 * per_row
+            if not self.adaptive:
+                return
+
+            seconds = max(seconds, 1e-6)
+            if seconds > self.target_seconds * 1.5:
+                # Latency bound: come back under target now, not a window later
+                self._resize(max(0.5, self.target_seconds / seconds))
+                self._direction = -1
+                self._last_rate = None
+                self._window_rows, self._window_seconds, self._window_batches = 0, 0.0, 0
+                return
+
+            self._window_rows += rows
+            self._window_seconds += seconds
+            self._window_batches += 1
+            if self._window_batches < WINDOW:
+                return
+
+            rate = self._window_rows / self._window_seconds
+            # Keep going only while it clearly pays off; on a plateau this oscillates around the best size
+            if self._last_rate is not None and rate < self._last_rate * (1 + TOLERANCE):
+                self._direction = -self._direction
+            if self._direction > 0 and self._window_seconds / self._window_batches > self.target_seconds:
+                self._direction = -1
+            self._last_rate = rate
+            self._window_rows, self._window_seconds, self._window_batches = 0, 0.0, 0
+            self._resize(STEP if self._direction > 0 else 1 / STEP)
+
+    def on_error(self):
+        """Back off after a failed batch."""
+        with self.lock:
+            self.errors += 1
+            if self.adaptive:
+                self._resize(0.5)
+                self._direction = -1
+                self._last_rate = None
+
+    def summary(self):
+        with self.lock:
+            sizes = list(self.sizes)
+            bytes_per_row = self.bytes_per_row
+        return {
+            "sizer": self.name,
+            "batch_size": self.size,
+            "batches": len(sizes),
+            "min_batch": min(sizes) if sizes else None,
+            "max_batch": max(sizes) if sizes else None,
+            "avg_batch": round(sum(sizes) / len(sizes), 1) if sizes else None,
+            "adjustments": self.adjustments,
+            "errors": self.errors,
+            "bytes_per_row": round(bytes_per_row, 1) if bytes_per_row else None,
+        }
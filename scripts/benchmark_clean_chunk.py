@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: legacy pandas clean_chunk vs the compiled Arrow CleaningPlan.
+
+Usage:
+    python scripts/benchmark_clean_chunk.py [path/to/file.parquet] [chunks]
+
+Without a file a synthetic NYC-taxi-like batch is generated. Each
+implementation gets its natural input: the legacy version a DataFrame slice
+(as produced by the old read_parquet + iloc loop), the plan an Arrow record
+batch (as produced by iter_parquet_chunks). Both produce the same output: the
+taxi_trips columns without null-pickup rows, plus trip_fingerprint.
+
+The legacy version allocates in numpy (counted in "Py peak MB"), the plan in
+Arrow buffers ("Arrow allocs"/"Arrow MB"), so compare "Total MB" across them.
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from etl_to_mysql import CHUNK_SIZE, clean_chunk
+from trip_dedup import FINGERPRINT_COLUMN, trip_fingerprints
+
+
+def legacy_clean_chunk(df):
+    """clean_chunk as it was before the cleaning plan (kept for comparison), plus the
+    null-pickup filter and fingerprint the plan adds, so both do the same work"""
+    column_mapping = {
+        "VendorID": "vendor_id",
+        "tpep_pickup_datetime": "pickup_datetime",
+        "tpep_dropoff_datetime": "dropoff_datetime",
+        "passenger_count": "passenger_count",
+        "trip_distance": "trip_distance",
+        "RatecodeID": "rate_code_id",
+        "store_and_fwd_flag": "store_and_fwd_flag",
+        "PULocationID": "pu_location_id",
+        "DOLocationID": "do_location_id",
+        "payment_type": "payment_type",
+        "fare_amount": "fare_amount",
+        "extra": "extra",
+        "mta_tax": "mta_tax",
+        "tip_amount": "tip_amount",
+        "tolls_amount": "tolls_amount",
+        "improvement_surcharge": "improvement_surcharge",
+        "total_amount": "total_amount",
+        "congestion_surcharge": "congestion_surcharge",
+        "Airport_fee": "airport_fee"
+    }
+
+    df = df.rename(columns=column_mapping)
+
+    required_cols = [
+        "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
+        "trip_distance", "rate_code_id", "store_and_fwd_flag", "pu_location_id",
+        "do_location_id", "payment_type", "fare_amount", "extra", "mta_tax",
+        "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount",
+        "congestion_surcharge", "airport_fee"
+    ]
+
+    available_cols = [col for col in required_cols if col in df.columns]
+    df = df[available_cols]
+
+    for col in required_cols:
+        if col not in df.columns:
+            if col == "store_and_fwd_flag":
+                df[col] = "N"
+            elif col == "vendor_id":
+                df[col] = "1"
+            else:
+                df[col] = 0
+
+    df = df[required_cols]
+    df = df[df["pickup_datetime"].notna()]
+    df = df.fillna(0)
+    df["vendor_id"] = df["vendor_id"].astype(str)
+    df[FINGERPRINT_COLUMN] = trip_fingerprints(df)
+
+    return df
+
+
+def synthetic_batch(n=CHUNK_SIZE, seed=42):
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 31 * 86400, n), unit="s")
+    nullable = lambda values: np.where(rng.random(n) < 0.03, np.nan, values)
+    df = pd.DataFrame({
+        "VendorID": rng.integers(1, 3, n),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": pickup + pd.to_timedelta(rng.integers(60, 3600, n), unit="s"),
+        "passenger_count": nullable(rng.integers(1, 5, n).astype(float)),
+        "trip_distance": rng.random(n) * 12,
+        "RatecodeID": nullable(np.ones(n)),
+        "store_and_fwd_flag": np.where(rng.random(n) < 0.03, None, "N"),
+        "PULocationID": rng.integers(1, 266, n),
+        "DOLocationID": rng.integers(1, 266, n),
+        "payment_type": rng.integers(1, 5, n),
+        "fare_amount": np.round(rng.random(n) * 60, 2),
+        "extra": 1.0,
+        "mta_tax": 0.5,
+        "tip_amount": np.round(rng.random(n) * 10, 2),
+        "tolls_amount": 0.0,
+        "improvement_surcharge": 1.0,
+        "total_amount": np.round(rng.random(n) * 80, 2),
+        "congestion_surcharge": nullable(np.full(n, 2.5)),
+        "Airport_fee": nullable(np.zeros(n)),
+    })
+    return pa.RecordBatch.from_pandas(df, preserve_index=False)
+
+
+def load_batch(path):
+    return next(pq.ParquetFile(path).iter_batches(batch_size=CHUNK_SIZE))
+
+
+def measure(name, func, chunk, repeats):
+    func(chunk)  # warm up (compiles the plan, imports, caches)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(chunk)
+    elapsed = time.perf_counter() - start
+
+    # Allocations for one chunk: numpy/Python heap peak via tracemalloc, Arrow
+    # buffers through a proxy pool that counts allocations and peak bytes
+    default_pool = pa.default_memory_pool()
+    arrow_pool = pa.proxy_memory_pool(default_pool)
+    pa.set_memory_pool(arrow_pool)
+    tracemalloc.start()
+    try:
+        out = func(chunk)
+        _, py_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(default_pool)
+
+    rows = chunk.num_rows if hasattr(chunk, "num_rows") else len(chunk)
+    print(f"{name:<10} {rows * repeats / elapsed:>12,.0f} {elapsed / repeats * 1000:>10.2f} "
+          f"{py_peak / 1024 ** 2:>12.1f} {arrow_pool.num_allocations():>12,} "
+          f"{arrow_pool.max_memory() / 1024 ** 2:>12.1f} "
+          f"{(py_peak + arrow_pool.max_memory()) / 1024 ** 2:>10.1f}")
+    del out
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    batch = load_batch(path) if path else synthetic_batch()
+    frame = batch.to_pandas()
+
+    print("=" * 91)
+    print(f"clean_chunk microbenchmark: {batch.num_rows} rows/chunk, {repeats} chunks "
+          f"({'file ' + path if path else 'synthetic data'})")
+    print("=" * 91)
+    print(f"{'Version':<10} {'Rows/sec':>12} {'ms/chunk':>10} {'Py peak MB':>12} "
+          f"{'Arrow allocs':>12} {'Arrow MB':>12} {'Total MB':>10}")
+    print("-" * 91)
+    measure("legacy", legacy_clean_chunk, frame, repeats)
+    measure("plan", clean_chunk, batch, repeats)
+    print("=" * 91)
+    legacy, plan = legacy_clean_chunk(frame), clean_chunk(batch)
+    same = list(legacy.columns) == list(plan.columns) and len(legacy) == len(plan) \
+        and (legacy[FINGERPRINT_COLUMN].to_numpy() == plan[FINGERPRINT_COLUMN].to_numpy()).all()
+    print(f"Same output columns, rows and fingerprints: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
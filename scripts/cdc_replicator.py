@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Change-data-capture replicator: MySQL taxi_trips → MongoDB taxi_trips.
+
+Tails the MySQL row-based binlog as a replica (python-mysql-replication) and
+applies every insert, update and delete on taxi_trips to MongoDB, so changes
+show up within seconds instead of at the next sync_mysql_to_mongo.py run.
+That includes deletes and rows changed without touching updated_at.
+
+- Changes are buffered per trip_id (the latest change wins) and written as one
+  unordered bulk_write when CDC_BATCH_SIZE changes are pending or the oldest has
+  waited CDC_FLUSH_SECONDS. Inserts and updates are upserts, so replaying a
+  stretch of binlog after a crash is harmless.
+- The binlog position is checkpointed in the cdc_checkpoint table, only at
+  transaction commits and only after the changes before it were written.
+- The hourly buckets (trip_buckets.py) are moved by the same changes, from
+  the stored version of each trip read just before the write.
+- Replication lag (now - binlog timestamp of the last applied change) and the
+  apply counters are recorded as the cdc_apply metric every CDC_METRICS_SECONDS.
+
+Usage:
+    python scripts/cdc_replicator.py          # run until stopped (Ctrl+C / SIGTERM)
+    python scripts/cdc_replicator.py init     # checkpoint the current binlog position and exit
+    python scripts/cdc_replicator.py once     # apply everything up to the current position and exit
+
+Run init before the first full sync so nothing written during the sync is
+missed. Without a checkpoint the replicator starts at the current position.
+
+The server needs binlog_format=ROW, binlog_row_image=FULL and
+binlog_row_metadata=FULL, and the MySQL user needs REPLICATION SLAVE and
+REPLICATION CLIENT (run_mysql_migrations.py grants both to the app user).
+For a local container:
+
+    docker run -d --name taxi-mysql -p 3306:3306 -e MYSQL_ROOT_PASSWORD=root \\
+        -e MYSQL_DATABASE=nyc_taxi mysql:8.0 \\
+        --binlog-format=ROW --binlog-row-image=FULL --binlog-row-metadata=FULL
+"""
+import os
+import sys
+import time
+import signal
+import threading
+from datetime import datetime
+import pymysql
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from pymongo.errors import PyMongoError
+from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import XidEvent, QueryEvent, HeartbeatLogEvent
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+from sync_mysql_to_mongo import to_document
+from trip_buckets import SYNC_BUCKETS, BucketWriter
+
+load_dotenv()
+
+MYSQL_HOST = os.getenv("MYSQL_HOST")
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
+MYSQL_USER = os.getenv("MYSQL_APP_USER")
+MYSQL_PASSWORD = os.getenv("MYSQL_APP_PASSWORD")
+MYSQL_DB = os.getenv("MYSQL_DB_NAME")
+
+MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
+
+CDC_NAME = "taxi_trips"
+TABLE = "taxi_trips"
+# Replica server id; must differ from the server's and from any other replica
+CDC_SERVER_ID = int(os.getenv("CDC_SERVER_ID", "4201"))
+# Flush pending changes at this many trips or when the oldest has waited this long
+CDC_BATCH_SIZE = int(os.getenv("CDC_BATCH_SIZE", "1000"))
+CDC_FLUSH_SECONDS = float(os.getenv("CDC_FLUSH_SECONDS", "0.5"))
+# The server sends a heartbeat when idle, so time based flushes happen without new events
+CDC_HEARTBEAT_SECONDS = float(os.getenv("CDC_HEARTBEAT_SECONDS", "1"))
+CDC_METRICS_SECONDS = float(os.getenv("CDC_METRICS_SECONDS", "60"))
+# Save the position at least this often while only other tables are changing
+CHECKPOINT_SECONDS = 5
+MAX_APPLY_ATTEMPTS = 5
+
+REQUIRED_SETTINGS = {"log_bin": "1", "binlog_format": "ROW", "binlog_row_image": "FULL",
+                     "binlog_row_metadata": "FULL"}
+
+
+def get_mysql_conn():
+    return pymysql.connect(
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        database=MYSQL_DB,
+        autocommit=True,
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+# -----------------------------
+# Binlog Position & Checkpoint
+# -----------------------------
+def binlog_status(conn):
+    """Current (log_file, log_pos) of the server."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SHOW BINARY LOG STATUS")  # MySQL 8.2+
+        except pymysql.err.ProgrammingError:
+            cur.execute("SHOW MASTER STATUS")
+        status = cur.fetchone()
+    if not status:
+        raise RuntimeError("Binary logging is disabled on the MySQL server")
+    return status["File"], status["Position"]
+
+
+def check_binlog_settings(conn):
+    """Settings that prevent row based replication, as a list of messages."""
+    problems = []
+    with conn.cursor() as cur:
+        for name, expected in REQUIRED_SETTINGS.items():
+            try:
+                cur.execute(f"SELECT @@{name} AS value")
+                value = str(cur.fetchone()["value"]).upper()
+            except pymysql.err.OperationalError:
+                value = "unsupported"
+            if value != expected:
+                problems.append(f"{name} is {value}, expected {expected}")
+    return problems
+
+
+def load_checkpoint(conn, name=CDC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT log_file, log_pos, events_applied, last_event_at
+               FROM cdc_checkpoint WHERE replicator_name = %s""",
+            (name,)
+        )
+        return cur.fetchone()
+
+
+def save_checkpoint(conn, checkpoint, name=CDC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO cdc_checkpoint (replicator_name, log_file, log_pos, events_applied, last_event_at)
+               VALUES (%s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE log_file = VALUES(log_file), log_pos = VALUES(log_pos),
+                   events_applied = VALUES(events_applied), last_event_at = VALUES(last_event_at)""",
+            (name, checkpoint["log_file"], checkpoint["log_pos"], checkpoint["events_applied"],
+             checkpoint["last_event_at"])
+        )
+
+
+# -----------------------------
+# Change Buffer
+# -----------------------------
+class ChangeBuffer:
+    """Pending MongoDB writes keyed by trip_id; a later change to a trip replaces the earlier one."""
+
+    def __init__(self):
+        self.ops = {}
+        # New document per trip_id, None for a delete
+        self.docs = {}
+        self.first_at = None
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.ops)
+
+    def _add(self, trip_id, op, doc):
+        if not self.ops:
+            self.first_at = time.monotonic()
+        self.ops[trip_id] = op
+        self.docs[trip_id] = doc
+        self.changes += 1
+
+    def upsert(self, row, applied_at):
+        doc = to_document(row, applied_at)
+        self._add(doc["trip_id"], UpdateOne({"trip_id": doc["trip_id"]}, {"$set": doc}, upsert=True), doc)
+
+    def delete(self, row):
+        self._add(row["trip_id"], DeleteOne({"trip_id": row["trip_id"]}), None)
+
+    def due(self):
+        return len(self.ops) >= CDC_BATCH_SIZE or \
+            (self.ops and time.monotonic() - self.first_at >= CDC_FLUSH_SECONDS)
+
+    def take(self):
+        ops, docs, changes = list(self.ops.values()), self.docs, self.changes
+        self.ops, self.docs, self.first_at, self.changes = {}, {}, None, 0
+        return ops, docs, changes
+
+
+def empty_stats():
+    return {"inserts": 0, "updates": 0, "deletes": 0, "coalesced": 0, "flushes": 0,
+            "docs_written": 0, "apply_seconds": 0.0, "max_lag_seconds": 0.0, "errors": 0, "ddl_events": 0}
+
+
+# -----------------------------
+# Replicator
+# -----------------------------
+class Replicator:
+    def __init__(self, conn, col, checkpoint, buckets=None):
+        self.conn = conn
+        self.col = col
+        self.buckets = buckets
+        self.checkpoint = dict(checkpoint)
+        self.committed = (checkpoint["log_file"], checkpoint["log_pos"])
+        self.buffer = ChangeBuffer()
+        self.stats = empty_stats()
+        self.totals = empty_stats()
+        self.last_event_ts = None
+        self.lag_seconds = 0.0
+        self.last_save = time.monotonic()
+
+    def handle(self, event, stream):
+        if isinstance(event, XidEvent):
+            # Everything up to here is a committed transaction; safe to resume after it
+            self.committed = (stream.log_file, stream.log_pos)
+            return
+        if isinstance(event, HeartbeatLogEvent):
+            if not self.buffer:
+                self.lag_seconds = 0.0
+            return
+        if isinstance(event, QueryEvent):
+            self._check_ddl(event)
+            return
+
+        applied_at = datetime.now()
+        self.last_event_ts = event.timestamp
+        for row in event.rows:
+            if isinstance(event, WriteRowsEvent):
+                self.buffer.upsert(row["values"], applied_at)
+                self.stats["inserts"] += 1
+            elif isinstance(event, UpdateRowsEvent):
+                self.buffer.upsert(row["after_values"], applied_at)
+                self.stats["updates"] += 1
+            elif isinstance(event, DeleteRowsEvent):
+                self.buffer.delete(row["values"])
+                self.stats["deletes"] += 1
+
+    def _check_ddl(self, event):
+        query = event.query.strip()
+        schema = event.schema.decode() if isinstance(event.schema, bytes) else event.schema
+        if schema != MYSQL_DB or TABLE not in query or query.upper() == "BEGIN":
+            return
+        # Partition drops, TRUNCATE and staging swaps change rows without row events
+        self.stats["ddl_events"] += 1
+        print(f"⚠️  DDL on {TABLE} is not replicated, run a full sync: {query[:120]}")
+
+    def flush(self, force=False):
+        """Write pending changes to MongoDB once due, then checkpoint the last committed position."""
+        if self.buffer and (force or self.buffer.due()):
+            ops, docs, changes = self.buffer.take()
+            t0 = time.time()
+            marker = self.buckets.mark(list(docs)) if self.buckets else None
+            previous = self.buckets.previous(self.col, list(docs)) if self.buckets else None
+            for attempt in range(1, MAX_APPLY_ATTEMPTS + 1):
+                try:
+                    self.col.bulk_write(ops, ordered=False)
+                    break
+                except PyMongoError as e:
+                    self.stats["errors"] += 1
+                    if attempt == MAX_APPLY_ATTEMPTS:
+                        raise
+                    print(f"❌ Apply failed ({e}); retrying in {2 ** attempt}s")
+                    time.sleep(2 ** attempt)
+            if self.buckets:
+                self.buckets.apply([doc for doc in docs.values() if doc],
+                                   previous, deleted_ids=[trip_id for trip_id, doc in docs.items() if doc is None],
+                                   markers=[marker])
+            self.stats["flushes"] += 1
+            self.stats["docs_written"] += len(ops)
+            self.stats["coalesced"] += changes - len(ops)
+            self.stats["apply_seconds"] += time.time() - t0
+            self.checkpoint["events_applied"] += changes
+            self.checkpoint["last_event_at"] = datetime.fromtimestamp(self.last_event_ts)
+            self.lag_seconds = max(0.0, time.time() - self.last_event_ts)
+            self.stats["max_lag_seconds"] = max(self.stats["max_lag_seconds"], self.lag_seconds)
+        elif self.buffer or (not force and time.monotonic() - self.last_save < CHECKPOINT_SECONDS):
+            return
+        self._save()
+
+    def _save(self):
+        if self.committed == (self.checkpoint["log_file"], self.checkpoint["log_pos"]):
+            self.last_save = time.monotonic()
+            return
+        self.checkpoint["log_file"], self.checkpoint["log_pos"] = self.committed
+        save_checkpoint(self.conn, self.checkpoint)
+        self.last_save = time.monotonic()
+
+    def report(self, interval_start, operation="cdc_apply"):
+        """Record the counters since interval_start and fold them into the run totals."""
+        stats = self.stats
+        elapsed = max(time.time() - interval_start, 1e-6)
+        changes = stats["inserts"] + stats["updates"] + stats["deletes"]
+        details = {**stats, "changes": changes, "changes_per_sec": round(changes / elapsed, 1),
+                   "lag_seconds": round(self.lag_seconds, 1),
+                   "apply_seconds": round(stats["apply_seconds"], 3),
+                   "max_lag_seconds": round(stats["max_lag_seconds"], 1),
+                   "log_file": self.checkpoint["log_file"], "log_pos": self.checkpoint["log_pos"]}
+        print(f"🔁 {changes} changes ({stats['inserts']} ins / {stats['updates']} upd / {stats['deletes']} del) "
+              f"in {elapsed:.0f}s | lag {self.lag_seconds:.1f}s | "
+              f"at {self.checkpoint['log_file']}:{self.checkpoint['log_pos']}")
+        record_db_metrics("mongodb", operation, interval_start, error_count=stats["errors"], details=details)
+
+        for key, value in stats.items():
+            if key == "max_lag_seconds":
+                self.totals[key] = max(self.totals[key], value)
+            else:
+                self.totals[key] += value
+        self.stats = empty_stats()
+
+
+def open_stream(checkpoint):
+    return BinLogStreamReader(
+        connection_settings={"host": MYSQL_HOST, "port": MYSQL_PORT, "user": MYSQL_USER,
+                             "passwd": MYSQL_PASSWORD},
+        server_id=CDC_SERVER_ID,
+        log_file=checkpoint["log_file"],
+        log_pos=checkpoint["log_pos"],
+        resume_stream=True,
+        blocking=True,
+        slave_heartbeat=CDC_HEARTBEAT_SECONDS,
+        only_schemas=[MYSQL_DB],
+        only_tables=[TABLE],
+        only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent, QueryEvent, HeartbeatLogEvent],
+    )
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if mode not in ("run", "init", "once"):
+        raise SystemExit(f"Unknown mode '{mode}', expected run, init or once")
+
+    start_time = time.time()
+    print("=" * 60)
+    print(f"🔁 MySQL binlog → MongoDB CDC replicator ({mode})")
+    print("=" * 60)
+
+    conn = get_mysql_conn()
+    problems = check_binlog_settings(conn)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        conn.close()
+        raise SystemExit(1)
+
+    checkpoint = load_checkpoint(conn)
+    if checkpoint is None or mode == "init":
+        log_file, log_pos = binlog_status(conn)
+        checkpoint = {"log_file": log_file, "log_pos": log_pos, "events_applied": 0, "last_event_at": None}
+        save_checkpoint(conn, checkpoint)
+        print(f"📍 Checkpoint set to {log_file}:{log_pos}")
+        if mode == "init":
+            conn.close()
+            return
+    else:
+        print(f"📍 Resuming from {checkpoint['log_file']}:{checkpoint['log_pos']}")
+
+    # (file, pos) tuples order correctly: binlog file names end in a zero-padded sequence number
+    stop_at = binlog_status(conn) if mode == "once" else None
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+    mongo = MongoClient(MONGO_URI, serverSelectionTimeoutMS=60000, socketTimeoutMS=120000)
+    db = mongo[MONGO_DB]
+    replicator = Replicator(conn, db["taxi_trips"], checkpoint, BucketWriter(db) if SYNC_BUCKETS else None)
+    stream = open_stream(checkpoint)
+    interval_start = time.time()
+    error_count = 0
+
+    try:
+        for event in stream:
+            replicator.handle(event, stream)
+            replicator.flush()
+            if time.time() - interval_start >= CDC_METRICS_SECONDS:
+                replicator.report(interval_start)
+                interval_start = time.time()
+            if stop.is_set():
+                break
+            # The stream's own position also passes events that never end in an Xid
+            # (DDL, rotates, other tables), which would otherwise keep once waiting
+            if stop_at and not replicator.buffer and \
+                    max(replicator.committed, (stream.log_file, stream.log_pos)) >= stop_at:
+                # stop_at is a transaction boundary, so it is safe to resume from
+                replicator.committed = max(replicator.committed, stop_at)
+                print("✅ Caught up with the binlog position at start")
+                break
+    except KeyboardInterrupt:
+        print("Stopping...")
+    except Exception as e:
+        error_count += 1
+        print(f"❌ Replication failed: {e}")
+    finally:
+        stream.close()
+        if not error_count:
+            replicator.flush(force=True)
+        replicator.report(interval_start)
+        totals = replicator.totals
+        record_db_metrics("mongodb", "cdc_complete", start_time, error_count=error_count + totals["errors"],
+                          details={**totals, "apply_seconds": round(totals["apply_seconds"], 3),
+                                   "events_applied": replicator.checkpoint["events_applied"],
+                                   "buckets": replicator.buckets.summary() if replicator.buckets else None,
+                                   "log_file": replicator.checkpoint["log_file"],
+                                   "log_pos": replicator.checkpoint["log_pos"]})
+        if replicator.buckets:
+            replicator.buckets.close()
+        conn.close()
+        mongo.close()
+
+    if error_count:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Manifest resolution and a content-addressed download cache for the ETL source files.
+
+Files are stored once under data/cache/objects/<sha256>.<ext>. An index maps
+each URL to its object plus the validators the server sent (ETag, size,
+Last-Modified). A later run sends a HEAD request and reuses the cached object
+while the validators still match, so backfills do not download a month twice.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATASET_URL = os.getenv("DATASET_URL", "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_2023-01.parquet")
+# Either a file with one URL per line or a comma separated list of URLs
+DATASET_MANIFEST = os.getenv("DATASET_MANIFEST")
+# Month range such as 2023-01:2023-12, expanded with DATASET_URL_TEMPLATE
+DATASET_MONTHS = os.getenv("DATASET_MONTHS")
+DATASET_URL_TEMPLATE = os.getenv(
+    "DATASET_URL_TEMPLATE",
+    "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{month}.parquet"
+)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "3"))
+
+CACHE_DIR = os.path.join("data", "cache")
+OBJECTS_DIR = os.path.join(CACHE_DIR, "objects")
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+
+# 1 MB network reads into an 8 MB write buffer instead of 8 KB writes
+READ_CHUNK = 1024 * 1024
+WRITE_BUFFER = 8 * 1024 * 1024
+
+_index_lock = threading.Lock()
+
+
+# -----------------------------
+#  Manifest
+# -----------------------------
+def expand_months(spec, template=None):
+    """'2023-01:2023-03' -> URLs for 2023-01, 2023-02 and 2023-03 (a single month works too)"""
+    template = template or DATASET_URL_TEMPLATE
+    first, _, last = spec.partition(":")
+    last = last or first
+    year, month = map(int, first.split("-"))
+    end_year, end_month = map(int, last.split("-"))
+
+    urls = []
+    while (year, month) <= (end_year, end_month):
+        urls.append(template.format(month=f"{year:04d}-{month:02d}"))
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return urls
+
+
+def resolve_manifest():
+    """List of source URLs for this run: DATASET_MANIFEST, else DATASET_MONTHS, else DATASET_URL."""
+    if DATASET_MANIFEST:
+        if os.path.exists(DATASET_MANIFEST):
+            with open(DATASET_MANIFEST, "r", encoding="utf-8") as f:
+                entries = [line.strip() for line in f]
+        else:
+            entries = [entry.strip() for entry in DATASET_MANIFEST.split(",")]
+        return [e for e in entries if e and not e.startswith("#")]
+    if DATASET_MONTHS:
+        return expand_months(DATASET_MONTHS)
+    return [DATASET_URL]
+
+
+# -----------------------------
+#  Cache Index
+# -----------------------------
+def _load_index():
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _update_index(url, entry):
+    with _index_lock:
+        index = _load_index()
+        index[url] = entry
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, INDEX_PATH)
+
+
+def _validators(headers):
+    size = headers.get("Content-Length")
+    return {
+        "etag": headers.get("ETag"),
+        "size": int(size) if size is not None else None,
+        "last_modified": headers.get("Last-Modified"),
+    }
+
+
+def _cached_path(url, remote):
+    """Path of a still valid cached copy of url, or None."""
+    with _index_lock:
+        entry = _load_index().get(url)
+    if not entry or not os.path.exists(entry["path"]):
+        return None
+    if os.path.getsize(entry["path"]) != entry["size"]:
+        return None
+    if remote is None:
+        # Server unreachable: trust the cached copy
+        return entry["path"]
+    for key in ("etag", "size", "last_modified"):
+        if remote.get(key) is not None and remote[key] != entry.get(key):
+            return None
+    return entry["path"]
+
+
+# -----------------------------
+#  Fetch
+# -----------------------------
+def fetch(url):
+    """Return a local path for url, downloading only when the cache is stale."""
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+
+    try:
+        head = requests.head(url, allow_redirects=True, timeout=30)
+        head.raise_for_status()
+        remote = _validators(head.headers)
+    except requests.RequestException as e:
+        print(f"  HEAD {url} failed ({e}); using the cached copy if there is one")
+        remote = None
+
+    path = _cached_path(url, remote)
+    if path:
+        print(f"Cache hit: {url} -> {path}")
+        return path
+
+    print(f"Downloading {url}...")
+    ext = os.path.splitext(url.split("?")[0])[1] or ".bin"
+    digest = hashlib.sha256()
+    size = 0
+
+    with requests.get(url, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=ext + ".part")
+        try:
+            with os.fdopen(fd, "wb", buffering=WRITE_BUFFER) as f:
+                for block in r.iter_content(chunk_size=READ_CHUNK):
+                    f.write(block)
+                    digest.update(block)
+                    size += len(block)
+            expected = _validators(r.headers)["size"]
+            if expected is not None and "Content-Encoding" not in r.headers and size != expected:
+                raise IOError(f"Incomplete download of {url}: {size} of {expected} bytes")
+
+            path = os.path.join(OBJECTS_DIR, digest.hexdigest() + ext)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        validators = _validators(r.headers)
+
+    validators["size"] = size
+    _update_index(url, {"path": path, "sha256": digest.hexdigest(), **validators})
+    print(f"Download complete: {url} ({size / 1024 ** 2:.1f} MB)")
+    return path
+
+
+def fetch_all(urls, workers=None):
+    """Start fetching every URL concurrently; yield (url, path) in manifest order.
+
+    Later files keep downloading while the caller loads the earlier ones.
+    """
+    workers = workers or DOWNLOAD_WORKERS
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="fetch") as pool:
+        futures = [(url, pool.submit(fetch, url)) for url in urls]
+        try:
+            for url, fut in futures:
+                yield url, fut.result()
+        finally:
+            for _, fut in futures:
+                fut.cancel()
@@ -1,11 +1,25 @@
 import os
+import re
+import csv
+import queue
+import tempfile
+import threading
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import pymysql
 import time
-import requests
-from datetime import datetime
+from datetime import datetime, date
 from dotenv import load_dotenv
-from monitoring_utils import record_db_metrics
+from monitoring_utils import record_db_metrics, get_peak_rss_mb
+from dataset_cache import fetch, fetch_all, resolve_manifest
+from manage_partitions import ensure_partitions, add_months, PARTITION_MONTHS_AHEAD
+from batch_sizer import AdaptiveBatchSizer, split_batch
+from trip_dedup import ETL_DEDUP, BLOOM_DIR, FINGERPRINT_COLUMN, Deduplicator, trip_fingerprints, remove_filter
 
 load_dotenv()
 
@@ -14,9 +28,42 @@ MYSQL_USER = os.getenv("MYSQL_APP_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_APP_PASSWORD")
 MYSQL_DB = os.getenv("MYSQL_DB_NAME")
 DATASET_URL = os.getenv("DATASET_URL", "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_2023-01.parquet")
+# Multi-month runs: DATASET_MANIFEST / DATASET_MONTHS, see dataset_cache.py
 
-# 🚀 Increased chunk size for faster inserts
-CHUNK_SIZE = 20000
+# Starting chunk size. With ETL_ADAPTIVE_CHUNKS the size then follows the observed
+# insert rate and latency between ETL_CHUNK_MIN and ETL_CHUNK_MAX (see batch_sizer.py).
+CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", "20000"))
+ETL_ADAPTIVE_CHUNKS = os.getenv("ETL_ADAPTIVE_CHUNKS", "1") == "1"
+ETL_CHUNK_MIN = int(os.getenv("ETL_CHUNK_MIN", "2000"))
+ETL_CHUNK_MAX = int(os.getenv("ETL_CHUNK_MAX", "200000"))
+# Chunks slower than this to insert are made smaller
+ETL_TARGET_CHUNK_SECONDS = float(os.getenv("ETL_TARGET_CHUNK_SECONDS", "2.0"))
+# Source files are decoded in pieces of READ_BATCH rows and regrouped into chunks
+READ_BATCH = 5000
+
+CHUNK_SIZER = AdaptiveBatchSizer("etl_chunk", CHUNK_SIZE, ETL_CHUNK_MIN, ETL_CHUNK_MAX,
+                                 ETL_TARGET_CHUNK_SECONDS, adaptive=ETL_ADAPTIVE_CHUNKS)
+
+# Number of cleaned chunks read ahead while the previous one is being inserted.
+# Memory stays bounded to roughly (PREFETCH_DEPTH + 2) chunks.
+PREFETCH_DEPTH = int(os.getenv("ETL_PREFETCH_DEPTH", "2"))
+
+# Load engine: "executemany" (multi-row INSERT) or "load_data" (LOAD DATA LOCAL INFILE)
+ETL_ENGINE = os.getenv("ETL_ENGINE", "executemany")
+# Where load_data writes its per-chunk TSV files (point at /dev/shm to keep them in RAM)
+ETL_TMP_DIR = os.getenv("ETL_TMP_DIR") or tempfile.gettempdir()
+
+# Parallel mode (ETL_WORKERS > 1): one producer reads, a process pool cleans and
+# ETL_WORKERS writer connections drain a queue of at most ETL_QUEUE_DEPTH chunks.
+ETL_WORKERS = int(os.getenv("ETL_WORKERS", "1"))
+ETL_CLEAN_WORKERS = int(os.getenv("ETL_CLEAN_WORKERS", str(os.cpu_count() or 1)))
+ETL_QUEUE_DEPTH = int(os.getenv("ETL_QUEUE_DEPTH", "4"))
+
+# "append" inserts into taxi_trips directly. "staging" loads every file into an
+# index-free copy, builds the secondary indexes once and swaps it in with RENAME
+# TABLE. The loaded files replace the live table's rows of their months; every
+# other month is copied into the staging table first and survives the swap.
+ETL_MODE = os.getenv("ETL_MODE", "append")
 
 
 # -----------------------------
@@ -28,176 +75,1033 @@ def get_mysql_conn():
         user=MYSQL_USER,
         password=MYSQL_PASSWORD,
         database=MYSQL_DB,
-        autocommit=True
+        autocommit=True,
+        # Only the load_data engine reads local files
+        local_infile=ETL_ENGINE == "load_data"
     )
 
 
 # -----------------------------
 #  Download Data
 # -----------------------------
-def download_data():
-    print(f"Downloading dataset from {DATASET_URL}...")
-    os.makedirs("data", exist_ok=True)
+def download_data(url=None):
+    """Local path of the dataset, served from the data/cache download cache when still valid"""
+    return fetch(url or DATASET_URL)
 
-    if DATASET_URL.endswith('.parquet'):
-        file_path = "data/taxi_data.parquet"
-    else:
-        file_path = "data/taxi_data.csv"
 
-    r = requests.get(DATASET_URL, stream=True)
-    r.raise_for_status()
+# -----------------------------
+#  Streaming Readers
+# -----------------------------
+def iter_parquet_chunks(file_path, chunk_size=CHUNK_SIZE, skip_ranges=None):
+    """Yield (row_offset, batch) for the parquet file, batches of at most chunk_size rows.
+
+    Record batches are decoded one at a time, so only the current batch is
+    materialised instead of the whole monthly file. Row groups that lie
+    entirely inside skip_ranges (already committed) are not decoded at all.
+    """
+    pf = pq.ParquetFile(file_path)
+    if not skip_ranges:
+        offset = 0
+        for batch in pf.iter_batches(batch_size=chunk_size):
+            yield offset, batch
+            offset += batch.num_rows
+        return
+
+    offset = 0
+    for group in range(pf.num_row_groups):
+        group_rows = pf.metadata.row_group(group).num_rows
+        if not uncovered_ranges(offset, group_rows, skip_ranges):
+            offset += group_rows
+            continue
+        for batch in pf.iter_batches(batch_size=chunk_size, row_groups=[group]):
+            yield offset, batch
+            offset += batch.num_rows
+
+
+def iter_csv_chunks(file_path, chunk_size=CHUNK_SIZE, skip_ranges=None):
+    # CSV cannot seek by row; committed rows are read and dropped by skip_committed
+    offset = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def uncovered_ranges(offset, rows, committed):
+    """Parts of [offset, offset + rows) not inside the sorted, merged committed ranges."""
+    gaps = []
+    pos, end = offset, offset + rows
+    for start, stop in committed:
+        if stop <= pos:
+            continue
+        if start >= end:
+            break
+        if start > pos:
+            gaps.append((pos, start))
+        pos = max(pos, stop)
+        if pos >= end:
+            break
+    if pos < end:
+        gaps.append((pos, end))
+    return gaps
+
+
+def skip_committed(chunks, committed):
+    """Drop rows already recorded in the ledger, slicing partially committed chunks.
+
+    Chunk boundaries may differ from the failed run (other chunk size, row
+    group skipping), so coverage is checked by row range, not chunk number.
+    """
+    skipped = 0
+    for offset, chunk in chunks:
+        rows = len(chunk)
+        gaps = uncovered_ranges(offset, rows, committed) if committed else [(offset, offset + rows)]
+        for start, stop in gaps:
+            if (start, stop) == (offset, offset + rows):
+                yield offset, chunk
+            elif isinstance(chunk, pd.DataFrame):
+                yield start, chunk.iloc[start - offset:stop - offset]
+            else:
+                yield start, chunk.slice(start - offset, stop - start)
+        skipped += rows - sum(stop - start for start, stop in gaps)
+    if skipped:
+        print(f"Dropped {skipped} already committed rows from partially loaded chunks")
+
+
+def _slice(piece, start, length):
+    if isinstance(piece, pd.DataFrame):
+        return piece.iloc[start:start + length]
+    return piece.slice(start, length)
+
+
+def _concat(pieces):
+    if len(pieces) == 1:
+        return pieces[0]
+    if isinstance(pieces[0], pd.DataFrame):
+        return pd.concat(pieces, ignore_index=True)
+    return pa.Table.from_batches(pieces)
+
+
+def rechunk(pieces, sizer=None):
+    """Regroup contiguous (offset, piece) pairs into chunks of sizer.size rows.
+
+    The size is read when each chunk starts, so chunk sizes follow the
+    controller while the file is being read. Gaps in the offsets (committed
+    ranges skipped on resume) always end a chunk.
+    """
+    sizer = sizer or CHUNK_SIZER
+    buf, buf_offset, buf_rows, target = [], 0, 0, 0
+    for offset, piece in pieces:
+        if buf and offset != buf_offset + buf_rows:
+            yield buf_offset, _concat(buf)
+            buf = []
+        if not buf:
+            buf_offset, buf_rows, target = offset, 0, sizer.size
+
+        while len(piece):
+            take = min(target - buf_rows, len(piece))
+            if take == len(piece):
+                buf.append(piece)
+                piece = piece[:0]
+            else:
+                buf.append(_slice(piece, 0, take))
+                piece = _slice(piece, take, len(piece) - take)
+            buf_rows += take
+            if buf_rows >= target:
+                yield buf_offset, _concat(buf)
+                buf, buf_offset, buf_rows, target = [], buf_offset + buf_rows, 0, sizer.size
+    if buf:
+        yield buf_offset, _concat(buf)
+
+
+_END = object()
+
+
+def put_until(q, item, stop):
+    """Put into a bounded queue, giving up (returns False) once stop is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
 
-    with open(file_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=8192):
-            f.write(chunk)
 
-    print("Download complete.")
-    return file_path
+def prefetch(chunks, depth=PREFETCH_DEPTH):
+    """Run the chunks generator in a background thread, `depth` items ahead.
+
+    Reading and cleaning the next chunk overlaps with inserting the current
+    one. Errors raised by the generator are re-raised in the caller.
+    """
+    q = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item):
+        return put_until(q, item, stop)
+
+    def worker():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(e)
+
+    t = threading.Thread(target=worker, name="etl-prefetch", daemon=True)
+    t.start()
+
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Unblock the reader if the consumer stopped early (e.g. insert failed)
+        stop.set()
+        t.join(timeout=5)
 
 
 # -----------------------------
 #  Data Cleaning
 # -----------------------------
-def clean_chunk(df):
-    column_mapping = {
-        "VendorID": "vendor_id",
-        "tpep_pickup_datetime": "pickup_datetime",
-        "tpep_dropoff_datetime": "dropoff_datetime",
-        "passenger_count": "passenger_count",
-        "trip_distance": "trip_distance",
-        "RatecodeID": "rate_code_id",
-        "store_and_fwd_flag": "store_and_fwd_flag",
-        "PULocationID": "pu_location_id",
-        "DOLocationID": "do_location_id",
-        "payment_type": "payment_type",
-        "fare_amount": "fare_amount",
-        "extra": "extra",
-        "mta_tax": "mta_tax",
-        "tip_amount": "tip_amount",
-        "tolls_amount": "tolls_amount",
-        "improvement_surcharge": "improvement_surcharge",
-        "total_amount": "total_amount",
-        "congestion_surcharge": "congestion_surcharge",
-        "Airport_fee": "airport_fee"
-    }
-
-    df = df.rename(columns=column_mapping)
-
-    required_cols = [
-        "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
-        "trip_distance", "rate_code_id", "store_and_fwd_flag", "pu_location_id",
-        "do_location_id", "payment_type", "fare_amount", "extra", "mta_tax",
-        "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount",
-        "congestion_surcharge", "airport_fee"
-    ]
+TAXI_TRIP_COLUMNS = [
+    "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
+    "trip_distance", "rate_code_id", "store_and_fwd_flag", "pu_location_id",
+    "do_location_id", "payment_type", "fare_amount", "extra", "mta_tax",
+    "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount",
+    "congestion_surcharge", "airport_fee"
+]
 
-    # Keep only columns that exist
-    available_cols = [col for col in required_cols if col in df.columns]
-    df = df[available_cols]
-
-    # Add missing required columns
-    for col in required_cols:
-        if col not in df.columns:
-            if col == "store_and_fwd_flag":
-                df[col] = "N"
-            elif col == "vendor_id":
-                df[col] = "1"
-            else:
-                df[col] = 0
+# taxi_trips column types (see sql/migrations/002_create_taxi_trips.sql)
+INT_COLUMNS = ["passenger_count", "rate_code_id", "pu_location_id", "do_location_id", "payment_type"]
+DECIMAL_COLUMNS = [
+    "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+    "improvement_surcharge", "total_amount", "congestion_surcharge", "airport_fee"
+]
+DATETIME_COLUMNS = ["pickup_datetime", "dropoff_datetime"]
+
+# Columns written by the insert engines: the cleaned columns plus the dedup fingerprint
+INSERT_COLUMNS = TAXI_TRIP_COLUMNS + [FINGERPRINT_COLUMN]
+
+# NYC TLC source column → taxi_trips column (matched case-insensitively,
+# newer files spell Airport_fee in lower case)
+SOURCE_COLUMNS = {
+    "VendorID": "vendor_id",
+    "tpep_pickup_datetime": "pickup_datetime",
+    "tpep_dropoff_datetime": "dropoff_datetime",
+    "passenger_count": "passenger_count",
+    "trip_distance": "trip_distance",
+    "RatecodeID": "rate_code_id",
+    "store_and_fwd_flag": "store_and_fwd_flag",
+    "PULocationID": "pu_location_id",
+    "DOLocationID": "do_location_id",
+    "payment_type": "payment_type",
+    "fare_amount": "fare_amount",
+    "extra": "extra",
+    "mta_tax": "mta_tax",
+    "tip_amount": "tip_amount",
+    "tolls_amount": "tolls_amount",
+    "improvement_surcharge": "improvement_surcharge",
+    "total_amount": "total_amount",
+    "congestion_surcharge": "congestion_surcharge",
+    "Airport_fee": "airport_fee"
+}
+
+
+class CleaningPlan:
+    """Per-column cleaning steps compiled once from a source schema.
+
+    Each taxi_trips column is either taken from a source column (fill nulls,
+    cast to the MySQL column type in one Arrow kernel pass) or filled with a
+    constant when the file does not have it. Applying the plan builds the
+    output table straight from these arrays, with no rename/reindex/fillna
+    intermediate frames.
+    """
+
+    def __init__(self, schema):
+        by_lower = {name.lower(): name for name in schema.names}
+        self.steps = []
+        for source, target in SOURCE_COLUMNS.items():
+            self.steps.append((target, by_lower.get(source.lower())))
+        self.missing = [target for target, source in self.steps if source is None]
+
+    @staticmethod
+    def _all_missing(arr):
+        """True for a column with no values, e.g. a CSV chunk's empty column read as null or all-NaN double."""
+        if pa.types.is_null(arr.type):
+            return True
+        if not pa.types.is_floating(arr.type):
+            return False
+        nans = pc.sum(pc.is_nan(arr)).as_py() or 0
+        return arr.null_count + nans == len(arr)
+
+    @staticmethod
+    def _fill(arr, value):
+        # fill_null and same-type casts copy the whole column even when they change nothing
+        return pc.fill_null(arr, value) if arr.null_count else arr
+
+    @staticmethod
+    def _as(arr, type_, safe=True):
+        return arr if arr.type == type_ else pc.cast(arr, type_, safe=safe)
+
+    @staticmethod
+    def _clean(target, arr):
+        if target in DATETIME_COLUMNS:
+            # No timestamp cast exists from null/double; an empty column is all NULL
+            if CleaningPlan._all_missing(arr):
+                return pa.nulls(len(arr), pa.timestamp("s"))
+            # DATETIME has second precision; NULLs stay NULL
+            return CleaningPlan._as(arr, pa.timestamp("s"), safe=False)
+        if target in INT_COLUMNS:
+            arr = CleaningPlan._fill(arr, 0)
+            if pa.types.is_floating(arr.type):
+                arr = pc.round(arr)
+            return CleaningPlan._as(arr, pa.int64(), safe=False)
+        if target in DECIMAL_COLUMNS:
+            # DECIMAL(10,2): round to cents here instead of on the server
+            return pc.round(CleaningPlan._as(CleaningPlan._fill(arr, 0), pa.float64()), 2)
+        if target == "trip_distance":
+            return CleaningPlan._as(CleaningPlan._fill(arr, 0), pa.float64())
+        if target == "vendor_id":
+            if pa.types.is_floating(arr.type):
+                arr = pc.cast(pc.round(arr), pa.int64(), safe=False)
+            if pa.types.is_integer(arr.type):
+                # A handful of distinct ids: format each once and gather, not every row
+                codes = pc.dictionary_encode(arr)
+                arr = pc.take(pc.cast(codes.dictionary, pa.string()), codes.indices)
+            return CleaningPlan._fill(CleaningPlan._as(arr, pa.string()), "0")
+        if target == "store_and_fwd_flag":
+            return CleaningPlan._fill(CleaningPlan._as(arr, pa.string()), "N")
+        return arr
 
-    df = df[required_cols]
-    df = df.fillna(0)
-    df["vendor_id"] = df["vendor_id"].astype(str)
+    @staticmethod
+    def _vendor_numbers(arr):
+        """vendor_id as int64 for the fingerprint, matching the cleaned string column
+        (nulls are "0"); None for text sources, whose strings are parsed instead."""
+        if pa.types.is_floating(arr.type):
+            arr = pc.cast(pc.round(arr), pa.int64(), safe=False)
+        elif not pa.types.is_integer(arr.type):
+            return None
+        return CleaningPlan._fill(CleaningPlan._as(arr, pa.int64()), 0)
 
-    return df
+    @staticmethod
+    def _constant(target, n):
+        if target == "store_and_fwd_flag":
+            return pa.repeat("N", n)
+        if target == "vendor_id":
+            return pa.repeat("1", n)
+        if target in DATETIME_COLUMNS:
+            return pa.nulls(n, pa.timestamp("s"))
+        if target in INT_COLUMNS:
+            return pa.repeat(pa.scalar(0, pa.int64()), n)
+        return pa.repeat(pa.scalar(0.0, pa.float64()), n)
+
+    def apply(self, batch):
+        """Clean a RecordBatch/Table into a DataFrame typed for taxi_trips."""
+        n = batch.num_rows
+        arrays = [
+            self._constant(target, n) if source is None else self._clean(target, batch.column(source))
+            for target, source in self.steps
+        ]
+        names = list(TAXI_TRIP_COLUMNS)
+        # Fingerprint from the numeric vendor ids; parsing the cleaned strings back costs most of the hash
+        vendor_source = dict(self.steps)["vendor_id"]
+        vendor = pa.repeat(pa.scalar(1, pa.int64()), n) if vendor_source is None \
+            else self._vendor_numbers(batch.column(vendor_source))
+        if vendor is not None:
+            arrays.append(vendor)
+            names.append("_vendor_number")
+        table = pa.Table.from_arrays(arrays, names=names)
+        # pickup_datetime is the partitioning key (NOT NULL); such trips cannot be placed
+        pickup = table.column("pickup_datetime")
+        if pickup.null_count:
+            table = table.filter(pc.is_valid(pickup))
+        if vendor is not None:
+            vendor = table.column("_vendor_number").to_numpy()
+            table = table.drop(["_vendor_number"])
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        df[FINGERPRINT_COLUMN] = trip_fingerprints(df, vendor)
+        return df
+
+
+_PLANS = {}
+
+
+def get_cleaning_plan(schema):
+    """Compile (once per distinct source schema) and return the cleaning plan."""
+    plan = _PLANS.get(schema)
+    if plan is None:
+        plan = _PLANS[schema] = CleaningPlan(schema)
+        if plan.missing:
+            print(f"Source is missing columns {plan.missing}; filling defaults")
+    return plan
+
+
+def clean_chunk(chunk):
+    """Map a raw chunk (Arrow batch or DataFrame) onto taxi_trips columns and types.
+
+    Numeric nulls become 0, missing vendor_id/store_and_fwd_flag default to
+    "1"/"N", rows without a pickup time are dropped and a null dropoff time
+    is kept as NULL. Adds the trip_fingerprint column used for deduplication.
+    """
+    if isinstance(chunk, pd.DataFrame):
+        chunk = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+    return get_cleaning_plan(chunk.schema).apply(chunk)
 
 
 
 # -----------------------------
 #  SUPER FAST BULK INSERT
 # -----------------------------
-def insert_chunk(conn, df):
-    sql = """
-        INSERT INTO taxi_trips (
-            vendor_id, pickup_datetime, dropoff_datetime, passenger_count,
-            trip_distance, rate_code_id, store_and_fwd_flag, pu_location_id,
-            do_location_id, payment_type, fare_amount, extra, mta_tax,
-            tip_amount, tolls_amount, improvement_surcharge, total_amount,
-            congestion_surcharge, airport_fee
-        ) VALUES (
-            %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s
-        )
+_max_stmt_length = None
+
+
+def statement_length(conn):
+    """Longest multi-row INSERT to build: max_allowed_packet minus headroom.
+
+    PyMySQL splits executemany into ~1 MB statements by default; statements
+    close to the server's packet limit need fewer round trips per chunk.
     """
+    global _max_stmt_length
+    if _max_stmt_length is None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT @@max_allowed_packet")
+            packet = int(cur.fetchone()[0])
+        _max_stmt_length = max(packet - 64 * 1024, 1024000)
+    return _max_stmt_length
+
+
+def insert_chunk_executemany(conn, df, table="taxi_trips"):
+    # A duplicate fingerprint that got past the dedup check is skipped, not an error
+    sql = f"""
+        INSERT INTO {table} ({", ".join(INSERT_COLUMNS)})
+        VALUES ({",".join(["%s"] * len(INSERT_COLUMNS))})
+        ON DUPLICATE KEY UPDATE {FINGERPRINT_COLUMN} = {FINGERPRINT_COLUMN}
+    """
+    df = df[INSERT_COLUMNS]
+
+    # NaN/NaT must reach PyMySQL as None to be stored as NULL
+    if df.isna().values.any():
+        df = df.astype(object).where(df.notna(), None)
 
     # Convert dataframe rows → list of tuples ONCE
     data = [tuple(row) for row in df.itertuples(index=False, name=None)]
 
+    # Affected rows: 1 per inserted row, 0 per skipped duplicate
     with conn.cursor() as cur:
-        cur.executemany(sql, data)
+        cur.max_stmt_length = statement_length(conn)
+        return cur.executemany(sql, data)
+
+
+def write_tsv(df, path):
+    """Write a cleaned chunk in the format LOAD DATA expects by default.
+
+    NULL/NaN/NaT become \\N, DATETIME columns use 'YYYY-MM-DD HH:MM:SS',
+    DECIMAL(10,2) columns are rounded to cents and INT columns are written
+    without a trailing ".0" so MySQL does not truncate them with warnings.
+    Text columns get backslash, tab and newline escaped by hand; letting the
+    csv module escape would also mangle the \\N markers.
+    """
+    out = df[INSERT_COLUMNS].copy()
+    for col in ("vendor_id", "store_and_fwd_flag"):
+        present = out[col].notna()
+        out[col] = out[col].astype(object)
+        out.loc[present, col] = (
+            out.loc[present, col].astype(str)
+            .str.replace("\\", "\\\\", regex=False)
+            .str.replace("\t", "\\t", regex=False)
+            .str.replace("\n", "\\n", regex=False)
+        )
+    for col in INT_COLUMNS:
+        if not pd.api.types.is_integer_dtype(out[col]):
+            out[col] = pd.to_numeric(out[col], errors="coerce").round().astype("Int64")
+    for col in DECIMAL_COLUMNS:
+        out[col] = pd.to_numeric(out[col], errors="coerce").round(2)
+    for col in DATETIME_COLUMNS:
+        out[col] = pd.to_datetime(out[col], errors="coerce")
+
+    out.to_csv(
+        path, sep="\t", header=False, index=False, na_rep="\\N",
+        date_format="%Y-%m-%d %H:%M:%S", quoting=csv.QUOTE_NONE,
+        lineterminator="\n"
+    )
+
+
+def insert_chunk_load_data(conn, df, table="taxi_trips"):
+    fd, path = tempfile.mkstemp(prefix="etl_chunk_", suffix=".tsv", dir=ETL_TMP_DIR)
+    os.close(fd)
+    sql = f"""
+        LOAD DATA LOCAL INFILE %s
+        INTO TABLE {table}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+        LINES TERMINATED BY '\\n'
+        ({", ".join(INSERT_COLUMNS)})
+    """
+    try:
+        write_tsv(df, path)
+        with conn.cursor() as cur:
+            loaded = cur.execute(sql, (path,))
+            warnings = cur.warning_count
+    finally:
+        os.remove(path)
+
+    # LOCAL loads skip duplicate keys and turn data errors into warnings; a
+    # skipped row is a duplicate fingerprint, anything beyond that is mangled data
+    skipped = len(df) - loaded
+    if loaded > len(df):
+        raise RuntimeError(f"LOAD DATA loaded {loaded} of {len(df)} rows")
+    if warnings > skipped:
+        print(f"⚠️  LOAD DATA produced {warnings} warnings: {conn.show_warnings()[:5]}")
+    return loaded
+
+
+ENGINES = {
+    "executemany": insert_chunk_executemany,
+    "load_data": insert_chunk_load_data,
+}
+
+
+def insert_chunk(conn, df, engine=None, table="taxi_trips"):
+    """Insert a cleaned chunk; returns the rows actually inserted."""
+    engine = engine or ETL_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown ETL_ENGINE '{engine}', expected one of {list(ENGINES)}")
+    if df.empty:
+        return 0
+    return ENGINES[engine](conn, df, table)
 
 
 
 # -----------------------------
 #  Record ETL Metrics
 # -----------------------------
-def record_etl_metrics(conn, rows, duration):
+def record_etl_metrics(conn, rows, duration, engine=None, rows_per_sec=None,
+                       index_build_seconds=None, swap_ms=None):
+    """rows_per_sec defaults to rows / duration; pass the insert-only rate to compare engines"""
+    if rows_per_sec is None and duration > 0:
+        rows_per_sec = rows / duration
+    rows_per_sec = round(rows_per_sec, 2) if rows_per_sec is not None else None
     sql = """
-        INSERT INTO etl_metrics (rows_loaded, duration_seconds, created_at)
-        VALUES (%s, %s, NOW())
+        INSERT INTO etl_metrics (rows_loaded, duration_seconds, engine, rows_per_sec, mode,
+                                 index_build_seconds, swap_ms, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
     """
     with conn.cursor() as cur:
-        cur.execute(sql, (rows, duration))
+        cur.execute(sql, (rows, duration, engine or ETL_ENGINE, rows_per_sec, ETL_MODE,
+                          index_build_seconds, swap_ms))
 
 
 
 # -----------------------------
-#  MAIN ETL PIPELINE
+#  Chunk Ledger (resumable loads)
 # -----------------------------
-def main():
-    overall_start = time.time()
-    conn = get_mysql_conn()
-    file_path = download_data()
+# Where chunks and their ledger rows are written
+Target = namedtuple("Target", ["table", "ledger"])
+LIVE = Target("taxi_trips", "etl_chunk_ledger")
+STAGING = Target("taxi_trips_staging", "etl_chunk_ledger_staging")
+
+
+def source_name(url_or_path):
+    """Stable ledger key for a source file: its file name, e.g. yellow_tripdata_2023-01.parquet"""
+    return os.path.basename(url_or_path.split("?")[0])
+
+
+def load_committed_ranges(conn, source, target=LIVE):
+    """Merged, sorted [start, stop) row ranges of source already loaded."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT row_offset, row_count FROM {target.ledger} WHERE source_file = %s ORDER BY row_offset",
+            (source,)
+        )
+        rows = cur.fetchall()
+
+    merged = []
+    for offset, count in rows:
+        if merged and offset <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], offset + count)
+        else:
+            merged.append([offset, offset + count])
+    return [tuple(r) for r in merged]
+
+
+def record_chunk(conn, source, offset, source_rows, loaded_rows, target=LIVE):
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""INSERT INTO {target.ledger} (source_file, row_offset, row_count, rows_loaded, committed_at)
+                VALUES (%s, %s, %s, %s, NOW())""",
+            (source, offset, source_rows, loaded_rows)
+        )
+
+
+# Errors a smaller batch may get past: lost connection, packet too large, lock wait timeout, deadlock
+RETRYABLE_ERRORS = (pymysql.err.OperationalError, pymysql.err.InternalError)
+MAX_CHUNK_SPLITS = 6
+
+
+def _rollback_quietly(conn):
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+
+def commit_chunk(conn, source, offset, source_rows, clean_df, target=LIVE):
+    """Drop duplicates, then insert a chunk and its ledger row in one transaction.
+
+    A transaction that fails with a retryable error is rolled back and retried
+    with the chunk inserted in halves (recursively, up to MAX_CHUNK_SPLITS
+    times), and the chunk sizer backs off. Returns the rows inserted.
+    """
+    dedup = get_deduplicator(target)
+    if dedup:
+        clean_df = dedup.filter(conn, clean_df)
+
+    pieces = [clean_df] if len(clean_df) else []
+    splits = 0
+    while True:
+        try:
+            insert_start = time.time()
+            conn.begin()
+            inserted = sum(insert_chunk(conn, piece, table=target.table) for piece in pieces)
+            record_chunk(conn, source, offset, source_rows, inserted, target)
+            insert_seconds = time.time() - insert_start
+            conn.commit()
+            break
+        except RETRYABLE_ERRORS as e:
+            _rollback_quietly(conn)
+            if splits >= MAX_CHUNK_SPLITS or all(len(piece) <= 1 for piece in pieces):
+                raise
+            splits += 1
+            CHUNK_SIZER.on_error()
+            pieces = [half for piece in pieces for half in split_batch(piece)]
+            print(f"⚠️  Chunk at row {offset} failed ({e}); retrying as {len(pieces)} pieces")
+            conn.ping(reconnect=True)
+        except BaseException:
+            _rollback_quietly(conn)
+            raise
+
+    CHUNK_SIZER.observe(source_rows, insert_seconds)
+    if dedup:
+        dedup.record(clean_df)
+    return inserted
+
+
+# -----------------------------
+#  Duplicate Detection
+# -----------------------------
+_DEDUPLICATORS = {}
+_dedup_lock = threading.Lock()
+
+
+def bloom_path(target):
+    return os.path.join(BLOOM_DIR, f"{target.table}.bloom")
+
 
+def get_deduplicator(target):
+    """Deduplicator for target's table (one persistent Bloom filter each), or None when ETL_DEDUP is off."""
+    if not ETL_DEDUP:
+        return None
+    with _dedup_lock:
+        dedup = _DEDUPLICATORS.get(target.table)
+        if dedup is None:
+            dedup = _DEDUPLICATORS[target.table] = Deduplicator(target.table, bloom_path(target))
+        return dedup
+
+
+def report_dedup(target, start_time):
+    """Persist target's Bloom filter and record this run's dedup rate and filter memory."""
+    dedup = get_deduplicator(target)
+    if not dedup:
+        return None
+    dedup.bloom.flush()
+    stats = dedup.summary()
+    print(f"Dedup: {stats['duplicates_dropped']} of {stats['rows_checked']} rows dropped "
+          f"({stats['dedup_rate']:.2%}) | {stats['bloom_maybe']} Bloom hits, "
+          f"{stats['bloom_false_positives']} false positives | filter {stats['bloom_mb']}MB")
+    record_db_metrics("mysql", "etl_dedup", start_time, error_count=0, details=stats)
+    return stats
+
+
+# -----------------------------
+#  Sequential Load
+# -----------------------------
+def load_sequential(conn, chunks, source, target=LIVE):
+    """Insert (offset, chunk) pairs on one connection, cleaning ahead in a prefetch thread.
+
+    Returns (rows, seconds spent inserting).
+    """
     total_rows = 0
-    error_count = 0
+    insert_seconds = 0.0
+
+    # Clean in the prefetch thread so reading overlaps with inserting
+    cleaned = prefetch((offset, len(chunk), clean_chunk(chunk)) for offset, chunk in chunks)
+
+    chunk_start = time.time()
+    for idx, (offset, source_rows, clean_df) in enumerate(cleaned, start=1):
+        print(f"Processing chunk {idx} (rows {offset}-{offset + source_rows - 1})...")
+
+        insert_start = time.time()
+        inserted = commit_chunk(conn, source, offset, source_rows, clean_df, target)
+        insert_elapsed = time.time() - insert_start
+        insert_seconds += insert_elapsed
+
+        total_rows += inserted
 
+        # Monitoring
+        record_db_metrics("mysql", "etl_chunk", chunk_start, error_count=0,
+                          details={"chunk": idx, "offset": offset, "rows": inserted,
+                                   "duplicates": len(clean_df) - inserted, "chunk_size": source_rows,
+                                   "engine": ETL_ENGINE,
+                                   "rows_per_sec": round(inserted / max(insert_elapsed, 1e-6), 1)})
+
+        print(f"Inserted {inserted} rows. Total: {total_rows} | Peak RSS: {get_peak_rss_mb():.0f}MB")
+
+        chunk_start = time.time()
+
+    return total_rows, insert_seconds
+
+
+# -----------------------------
+#  Parallel Load
+# -----------------------------
+def produce_clean_chunks(chunks, out_q, abort, clean_workers):
+    """Read chunks in order, clean them (in a process pool) and queue
+    (idx, offset, source_rows, df)."""
+    if clean_workers <= 0:
+        for idx, (offset, chunk) in enumerate(chunks, start=1):
+            if not put_until(out_q, (idx, offset, len(chunk), clean_chunk(chunk)), abort):
+                return
+        return
+
+    # spawn: forking a process that already runs threads is unsafe
+    pool = ProcessPoolExecutor(max_workers=clean_workers,
+                               mp_context=multiprocessing.get_context("spawn"))
     try:
-        if file_path.endswith('.parquet'):
-            df_full = pd.read_parquet(file_path)
-            chunks = range(0, len(df_full), CHUNK_SIZE)
+        pending = deque()
+        for idx, (offset, chunk) in enumerate(chunks, start=1):
+            pending.append((idx, offset, len(chunk), pool.submit(clean_chunk, chunk)))
+            # Bound the chunks held by the pool; results are taken in submit order
+            if len(pending) >= clean_workers * 2:
+                done_idx, done_offset, source_rows, fut = pending.popleft()
+                if not put_until(out_q, (done_idx, done_offset, source_rows, fut.result()), abort):
+                    return
+        while pending:
+            done_idx, done_offset, source_rows, fut = pending.popleft()
+            if not put_until(out_q, (done_idx, done_offset, source_rows, fut.result()), abort):
+                return
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
-            for idx, i in enumerate(chunks, start=1):
-                chunk_start = time.time()
 
-                print(f"Processing chunk {idx}...")
+def writer_loop(writer_id, in_q, source, target, abort, failures, totals, lock):
+    conn = get_mysql_conn()
+    chunk_start = time.time()
+    try:
+        while not abort.is_set():
+            try:
+                item = in_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
 
-                chunk = df_full.iloc[i:i+CHUNK_SIZE]
-                clean_df = clean_chunk(chunk)
+            idx, offset, source_rows, clean_df = item
+            chunk_start = time.time()
+            checked = len(clean_df)
 
-                insert_chunk(conn, clean_df)
+            # Each chunk commits as soon as it is inserted. Waiting for earlier chunks
+            # would hold its row locks, and an earlier chunk inserting the same
+            # trip_fingerprint would block on them until the lock wait timeout
+            inserted = commit_chunk(conn, source, offset, source_rows, clean_df, target)
 
-                total_rows += len(clean_df)
+            elapsed = time.time() - chunk_start
+            with lock:
+                totals["rows"] += inserted
+                total = totals["rows"]
 
-                # Monitoring
-                record_db_metrics("mysql", "etl_chunk", chunk_start, error_count=0)
+            record_db_metrics("mysql", "etl_chunk", chunk_start, error_count=0,
+                              details={"chunk": idx, "offset": offset, "writer": writer_id, "rows": inserted,
+                                       "duplicates": checked - inserted, "chunk_size": source_rows,
+                                       "engine": ETL_ENGINE,
+                                       "rows_per_sec": round(inserted / max(elapsed, 1e-6), 1)})
+            print(f"[Writer {writer_id}] Inserted chunk {idx}: {inserted} rows. Total: {total}")
+    except BaseException as e:
+        failures.append(e)
+        abort.set()
+        _rollback_quietly(conn)
+        record_db_metrics("mysql", "etl_chunk", chunk_start, error_count=1, details={"writer": writer_id})
+    finally:
+        conn.close()
 
-                print(f"Inserted {len(clean_df)} rows. Total: {total_rows}")
 
-        else:
-            for idx, chunk in enumerate(pd.read_csv(file_path, chunksize=CHUNK_SIZE), start=1):
-                chunk_start = time.time()
+def load_parallel(chunks, source, target=LIVE, workers=None, clean_workers=None, queue_depth=None):
+    """Producer/consumer load: 1 reader, a cleaning process pool, N writer connections.
+
+    Every chunk is committed together with its ledger row, in whatever order the
+    writers finish. After a failure the ledger lists exactly the committed row
+    ranges, and a resumed load fills the gaps. The first error from any stage
+    stops every stage and is re-raised here. Returns (rows, wall seconds).
+    """
+    workers = workers or ETL_WORKERS
+    clean_workers = ETL_CLEAN_WORKERS if clean_workers is None else clean_workers
+    queue_depth = queue_depth or ETL_QUEUE_DEPTH
+
+    print(f"Parallel load: {workers} writers, {clean_workers} cleaning processes, queue depth {queue_depth}")
+
+    start = time.time()
+    work_q = queue.Queue(maxsize=max(queue_depth, 1))
+    abort = threading.Event()
+    failures = []
+    totals = {"rows": 0}
+    lock = threading.Lock()
+
+    writers = [
+        threading.Thread(target=writer_loop, name=f"etl-writer-{n}",
+                         args=(n, work_q, source, target, abort, failures, totals, lock))
+        for n in range(1, workers + 1)
+    ]
+    for t in writers:
+        t.start()
+
+    try:
+        produce_clean_chunks(chunks, work_q, abort, clean_workers)
+    except BaseException as e:
+        failures.append(e)
+        abort.set()
+    finally:
+        for _ in writers:
+            put_until(work_q, _END, abort)
+        for t in writers:
+            t.join()
+
+    if failures:
+        raise failures[0]
+
+    return totals["rows"], time.time() - start
+
+
+# -----------------------------
+#  Load One Source File
+# -----------------------------
+def load_file(conn, url, file_path, target=LIVE):
+    """Load one downloaded file, resuming from its ledger. Returns rows loaded."""
+    file_start = time.time()
+    source = source_name(url)
+    print(f"\n=== Loading {source} into {target.table} ===")
+
+    committed = load_committed_ranges(conn, source, target)
+    if committed:
+        print(f"Resuming {source}: {sum(stop - start for start, stop in committed)} rows already committed")
+
+    reader = iter_parquet_chunks if file_path.endswith('.parquet') else iter_csv_chunks
+    pieces = skip_committed(reader(file_path, chunk_size=READ_BATCH, skip_ranges=committed), committed)
+    chunks = rechunk(pieces)
 
-                print(f"Processing chunk {idx}...")
+    if ETL_WORKERS > 1:
+        rows, insert_seconds = load_parallel(chunks, source, target)
+    else:
+        rows, insert_seconds = load_sequential(conn, chunks, source, target)
+
+    duration = round(time.time() - file_start, 2)
+    insert_rate = rows / insert_seconds if insert_seconds > 0 else None
+    print(f"Loaded {source}: {rows} rows in {duration}s"
+          + (f" | {insert_rate:,.0f} rows/sec while inserting ({ETL_ENGINE})" if insert_rate else ""))
+
+    record_etl_metrics(conn, rows, duration, rows_per_sec=insert_rate)
+    return rows
+
+
+# -----------------------------
+#  Staging Load + Atomic Swap
+# -----------------------------
+# Secondary indexes of taxi_trips (sql/migrations/002 and 011),
+# dropped on the staging table and built once after the load
+SECONDARY_INDEXES = {
+    "idx_pickup_datetime": "(pickup_datetime)",
+    "idx_payment_pickup": "(payment_type, pickup_datetime)",
+    "idx_fare_total": "(fare_amount, total_amount)",
+    "idx_updated_trip": "(updated_at, trip_id)",
+}
+
+
+def table_exists(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+            (table,)
+        )
+        return cur.fetchone()[0] > 0
+
+
+def secondary_indexes(conn, table):
+    """Names of SECONDARY_INDEXES currently present on table"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT DISTINCT index_name FROM information_schema.statistics
+               WHERE table_schema = DATABASE() AND table_name = %s""",
+            (table,)
+        )
+        return [row[0] for row in cur.fetchall() if row[0] in SECONDARY_INDEXES]
+
+
+def prepare_staging(conn, urls):
+    """Create the index-free staging table and its ledger, or reuse them to resume.
+
+    Live rows with a pickup outside the manifest's months, and the ledger rows
+    of files not in the manifest, are copied in with their trip_id and
+    updated_at, so the swap only replaces the reloaded months.
+    """
+    if table_exists(conn, STAGING.table) and table_exists(conn, STAGING.ledger):
+        print(f"Resuming into existing {STAGING.table}")
+        return
+
+    months = manifest_months(urls)
+    sources = [source_name(u) for u in urls]
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {STAGING.table}, {STAGING.ledger}, {STAGING.ledger}_new")
+        cur.execute(f"CREATE TABLE {STAGING.table} LIKE {LIVE.table}")
+        # A filter left by an abandoned staging run describes rows that no longer exist
+        remove_filter(bloom_path(STAGING))
+
+        present = secondary_indexes(conn, STAGING.table)
+        if present:
+            cur.execute(f"ALTER TABLE {STAGING.table} " + ", ".join(f"DROP INDEX {name}" for name in present))
+
+        # Months not being reloaded; RANGE partitioning prunes this to the kept partitions
+        reloaded = " OR ".join("(pickup_datetime >= %s AND pickup_datetime < %s)" for _ in months)
+        cur.execute(
+            f"INSERT INTO {STAGING.table} SELECT * FROM {LIVE.table}"
+            + (f" WHERE NOT ({reloaded})" if months else ""),
+            [bound for m in months for bound in (m, add_months(m, 1))]
+        )
+        kept = cur.rowcount
+
+        # Keep trip_ids increasing across the swap so already synced ids are never reused
+        cur.execute(f"SELECT COALESCE(MAX(trip_id), 0) + 1 FROM {LIVE.table}")
+        next_id = cur.fetchone()[0]
+        cur.execute(f"ALTER TABLE {STAGING.table} AUTO_INCREMENT = {int(next_id)}")
+
+        # The ledger appears last (RENAME is atomic): a run that died before this starts over
+        cur.execute(f"CREATE TABLE {STAGING.ledger}_new LIKE {LIVE.ledger}")
+        cur.execute(
+            f"INSERT INTO {STAGING.ledger}_new SELECT * FROM {LIVE.ledger}"
+            f" WHERE source_file NOT IN ({','.join(['%s'] * len(sources))})",
+            sources
+        )
+        cur.execute(f"RENAME TABLE {STAGING.ledger}_new TO {STAGING.ledger}")
 
-                clean_df = clean_chunk(chunk)
+    print(f"Created {STAGING.table} without secondary indexes, keeping {kept} live rows "
+          f"outside the {len(months)} reloaded months")
 
-                insert_chunk(conn, clean_df)
 
-                total_rows += len(clean_df)
+def build_staging_indexes(conn):
+    """Add all secondary indexes in one ALTER (a single sorted bulk build). Returns seconds."""
+    start = time.time()
+    # A resumed run may find indexes built by a run that died before the swap
+    present = secondary_indexes(conn, STAGING.table)
+    clauses = ", ".join(f"ADD INDEX {name} {cols}" for name, cols in SECONDARY_INDEXES.items()
+                        if name not in present)
+    if clauses:
+        print(f"Building indexes on {STAGING.table}...")
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {STAGING.table} {clauses}")
+    elapsed = time.time() - start
+    print(f"Indexes built in {elapsed:.2f}s")
+    return elapsed
 
-                record_db_metrics("mysql", "etl_chunk", chunk_start, error_count=0)
 
-                print(f"Inserted {len(clean_df)} rows. Total: {total_rows}")
+def swap_staging(conn):
+    """Publish staging with one atomic RENAME TABLE of data and ledger. Returns the swap window in ms."""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {LIVE.table}_old, {LIVE.ledger}_old")
+        # Loaded rows carry their load time, which can be older than the MongoDB sync's
+        # watermark; stamp them now so the incremental sync picks them up. Rows copied
+        # from the live table keep their updated_at and are not synced again.
+        cur.execute(
+            f"""UPDATE {STAGING.table} s
+                LEFT JOIN {LIVE.table} l ON l.trip_id = s.trip_id AND l.pickup_datetime = s.pickup_datetime
+                SET s.updated_at = NOW()
+                WHERE l.trip_id IS NULL"""
+        )
+        print(f"Stamped {cur.rowcount} loaded rows with the publish time")
+        start = time.time()
+        cur.execute(
+            f"""RENAME TABLE
+                {LIVE.table} TO {LIVE.table}_old, {STAGING.table} TO {LIVE.table},
+                {LIVE.ledger} TO {LIVE.ledger}_old, {STAGING.ledger} TO {LIVE.ledger}"""
+        )
+        swap_ms = (time.time() - start) * 1000
+        cur.execute(f"DROP TABLE {LIVE.table}_old, {LIVE.ledger}_old")
+    print(f"Swapped {STAGING.table} into {LIVE.table} in {swap_ms:.1f}ms")
+
+    # The staging table's Bloom filter now describes the live table
+    dedup = _DEDUPLICATORS.pop(STAGING.table, None)
+    if dedup:
+        _DEDUPLICATORS.pop(LIVE.table, None)
+        dedup.bloom.replace(bloom_path(LIVE))
+    return swap_ms
+
+
+# -----------------------------
+#  Partitions
+# -----------------------------
+def manifest_months(urls):
+    """First days of the months named in the manifest's file names (e.g. yellow_tripdata_2023-01)."""
+    matches = (re.search(r"(\d{4})-(\d{2})", source_name(u)) for u in urls)
+    return sorted({date(int(m.group(1)), int(m.group(2)), 1) for m in matches if m})
+
+
+def ensure_load_partitions(conn, urls, table):
+    """Create month partitions for the manifest's months (and the months ahead) before loading."""
+    months = manifest_months(urls)
+    through = max(months + [add_months(date.today().replace(day=1), PARTITION_MONTHS_AHEAD)])
+    ensure_partitions(conn, through, table)
+
+
+# -----------------------------
+#  MAIN ETL PIPELINE
+# -----------------------------
+def main():
+    overall_start = time.time()
+    conn = get_mysql_conn()
+    urls = resolve_manifest()
+
+    total_rows = 0
+    error_count = 0
+    dedup_stats = None
+    if ETL_MODE not in ("append", "staging"):
+        raise ValueError(f"Unknown ETL_MODE '{ETL_MODE}', expected 'append' or 'staging'")
+    target = STAGING if ETL_MODE == "staging" else LIVE
+
+    print(f"Load engine: {ETL_ENGINE} | Mode: {ETL_MODE} | Files: {len(urls)}")
+
+    try:
+        ensure_load_partitions(conn, urls, LIVE.table)
+        if target is STAGING:
+            prepare_staging(conn, urls)
+            ensure_load_partitions(conn, urls, STAGING.table)
+
+        # Later files download in the background while earlier ones load
+        load_start = time.time()
+        for url, file_path in fetch_all(urls):
+            total_rows += load_file(conn, url, file_path, target)
+        dedup_stats = report_dedup(target, load_start)
+        sizing = CHUNK_SIZER.summary()
+        print(f"Chunk sizes: avg {sizing['avg_batch']} (min {sizing['min_batch']}, max {sizing['max_batch']}), "
+              f"next {sizing['batch_size']} | {sizing['adjustments']} adjustments, {sizing['errors']} backoffs")
+        record_db_metrics("mysql", "etl_chunk_size", load_start, error_count=sizing["errors"], details=sizing)
+
+        if target is STAGING:
+            load_seconds = round(time.time() - load_start, 2)
+            index_seconds = build_staging_indexes(conn)
+            swap_ms = swap_staging(conn)
+            record_etl_metrics(conn, total_rows, load_seconds,
+                               index_build_seconds=round(index_seconds, 2), swap_ms=round(swap_ms, 2))
 
     except Exception as e:
         error_count += 1
@@ -205,16 +1109,19 @@ def main():
         raise
 
     duration = round(time.time() - overall_start, 2)
-    print(f"ETL complete. Total rows: {total_rows} | Time: {duration}s")
-
-    record_etl_metrics(conn, total_rows, duration)
+    print(f"ETL complete. Files: {len(urls)} | Total rows: {total_rows} | Time: {duration}s | "
+          f"Peak RSS: {get_peak_rss_mb():.0f}MB")
 
     # Final ETL Monitoring
-    record_db_metrics("mysql", "etl_complete", overall_start, error_count=error_count)
+    record_db_metrics("mysql", "etl_complete", overall_start, error_count=error_count,
+                      details={"rows": total_rows, "files": len(urls), "engine": ETL_ENGINE,
+                               "writers": ETL_WORKERS, "mode": ETL_MODE, "chunk_size": CHUNK_SIZER.size,
+                               "dedup_rate": dedup_stats["dedup_rate"] if dedup_stats else None,
+                               "bloom_mb": dedup_stats["bloom_mb"] if dedup_stats else None})
 
     conn.close()
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
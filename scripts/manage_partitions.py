@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Maintain the monthly RANGE partitions of taxi_trips.
+
+- Creates month partitions ahead of the data by splitting them out of p_future
+  (cheap while p_future is empty).
+- Retention drops whole month partitions older than PARTITION_RETENTION_MONTHS,
+  and the ETL chunk ledger rows of those months' source files, so the ETL
+  loads them again if they are ever back in its manifest.
+
+Run standalone (e.g. from cron) or through etl_to_mysql.py, which makes sure the
+months in its manifest have partitions before loading.
+"""
+import os
+import re
+import time
+from datetime import date
+import pymysql
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+
+load_dotenv()
+
+MYSQL_HOST = os.getenv("MYSQL_HOST")
+MYSQL_USER = os.getenv("MYSQL_APP_USER")
+MYSQL_PASSWORD = os.getenv("MYSQL_APP_PASSWORD")
+MYSQL_DB = os.getenv("MYSQL_DB_NAME")
+
+# Months of empty partitions to keep ready after the current month
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Drop month partitions older than this many months (0 keeps everything)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+
+MONTH_PARTITION = re.compile(r"^p(\d{4})(\d{2})$")
+# Month in a source file name, e.g. yellow_tripdata_2023-01.parquet
+SOURCE_MONTH = re.compile(r"(\d{4})-(\d{2})")
+
+
+def get_conn():
+    return pymysql.connect(
+        host=MYSQL_HOST,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        database=MYSQL_DB,
+        autocommit=True
+    )
+
+
+def add_months(month, n):
+    """month is a date on the 1st; returns the 1st of the month n months later"""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_partitions(conn, table="taxi_trips"):
+    """Month partitions of table as a sorted list of (first day of month, name).
+
+    Returns None when the table is not partitioned.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT partition_name FROM information_schema.partitions
+               WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL""",
+            (table,)
+        )
+        names = [row[0] for row in cur.fetchall()]
+
+    if not names:
+        return None
+
+    months = []
+    for name in names:
+        m = MONTH_PARTITION.match(name)
+        if m:
+            months.append((date(int(m.group(1)), int(m.group(2)), 1), name))
+    return sorted(months)
+
+
+def ensure_partitions(conn, through_month, table="taxi_trips"):
+    """Make sure every month up to and including through_month has its own partition."""
+    existing = month_partitions(conn, table)
+    if existing is None:
+        print(f"  {table} is not partitioned; skipping partition maintenance")
+        return []
+
+    last = existing[-1][0] if existing else add_months(date.today().replace(day=1), -1)
+    new = []
+    month = add_months(last, 1)
+    while month <= through_month:
+        new.append(month)
+        month = add_months(month, 1)
+
+    if not new:
+        return []
+
+    definitions = ", ".join(
+        f"PARTITION p{m:%Y%m} VALUES LESS THAN ('{add_months(m, 1):%Y-%m-%d}')" for m in new
+    )
+    with conn.cursor() as cur:
+        cur.execute(
+            f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO "
+            f"({definitions}, PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+        )
+    names = [f"p{m:%Y%m}" for m in new]
+    print(f"  Created partitions on {table}: {', '.join(names)}")
+    return names
+
+
+def forget_loaded_months(conn, before, ledger="etl_chunk_ledger"):
+    """Delete the ledger rows of source files for months before `before`; returns those files."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT DISTINCT source_file FROM {ledger}")
+        stale = []
+        for (name,) in cur.fetchall():
+            m = SOURCE_MONTH.search(name)
+            if m and date(int(m.group(1)), int(m.group(2)), 1) < before:
+                stale.append(name)
+        if stale:
+            cur.execute(f"DELETE FROM {ledger} WHERE source_file IN ({','.join(['%s'] * len(stale))})", stale)
+            print(f"  Forgot {len(stale)} loaded source files in {ledger}: {', '.join(stale)}")
+    return stale
+
+
+def apply_retention(conn, keep_months, table="taxi_trips", today=None, ledger="etl_chunk_ledger"):
+    """Drop month partitions that ended more than keep_months months ago, and their ledger rows.
+
+    Without the ledger rows the ETL would skip the dropped months' chunks as
+    already loaded, so they could never be loaded again.
+    """
+    if keep_months <= 0:
+        return []
+    existing = month_partitions(conn, table)
+    if not existing:
+        return []
+
+    cutoff = add_months((today or date.today()).replace(day=1), -keep_months)
+    expired = [name for month, name in existing if add_months(month, 1) <= cutoff]
+    # p_history holds everything older than the first month partition
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT COUNT(*) FROM information_schema.partitions
+               WHERE table_schema = DATABASE() AND table_name = %s AND partition_name = 'p_history'""",
+            (table,)
+        )
+        if cur.fetchone()[0] and existing[0][0] <= cutoff:
+            expired.insert(0, "p_history")
+
+        if expired:
+            cur.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+            print(f"  Dropped expired partitions on {table}: {', '.join(expired)}")
+    if expired:
+        # Month partitions expire oldest first, p_history only with the oldest month partition
+        months = [month for month, name in existing if name in expired]
+        forget_loaded_months(conn, add_months(max(months), 1) if months else existing[0][0], ledger)
+    return expired
+
+
+def main():
+    start = time.time()
+    print("=" * 60)
+    print("🗂️  taxi_trips partition maintenance")
+    print("=" * 60)
+
+    conn = get_conn()
+    through = add_months(date.today().replace(day=1), PARTITION_MONTHS_AHEAD)
+    created = ensure_partitions(conn, through)
+    dropped = apply_retention(conn, PARTITION_RETENTION_MONTHS)
+
+    layout = month_partitions(conn) or []
+    if layout:
+        print(f"  Month partitions: {layout[0][1]} .. {layout[-1][1]} ({len(layout)})")
+
+    record_db_metrics("mysql", "partition_maintenance", start, error_count=0,
+                      details={"created": created, "dropped": dropped})
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
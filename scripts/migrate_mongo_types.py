@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Convert taxi_trips documents synced before native BSON types to the new layout.
+
+Older syncs stored datetimes as ISO strings and DECIMAL money as doubles. This
+rewrites them in place, server side, as BSON dates and Decimal128 (2 decimal
+places) with pipeline update_many calls over trip_id ranges, so no document is
+shipped to the client.
+
+Collection size and a one-day pickup_datetime range query are measured before
+and after, and the comparison is recorded as the mongo_type_migration metric.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
+
+# trip_id range rewritten per update_many call
+MIGRATION_BATCH = int(os.getenv("MONGO_MIGRATION_BATCH", "50000"))
+QUERY_RUNS = 5
+
+DATE_FIELDS = ["pickup_datetime", "dropoff_datetime", "created_at", "updated_at"]
+MONEY_FIELDS = ["fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+                "improvement_surcharge", "total_amount", "congestion_surcharge", "airport_fee"]
+
+
+def conversion_pipeline():
+    """$set stage turning string dates into dates and double/int money into Decimal128.
+
+    Values already of the target type (or null) are left as they are, so the
+    migration can be re-run or interrupted safely.
+    """
+    fields = {}
+    for name in DATE_FIELDS:
+        fields[name] = {"$cond": [
+            {"$eq": [{"$type": f"${name}"}, "string"]},
+            {"$dateFromString": {"dateString": f"${name}", "onError": f"${name}", "onNull": None}},
+            f"${name}",
+        ]}
+    for name in MONEY_FIELDS:
+        fields[name] = {"$cond": [
+            {"$in": [{"$type": f"${name}"}, ["double", "int", "long"]]},
+            {"$round": [{"$toDecimal": f"${name}"}, 2]},
+            f"${name}",
+        ]}
+    return [{"$set": fields}]
+
+
+def legacy_filter():
+    """Documents that still have a string date or a binary floating point amount."""
+    clauses = [{name: {"$type": "string"}} for name in DATE_FIELDS]
+    clauses += [{name: {"$type": ["double", "int", "long"]}} for name in MONEY_FIELDS]
+    return {"$or": clauses}
+
+
+def collection_stats(db, name="taxi_trips"):
+    stats = db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "size_mb": round(stats.get("size", 0) / 1024 ** 2, 2),
+        "avg_obj_size": stats.get("avgObjSize", 0),
+        "storage_mb": round(stats.get("storageSize", 0) / 1024 ** 2, 2),
+        "index_mb": round(stats.get("totalIndexSize", 0) / 1024 ** 2, 2),
+    }
+
+
+def sample_day(col):
+    """(first day with trips, whether its pickup is stored as a string), from the oldest pickup.
+
+    BSON sorts strings before dates, so any legacy string pickup is found first.
+    """
+    doc = col.find_one({"pickup_datetime": {"$ne": None}}, {"pickup_datetime": 1},
+                       sort=[("pickup_datetime", 1)])
+    if not doc:
+        return None, False
+    value = doc["pickup_datetime"]
+    as_string = isinstance(value, str)
+    if as_string:
+        value = datetime.fromisoformat(value)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0), as_string
+
+
+def time_range_query(col, day, as_string):
+    """Best of QUERY_RUNS timings of a one-day pickup range query (ms, docs)."""
+    low, high = day, day + timedelta(days=1)
+    if as_string:
+        low, high = low.isoformat(), high.isoformat()
+    query = {"pickup_datetime": {"$gte": low, "$lt": high}}
+
+    best, docs = None, 0
+    for _ in range(QUERY_RUNS):
+        t0 = time.perf_counter()
+        docs = sum(1 for _ in col.find(query, {"total_amount": 1}))
+        elapsed = (time.perf_counter() - t0) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2), docs
+
+
+def migrate(col):
+    """Rewrite legacy documents in trip_id ranges; returns the number modified."""
+    first = col.find_one({}, {"trip_id": 1}, sort=[("trip_id", 1)])
+    last = col.find_one({}, {"trip_id": 1}, sort=[("trip_id", -1)])
+    if not first:
+        return 0
+
+    pipeline = conversion_pipeline()
+    modified = 0
+    low = first["trip_id"]
+    while low <= last["trip_id"]:
+        high = low + MIGRATION_BATCH
+        query = {"trip_id": {"$gte": low, "$lt": high}, **legacy_filter()}
+        result = col.update_many(query, pipeline)
+        modified += result.modified_count
+        print(f"  trip_id {low:,}–{high - 1:,}: {result.modified_count:,} converted")
+        low = high
+    return modified
+
+
+def main():
+    start = time.time()
+    print("=" * 60)
+    print("🧬 MongoDB taxi_trips → native BSON dates and Decimal128")
+    print("=" * 60)
+
+    mongo = MongoClient(MONGO_URI)
+    db = mongo[MONGO_DB]
+    col = db["taxi_trips"]
+
+    legacy = col.count_documents(legacy_filter())
+    print(f"📄 Documents with legacy types: {legacy:,}")
+    if legacy == 0:
+        print("✅ Nothing to migrate")
+        mongo.close()
+        return
+
+    # Only money fields may be legacy: then the dates are already BSON dates and
+    # the "before" query must use them too, or it matches nothing
+    day, dates_are_strings = sample_day(col)
+    before = collection_stats(db)
+    before["range_query_ms"], before["range_query_docs"] = time_range_query(col, day, as_string=dates_are_strings)
+
+    error_count = 0
+    modified = 0
+    try:
+        modified = migrate(col)
+    except Exception as e:
+        error_count += 1
+        print(f"❌ Migration failed: {e}")
+
+    after = collection_stats(db)
+    after["range_query_ms"], after["range_query_docs"] = time_range_query(col, day, as_string=False)
+    remaining = col.count_documents(legacy_filter())
+
+    print("\n" + "=" * 60)
+    print(f"{'':22}{'before':>14}{'after':>14}")
+    for key in ("size_mb", "avg_obj_size", "storage_mb", "index_mb", "range_query_ms", "range_query_docs"):
+        print(f"{key:22}{before[key]:>14}{after[key]:>14}")
+    print(f"Converted: {modified:,}  still legacy: {remaining:,}")
+    print("=" * 60)
+
+    record_db_metrics("mongodb", "mongo_type_migration", start, error_count=error_count,
+                      mismatch_count=remaining,
+                      details={"converted": modified, "query_day": day.date().isoformat(),
+                               "string_dates_before": dates_are_strings,
+                               "before": before, "after": after})
+    mongo.close()
+
+
+if __name__ == "__main__":
+    main()
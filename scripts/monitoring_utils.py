@@ -1,6 +1,12 @@
 import psutil
 import time
-from datetime import datetime
+import json
+import sys
+import queue
+import atexit
+import threading
+from collections import deque
+from datetime import datetime, timedelta
 import pymysql
 import os
 from dotenv import load_dotenv
@@ -12,6 +18,25 @@ MYSQL_USER = os.getenv("MYSQL_APP_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_APP_PASSWORD")
 MYSQL_DB = os.getenv("MYSQL_DB_NAME")
 
+# Metrics are queued and written by a background thread in multi-row INSERTs over one
+# connection, every METRICS_FLUSH_ROWS records or METRICS_FLUSH_SECONDS; 0 writes each inline
+METRICS_ASYNC = os.getenv("METRICS_ASYNC", "1") == "1"
+METRICS_FLUSH_ROWS = int(os.getenv("METRICS_FLUSH_ROWS", "200"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1.0"))
+METRICS_QUEUE_MAX = 100000
+
+# A background thread samples process and system resources every METRICS_SAMPLE_SECONDS
+# into a ring buffer (METRICS_SAMPLE_BUFFER samples); 0 disables it
+METRICS_SAMPLE_SECONDS = float(os.getenv("METRICS_SAMPLE_SECONDS", "0.25"))
+METRICS_SAMPLE_BUFFER = int(os.getenv("METRICS_SAMPLE_BUFFER", "4800"))
+
+INSERT_METRICS_SQL = """
+    INSERT INTO db_metrics
+    (db_type, operation, cpu_percent, mem_percent, avg_latency_ms, error_count, mismatch_count,
+     peak_rss_mb, details, recorded_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
 def get_conn():
     try:
         return pymysql.connect(
@@ -25,34 +50,259 @@ def get_conn():
         print(f"  Failed to connect to MySQL: {e}")
         return None
 
-def record_db_metrics(db_type, operation, start_time, error_count=0, mismatch_count=0):
-    """Record performance metrics to db_metrics table"""
+def get_peak_rss_mb():
+    """Peak resident memory of this process in MB (high-water mark, not current usage)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        # Windows has no resource module, psutil exposes the peak working set instead
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+class ResourceSampler:
+    """Ring buffer of process and system resource samples, taken by a daemon thread.
+
+    interval(start_time) answers instantly for the window from start_time to
+    now: it takes one more sample and diffs it against the last buffered sample
+    at or before start_time, instead of blocking like cpu_percent(interval=...).
+    When start_time is older than every buffered sample, the window starts at the
+    oldest one instead; interval() then reports "truncated" and the real "window_start".
+    """
+
+    def __init__(self, period=METRICS_SAMPLE_SECONDS, size=METRICS_SAMPLE_BUFFER):
+        self.period = period
+        self.process = psutil.Process()
+        self.cpus = psutil.cpu_count() or 1
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.samples.append(self.sample())
+        self.thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        system = psutil.cpu_times()
+        cpu = self.process.cpu_times()
+        ctx = self.process.num_ctx_switches()
+        try:
+            io = self.process.io_counters()
+            io = (io.read_bytes, io.write_bytes)
+        except (AttributeError, psutil.Error):
+            # Not available on macOS
+            io = None
+        idle = system.idle + getattr(system, "iowait", 0.0)
+        # Linux counts guest time in user time as well
+        total = sum(system) - getattr(system, "guest", 0.0) - getattr(system, "guest_nice", 0.0)
+        return {"t": time.time(), "sys_busy": total - idle, "sys_total": total,
+                "proc_cpu": cpu.user + cpu.system, "rss": self.process.memory_info().rss,
+                "io": io, "ctx": ctx.voluntary + ctx.involuntary}
+
+    def _run(self):
+        while True:
+            time.sleep(self.period)
+            try:
+                sample = self.sample()
+            except psutil.Error:
+                continue
+            with self.lock:
+                self.samples.append(sample)
+
+    def interval(self, start_time):
+        """Resource usage between start_time and now."""
+        end = self.sample()
+        with self.lock:
+            # Samples are in time order; the window starts at the last one not after start_time
+            first = self.samples[0]
+            window_rss = []
+            for sample in reversed(self.samples):
+                if sample["t"] <= start_time:
+                    first = sample
+                    break
+                window_rss.append(sample["rss"])
+        wall = max(end["t"] - first["t"], 1e-6)
+        sys_total = end["sys_total"] - first["sys_total"]
+        usage = {
+            "system_cpu_percent": 100.0 * (end["sys_busy"] - first["sys_busy"]) / sys_total if sys_total > 0 else 0.0,
+            # Share of the whole machine, comparable with the system figure
+            "process_cpu_percent": 100.0 * (end["proc_cpu"] - first["proc_cpu"]) / (wall * self.cpus),
+            "rss_mb": end["rss"] / (1024 * 1024),
+            "max_rss_mb": max(window_rss + [first["rss"], end["rss"]]) / (1024 * 1024),
+            "ctx_switches": end["ctx"] - first["ctx"],
+            "window_seconds": wall,
+            "window_start": first["t"],
+            "truncated": first["t"] > start_time,
+        }
+        if first["io"] and end["io"]:
+            usage["read_mb"] = (end["io"][0] - first["io"][0]) / (1024 * 1024)
+            usage["write_mb"] = (end["io"][1] - first["io"][1]) / (1024 * 1024)
+        return usage
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def get_resource_sampler():
+    """The process' ResourceSampler (None when disabled), started on first use (and again in a forked child)."""
+    global _sampler
+    if METRICS_SAMPLE_SECONDS <= 0:
+        return None
+    with _sampler_lock:
+        if _sampler is None or _sampler.pid != os.getpid():
+            _sampler = ResourceSampler()
+        return _sampler
+
+def resource_usage(start_time):
+    sampler = get_resource_sampler()
+    if sampler is None:
+        # System-wide CPU since the previous call, without blocking
+        return {"system_cpu_percent": psutil.cpu_percent(interval=None)}
+    return {name: round(value, 2) if isinstance(value, float) else value
+            for name, value in sampler.interval(start_time).items()}
+
+class MetricsSink:
+    """Background writer for db_metrics rows.
+
+    add() only enqueues. A daemon thread drains the queue and writes each batch
+    with one executemany (a single multi-row INSERT) over a persistent
+    connection, reconnecting when it drops. close() flushes what is left and is
+    registered with atexit, so a script's last metrics are not lost on exit.
+    """
+
+    def __init__(self, flush_rows=METRICS_FLUSH_ROWS, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=METRICS_QUEUE_MAX)
+        self.conn = None
+        self.pid = os.getpid()
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="metrics-sink", daemon=True)
+        self.thread.start()
+
+    def add(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until every record queued so far is written."""
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def close(self, timeout=10):
+        # Runs from atexit: never block on a full queue whose writer died or cannot reach the DB
+        try:
+            self.queue.put(None, timeout=timeout if self.thread.is_alive() else 0)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        if self.dropped:
+            print(f"  Metrics queue was full, {self.dropped} records dropped")
+
+    def _run(self):
+        while True:
+            row = self.queue.get()
+            if row is None:
+                self.queue.task_done()
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_seconds
+            stop = False
+            while len(batch) < self.flush_rows:
+                try:
+                    row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                self.queue.task_done()
+            if stop:
+                break
+        if self.conn:
+            self.conn.close()
+
+    def _write(self, rows):
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self.conn = get_conn()
+                    if not self.conn:
+                        return
+                with self.conn.cursor() as cur:
+                    cur.executemany(INSERT_METRICS_SQL, rows)
+                return
+            except Exception as e:
+                # A dropped connection gets one retry over a fresh one
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+                self.conn = None
+                if attempt:
+                    print(f"  Failed to record {len(rows)} metrics: {e}")
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_metrics_sink():
+    """The process' MetricsSink, started on first use (and again in a forked child)."""
+    global _sink
+    with _sink_lock:
+        if _sink is None or _sink.pid != os.getpid():
+            _sink = MetricsSink()
+            atexit.register(_sink.close)
+        return _sink
+
+def flush_metrics():
+    """Wait until queued metrics are in db_metrics (e.g. before reading the table)."""
+    if _sink is not None and _sink.pid == os.getpid():
+        _sink.flush()
+
+def write_metrics_row(row):
+    conn = get_conn()
+    if not conn:
+        return
+    with conn.cursor() as cur:
+        cur.execute(INSERT_METRICS_SQL, row)
+    conn.close()
+
+def record_db_metrics(db_type, operation, start_time, error_count=0, mismatch_count=0, details=None):
+    """Record performance metrics to db_metrics table
+
+    details is an optional dict of operation specific counters stored as JSON.
+    Process and system resource usage since start_time, read from the
+    ResourceSampler, is added to it as "resources"; cpu_percent stays the
+    system-wide figure. The row is queued for the background MetricsSink
+    unless METRICS_ASYNC=0.
+    """
     try:
-        conn = get_conn()
-        if not conn:
-            return
-        
         # Get system metrics
-        cpu = psutil.cpu_percent(interval=0.5)
+        usage = resource_usage(start_time)
+        cpu = usage["system_cpu_percent"]
         mem = psutil.virtual_memory().percent
+        peak_rss = get_peak_rss_mb()
         duration_ms = (time.time() - start_time) * 1000
-        
-        sql = """
-            INSERT INTO db_metrics 
-            (db_type, operation, cpu_percent, mem_percent, avg_latency_ms, error_count, mismatch_count, recorded_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-        """
-        
-        with conn.cursor() as cur:
-            cur.execute(sql, (db_type, operation, cpu, mem, duration_ms, error_count, mismatch_count))
-        
-        print(f"📊 Metrics: {db_type}.{operation} | CPU: {cpu:.1f}% | Mem: {mem:.1f}% | Latency: {duration_ms:.2f}ms")
-        
+        details_json = json.dumps({**(details or {}), "resources": usage}, default=str)
+
+        row = (db_type, operation, cpu, mem, duration_ms, error_count, mismatch_count,
+               peak_rss, details_json, datetime.now())
+        if METRICS_ASYNC:
+            get_metrics_sink().add(row)
+        else:
+            write_metrics_row(row)
+
+        process_cpu = f" (process {usage['process_cpu_percent']:.1f}%)" if "process_cpu_percent" in usage else ""
+        print(f"📊 Metrics: {db_type}.{operation} | CPU: {cpu:.1f}%{process_cpu} | Mem: {mem:.1f}% | "
+              f"Peak RSS: {peak_rss:.0f}MB | Latency: {duration_ms:.2f}ms")
+
         # Check for alerts
         check_alerts(cpu, duration_ms, mismatch_count)
-        
-        conn.close()
-        
+
     except Exception as e:
         print(f"  Failed to record metrics: {e}")
 
@@ -84,6 +334,7 @@ def log_alert(message):
 
 def get_metrics_summary():
     """Get recent metrics summary"""
+    flush_metrics()
     conn = get_conn()
     if not conn:
         return []
@@ -100,14 +351,16 @@ def get_metrics_summary():
             SUM(error_count) as total_errors,
             SUM(mismatch_count) as total_mismatches
         FROM db_metrics
-        WHERE recorded_at > NOW() - INTERVAL 1 HOUR
+        WHERE recorded_at > %s
         GROUP BY db_type, operation
         ORDER BY avg_latency DESC
     """
     
     try:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute(sql)
+            # recorded_at is the client's clock (rows can be written late by the sink),
+            # so the cutoff is too; the server's NOW() may be in another time zone
+            cur.execute(sql, (datetime.now() - timedelta(hours=1),))
             results = cur.fetchall()
         conn.close()
         return results
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Range-sharded parallel full sync: MySQL taxi_trips → MongoDB taxi_trips.
+
+The incremental sync (sync_mysql_to_mongo.py) is one process with one MySQL
+connection and one MongoClient, which makes the first full sync after a large
+ETL load take hours. This splits the trip_id space into SYNC_PROCESSES ranges
+and syncs each in its own worker process, with its own connections, trip_id
+keyset pages and checkpoint row in sync_shards.
+
+The coordinator (this process) starts the workers and watches their progress.
+When a worker finishes while others still have a lot left, it splits the
+straggler with the most trip_ids remaining: the straggler's range end is
+lowered and a new worker takes the upper half. Workers re-read their range end
+before every page and claim each fetched page under the lock the coordinator
+splits under, so a split never hands off trips of a page already fetched.
+
+Every shard records a sync_shard metric; the coordinator aggregates them into
+one sync_parallel metric. Once every shard is done, the incremental sync's
+watermark is moved to the time the run was planned (less SYNC_SETTLE_SECONDS),
+so sync_mysql_to_mongo.py carries on with changes made since. An interrupted
+run resumes its unfinished shards from their checkpoints.
+"""
+import os
+import time
+import queue
+import multiprocessing
+from datetime import datetime
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+from trip_buckets import SYNC_BUCKETS, BucketWriter
+from sync_mysql_to_mongo import (
+    MONGO_URI, MONGO_DB, SYNC_NAME, SYNC_PAGE_SIZE, SYNC_SETTLE_SECONDS, SYNC_INSERT_FAST_PATH,
+    get_mysql_conn, load_sync_state, save_sync_state, to_document, iter_batches, new_batch_sizer,
+    BatchWriter, empty_counts, add_counts, has_unique_trip_id_index
+)
+
+load_dotenv()
+
+SYNC_PROCESSES = int(os.getenv("SYNC_PROCESSES", "4"))
+# Only split a straggler with at least this many trip_ids left (the in-flight page is never split off)
+MIN_SPLIT_IDS = 4 * SYNC_PAGE_SIZE
+# Extra shard slots per process for straggler splits
+SPLITS_PER_PROCESS = 8
+PROGRESS_SECONDS = 10
+
+
+def mongo_client():
+    return MongoClient(MONGO_URI, serverSelectionTimeoutMS=60000, socketTimeoutMS=120000)
+
+
+# -----------------------------
+# Shard Checkpoints
+# -----------------------------
+def load_shards(conn, name=SYNC_NAME):
+    """Unfinished shards of an interrupted run."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT shard_id, range_start, range_end, next_trip_id, rows_synced, snapshot_at
+               FROM sync_shards WHERE sync_name = %s AND status <> 'done' ORDER BY shard_id""",
+            (name,)
+        )
+        return cur.fetchall()
+
+
+def plan_shards(conn, processes, name=SYNC_NAME):
+    """Split [MIN(trip_id), MAX(trip_id)] into equal ranges, one per process."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT MIN(trip_id) AS lo, MAX(trip_id) AS hi,
+                      NOW() - INTERVAL %s SECOND AS snapshot_at FROM taxi_trips""",
+            (SYNC_SETTLE_SECONDS,)
+        )
+        bounds = cur.fetchone()
+        cur.execute("DELETE FROM sync_shards WHERE sync_name = %s", (name,))
+    if bounds["lo"] is None:
+        return []
+
+    lo, hi = bounds["lo"], bounds["hi"] + 1
+    width = max(1, -(-(hi - lo) // processes))
+    shards = []
+    for shard_id, start in enumerate(range(lo, hi, width)):
+        shard = {"shard_id": shard_id, "range_start": start, "range_end": min(start + width, hi),
+                 "next_trip_id": start, "rows_synced": 0, "snapshot_at": bounds["snapshot_at"]}
+        insert_shard(conn, shard, name)
+        shards.append(shard)
+    return shards
+
+
+def insert_shard(conn, shard, name=SYNC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO sync_shards (sync_name, shard_id, range_start, range_end, next_trip_id,
+                                        rows_synced, status, snapshot_at)
+               VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s)""",
+            (name, shard["shard_id"], shard["range_start"], shard["range_end"], shard["next_trip_id"],
+             shard["rows_synced"], shard["snapshot_at"])
+        )
+
+
+def save_shard_progress(conn, shard_id, next_trip_id, rows_synced, status, name=SYNC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE sync_shards SET next_trip_id = %s, rows_synced = %s, status = %s
+               WHERE sync_name = %s AND shard_id = %s""",
+            (next_trip_id, rows_synced, status, name, shard_id)
+        )
+
+
+def save_shard_end(conn, shard_id, range_end, name=SYNC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE sync_shards SET range_end = %s WHERE sync_name = %s AND shard_id = %s",
+            (range_end, name, shard_id)
+        )
+
+
+def fetch_range(conn, after, end, limit):
+    """Next page of rows with after <= trip_id < end, in trip_id order."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT * FROM taxi_trips
+               WHERE trip_id >= %s AND trip_id < %s
+               ORDER BY trip_id
+               LIMIT %s""",
+            (after, end, limit)
+        )
+        return cur.fetchall()
+
+
+# -----------------------------
+# Worker Process
+# -----------------------------
+def run_shard(shard, ends, progress, rows_done, new_after, results):
+    """Sync one trip_id range; ends[shard_id] may be lowered by the coordinator while this runs."""
+    start_time = time.time()
+    slot = shard["shard_id"]
+    tag = f"[shard {slot}]"
+    next_id = shard["next_trip_id"]
+    rows_before = shard["rows_synced"]
+    rows = 0
+    error_count = 0
+    error = None
+
+    conn = get_mysql_conn()
+    mongo = mongo_client()
+    sizer = new_batch_sizer()
+    buckets = BucketWriter(mongo[MONGO_DB]) if SYNC_BUCKETS else None
+    writer = BatchWriter(mongo[MONGO_DB]["taxi_trips"], sizer, new_after, buckets)
+    synced_at = datetime.now()
+    save_shard_progress(conn, slot, next_id, rows_before, "running")
+
+    try:
+        while next_id < ends[slot]:
+            page = fetch_range(conn, next_id, ends[slot], SYNC_PAGE_SIZE)
+            # Pages count rows, not ids: drop rows a split handed off while this page was
+            # read, and claim the rest so a later split starts above them
+            with ends.get_lock():
+                page = [row for row in page if row["trip_id"] < ends[slot]]
+                if page:
+                    progress[slot] = page[-1]["trip_id"] + 1
+            if not page:
+                break
+            failed = 0
+            for batch in iter_batches((to_document(row, synced_at) for row in page), sizer):
+                failed += writer.write(batch)["failed"]
+            if failed:
+                # Checkpoint stays before this page so a rerun retries it
+                error_count += 1
+                error = f"{failed} documents failed"
+                break
+            next_id = page[-1]["trip_id"] + 1
+            rows += len(page)
+            progress[slot] = next_id
+            rows_done[slot] = rows
+            save_shard_progress(conn, slot, next_id, rows_before + rows, "running")
+    except Exception as e:
+        error_count += 1
+        error = str(e)
+
+    end = ends[slot]
+    if not error_count:
+        save_shard_progress(conn, slot, max(next_id, end), rows_before + rows, "done")
+    seconds = time.time() - start_time
+    print(f"{tag} trip_id {shard['range_start']:,}–{end - 1:,}: {rows:,} rows in {seconds:.1f}s"
+          + (f" ❌ {error}" if error else ""))
+
+    summary = {"shard_id": slot, "range_start": shard["range_start"], "range_end": end, "rows": rows,
+               "seconds": round(seconds, 2), "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+               "errors": error_count, "error": error, **writer.summary(),
+               "buckets": buckets.summary() if buckets else None}
+    record_db_metrics("mongodb", "sync_shard", start_time, error_count=error_count, details=summary)
+    results.put(summary)
+    if buckets:
+        buckets.close()
+    conn.close()
+    mongo.close()
+
+
+# -----------------------------
+# Coordinator
+# -----------------------------
+class Coordinator:
+    def __init__(self, conn, shards, processes, new_after):
+        self.conn = conn
+        self.processes = processes
+        self.new_after = new_after
+        self.ctx = multiprocessing.get_context("spawn")
+
+        slots = max(s["shard_id"] for s in shards) + 1 + processes * SPLITS_PER_PROCESS
+        self.ends = self.ctx.Array("q", slots)
+        self.progress = self.ctx.Array("q", slots)
+        self.rows_done = self.ctx.Array("q", slots)
+        self.results = self.ctx.Queue()
+        self.next_slot = slots - processes * SPLITS_PER_PROCESS
+        for s in shards:
+            self.ends[s["shard_id"]] = s["range_end"]
+            self.progress[s["shard_id"]] = s["next_trip_id"]
+
+        self.pending = list(shards)
+        self.running = {}
+        self.summaries = []
+        self.rebalances = 0
+        self.crashed = 0
+
+    def _start(self, shard):
+        proc = self.ctx.Process(
+            target=run_shard,
+            args=(shard, self.ends, self.progress, self.rows_done, self.new_after, self.results),
+            name=f"sync-shard-{shard['shard_id']}"
+        )
+        proc.start()
+        self.running[shard["shard_id"]] = (proc, shard)
+
+    def _split_straggler(self):
+        """Hand the upper half of the running shard with the most trip_ids left to a new shard."""
+        if self.next_slot >= len(self.ends) or not self.running:
+            return False
+        # Workers claim fetched pages under this lock: progress already covers any page in flight
+        with self.ends.get_lock():
+            remaining = {slot: self.ends[slot] - self.progress[slot] for slot in self.running}
+            slot = max(remaining, key=remaining.get)
+            if remaining[slot] < MIN_SPLIT_IDS:
+                return False
+
+            old_end = self.ends[slot]
+            mid = self.progress[slot] + remaining[slot] // 2
+            new = {"shard_id": self.next_slot, "range_start": mid, "range_end": old_end, "next_trip_id": mid,
+                   "rows_synced": 0, "snapshot_at": self.running[slot][1]["snapshot_at"]}
+            # New shard first: a crash in between leaves an overlap (re-upserted), never a gap
+            insert_shard(self.conn, new)
+            self.ends[new["shard_id"]] = old_end
+            self.progress[new["shard_id"]] = mid
+            self.ends[slot] = mid
+        save_shard_end(self.conn, slot, mid)
+        self.next_slot += 1
+        self.rebalances += 1
+        self.pending.append(new)
+        print(f"⚖️  Straggler shard {slot}: trip_id {mid:,}–{old_end - 1:,} handed to shard {new['shard_id']}")
+        return True
+
+    def _collect(self, timeout):
+        try:
+            self.summaries.append(self.results.get(timeout=timeout))
+        except queue.Empty:
+            pass
+
+    def run(self):
+        start = time.time()
+        last_progress = start
+        while self.pending or self.running:
+            while self.pending and len(self.running) < self.processes:
+                self._start(self.pending.pop(0))
+            self._collect(timeout=1)
+
+            for slot, (proc, shard) in list(self.running.items()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                del self.running[slot]
+                if proc.exitcode != 0:
+                    self.crashed += 1
+                    print(f"❌ Shard {slot} worker exited with code {proc.exitcode}")
+
+            while not self.pending and len(self.running) < self.processes and self._split_straggler():
+                pass
+
+            if time.time() - last_progress >= PROGRESS_SECONDS:
+                rows = sum(self.rows_done)
+                elapsed = time.time() - start
+                print(f"… {rows:,} rows in {elapsed:.0f}s ({rows / elapsed:,.0f} rows/s), "
+                      f"{len(self.running)} running, {len(self.pending)} pending")
+                last_progress = time.time()
+
+        # Summaries of workers that finished during the last poll
+        while True:
+            try:
+                self.summaries.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        return time.time() - start
+
+
+def summarize(summaries, wall_seconds, coordinator):
+    totals = empty_counts()
+    for s in summaries:
+        add_counts(totals, {k: s[k] for k in totals})
+    rows = sum(s["rows"] for s in summaries)
+    durations = [s["seconds"] for s in summaries if s["rows"]]
+    errors = sum(s["errors"] for s in summaries) + coordinator.crashed
+    return {
+        "processes": coordinator.processes,
+        "shards": len(summaries),
+        "rebalances": coordinator.rebalances,
+        "rows": rows,
+        "wall_seconds": round(wall_seconds, 2),
+        "rows_per_sec": round(rows / wall_seconds, 1) if wall_seconds > 0 else None,
+        "slowest_shard_seconds": max(durations) if durations else None,
+        "fastest_shard_seconds": min(durations) if durations else None,
+        "errors": errors,
+        **totals,
+        "per_shard": [{k: s[k] for k in ("shard_id", "range_start", "range_end", "rows", "seconds")}
+                      for s in sorted(summaries, key=lambda s: s["shard_id"])],
+    }
+
+
+def main():
+    start_time = time.time()
+    print("=" * 60)
+    print(f"🔀 Parallel MySQL → MongoDB sync ({SYNC_PROCESSES} processes)")
+    print("=" * 60)
+
+    conn = get_mysql_conn()
+    shards = load_shards(conn)
+    if shards:
+        print(f"Resuming {len(shards)} unfinished shards")
+    else:
+        shards = plan_shards(conn, SYNC_PROCESSES)
+        if not shards:
+            print("taxi_trips is empty; nothing to sync")
+            conn.close()
+            return
+        print(f"Planned {len(shards)} shards over trip_id "
+              f"{shards[0]['range_start']:,}–{shards[-1]['range_end'] - 1:,}")
+    snapshot_at = shards[0]["snapshot_at"]
+    planned_max = max(s["range_end"] for s in shards) - 1
+
+    state = load_sync_state(conn)
+    new_after = state["max_trip_id"] if SYNC_INSERT_FAST_PATH else None
+    if new_after is not None:
+        mongo = mongo_client()
+        if not has_unique_trip_id_index(mongo[MONGO_DB]["taxi_trips"]):
+            print("⚠️  No unique trip_id index on MongoDB taxi_trips (run mongo/setup_mongo.py); upserting everything")
+            new_after = None
+        mongo.close()
+
+    coordinator = Coordinator(conn, shards, SYNC_PROCESSES, new_after)
+    wall = coordinator.run()
+    summary = summarize(coordinator.summaries, wall, coordinator)
+
+    unfinished = load_shards(conn)
+    if not unfinished and not summary["errors"]:
+        # Everything up to the snapshot is in MongoDB; the incremental sync continues from there
+        save_sync_state(conn, {"last_updated_at": snapshot_at, "last_trip_id": 0,
+                               "max_trip_id": max(state["max_trip_id"], planned_max),
+                               "rows_synced": state["rows_synced"] + summary["rows"]})
+        print(f"Incremental sync watermark moved to {snapshot_at}")
+    else:
+        print(f"⚠️  {len(unfinished)} shards unfinished; rerun to resume them")
+
+    print("\n" + "=" * 60)
+    print(f"Rows: {summary['rows']:,} in {summary['wall_seconds']}s ({summary['rows_per_sec']} rows/s) | "
+          f"shards {summary['shards']}, rebalances {summary['rebalances']}, errors {summary['errors']}")
+    if summary["slowest_shard_seconds"]:
+        print(f"Shard time: fastest {summary['fastest_shard_seconds']}s, slowest {summary['slowest_shard_seconds']}s")
+    print("=" * 60)
+
+    record_db_metrics("mongodb", "sync_parallel", start_time, error_count=summary["errors"],
+                      details={**summary, "unfinished_shards": len(unfinished), "snapshot_at": str(snapshot_at)})
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Full-table MySQL ↔ MongoDB reconciliation with range checksums (Merkle style).
+
+Both stores compute the same digest of every trip_id range: COUNT and two sums
+of a per-row hash of the synced fields (ids, times, locations, codes, distance
+and every money column in cents), mod a prime, with two coefficient sets.
+MySQL computes it with one GROUP BY and MongoDB with one aggregation pipeline,
+each returning the digests of RECONCILE_FANOUT equal sub-ranges at once.
+
+Only sub-ranges whose digests differ are split again. Ranges of at most
+RECONCILE_LEAF_IDS trip_ids are compared row by row. A table that is fully in
+sync therefore costs one aggregate query per store, whatever its size.
+
+Out-of-sync trip_ids are written to logs/sync_issues.csv:
+- missing: in MySQL, not in MongoDB
+- extra: in MongoDB, not in MySQL
+- mismatch: in both, with different values
+"""
+import os
+import time
+from collections import Counter
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+from validate_sync import get_mysql_conn, write_issue_file, ISSUE_FILE
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
+
+RECONCILE_FANOUT = int(os.getenv("RECONCILE_FANOUT", "16"))
+RECONCILE_LEAF_IDS = int(os.getenv("RECONCILE_LEAF_IDS", "512"))
+
+# Row hashes are reduced mod a 31-bit prime, so sums over billions of rows fit in 64 bits
+PRIME = 2147483647
+COEFFICIENTS = (
+    [1000003, 998497, 996361, 995009, 993107, 991381, 989687, 987971, 986267, 984583,
+     982981, 981373, 979717, 978079, 976411, 974803, 973129, 971521, 969851],
+    [524287, 522737, 521201, 519691, 518173, 516679, 515197, 513739, 512251, 510751,
+     509297, 507827, 506381, 504893, 503441, 501997, 500567, 499133, 497711],
+)
+
+
+def _int_sql(column):
+    return f"COALESCE({column}, -1)"
+
+
+def _int_mongo(field):
+    return {"$convert": {"input": f"${field}", "to": "long", "onError": -1, "onNull": -1}}
+
+
+def _cents_sql(column):
+    return f"COALESCE(CAST(ROUND({column} * 100) AS SIGNED), -1)"
+
+
+def _cents_mongo(field):
+    # Decimal128 (or legacy double) amounts; $round makes 10.5 * 100 = 1049.999... a whole 1050
+    return {"$ifNull": [{"$toLong": {"$round": [{"$multiply": [f"${field}", 100]}, 0]}}, -1]}
+
+
+def _seconds_sql(column):
+    # TIMESTAMPDIFF is independent of the session time zone, unlike UNIX_TIMESTAMP
+    return f"COALESCE(TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', {column}), -1)"
+
+
+def _seconds_mongo(field):
+    # Naive datetimes are stored as UTC BSON dates; $toDate also reads legacy ISO strings
+    return {"$ifNull": [{"$toLong": {"$floor": {"$divide": [{"$toLong": {"$toDate": f"${field}"}}, 1000]}}}, -1]}
+
+
+# Synced fields as (MySQL expression, MongoDB expression), both yielding the same integer
+HASHED_FIELDS = [
+    ("trip_id", "$trip_id"),
+    (_int_sql("IF(vendor_id REGEXP '^-?[0-9]+$', CAST(vendor_id AS SIGNED), NULL)"), _int_mongo("vendor_id")),
+    (_seconds_sql("pickup_datetime"), _seconds_mongo("pickup_datetime")),
+    (_seconds_sql("dropoff_datetime"), _seconds_mongo("dropoff_datetime")),
+    (_int_sql("passenger_count"), _int_mongo("passenger_count")),
+    # CAST keeps the MySQL side in integer arithmetic (FLOOR of a DOUBLE is a DOUBLE)
+    (_int_sql("CAST(FLOOR(trip_distance * 1000) AS SIGNED)"),
+     {"$ifNull": [{"$toLong": {"$floor": {"$multiply": ["$trip_distance", 1000]}}}, -1]}),
+    (_int_sql("rate_code_id"), _int_mongo("rate_code_id")),
+    (_int_sql("pu_location_id"), _int_mongo("pu_location_id")),
+    (_int_sql("do_location_id"), _int_mongo("do_location_id")),
+    (_int_sql("payment_type"), _int_mongo("payment_type")),
+] + [
+    (_cents_sql(name), _cents_mongo(name))
+    for name in ["fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+                 "improvement_surcharge", "total_amount", "congestion_surcharge", "airport_fee"]
+]
+
+
+def row_hash_sql(coefficients):
+    terms = " + ".join(f"{sql} * {c}" for (sql, _), c in zip(HASHED_FIELDS, coefficients))
+    return f"MOD({terms}, {PRIME})"
+
+
+def row_hash_mongo(coefficients):
+    terms = [{"$multiply": [{"$toLong": mongo}, c]} for (_, mongo), c in zip(HASHED_FIELDS, coefficients)]
+    return {"$mod": [{"$add": terms}, PRIME]}
+
+
+H1_SQL, H2_SQL = (row_hash_sql(c) for c in COEFFICIENTS)
+H1_MONGO, H2_MONGO = (row_hash_mongo(c) for c in COEFFICIENTS)
+
+
+# -----------------------------
+# Range Digests
+# -----------------------------
+def mysql_digests(conn, lo, hi, width):
+    """{sub-range index: (count, sum1, sum2)} of lo <= trip_id < hi in sub-ranges of width."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT FLOOR((trip_id - %s) / %s) AS part, COUNT(*), SUM({H1_SQL}), SUM({H2_SQL})
+                FROM taxi_trips WHERE trip_id >= %s AND trip_id < %s
+                GROUP BY part""",
+            (lo, width, lo, hi)
+        )
+        return {int(part): (int(n), int(s1), int(s2)) for part, n, s1, s2 in cur.fetchall()}
+
+
+def mongo_digests(col, lo, hi, width):
+    pipeline = [
+        {"$match": {"trip_id": {"$gte": lo, "$lt": hi}}},
+        {"$group": {
+            "_id": {"$floor": {"$divide": [{"$subtract": ["$trip_id", lo]}, width]}},
+            "n": {"$sum": 1}, "s1": {"$sum": H1_MONGO}, "s2": {"$sum": H2_MONGO},
+        }},
+    ]
+    return {int(d["_id"]): (int(d["n"]), int(d["s1"]), int(d["s2"]))
+            for d in col.aggregate(pipeline, allowDiskUse=True)}
+
+
+def mysql_rows(conn, lo, hi):
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT trip_id, {H1_SQL}, {H2_SQL} FROM taxi_trips WHERE trip_id >= %s AND trip_id < %s",
+            (lo, hi)
+        )
+        return {trip_id: (int(h1), int(h2)) for trip_id, h1, h2 in cur.fetchall()}
+
+
+def mongo_rows(col, lo, hi):
+    pipeline = [
+        {"$match": {"trip_id": {"$gte": lo, "$lt": hi}}},
+        {"$project": {"_id": 0, "trip_id": 1, "h1": H1_MONGO, "h2": H2_MONGO}},
+    ]
+    return {d["trip_id"]: (int(d["h1"]), int(d["h2"])) for d in col.aggregate(pipeline)}
+
+
+def id_bounds(conn, col):
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(trip_id), MAX(trip_id) FROM taxi_trips")
+        bounds = [b for b in cur.fetchone() if b is not None]
+    for direction in (1, -1):
+        doc = col.find_one({}, {"trip_id": 1}, sort=[("trip_id", direction)])
+        if doc:
+            bounds.append(doc["trip_id"])
+    if not bounds:
+        return None
+    return min(bounds), max(bounds) + 1
+
+
+def reconcile(conn, col, lo, hi, stats):
+    """Yield (trip_id, issue) for every out-of-sync trip in [lo, hi)."""
+    ranges = [(lo, hi)]
+    while ranges:
+        stats["levels"] += 1
+        differing = []
+        for a, b in ranges:
+            if b - a <= RECONCILE_LEAF_IDS:
+                stats["leaf_ranges"] += 1
+                stats["queries"] += 2
+                mine, theirs = mysql_rows(conn, a, b), mongo_rows(col, a, b)
+                stats["rows_compared"] += len(mine.keys() | theirs.keys())
+                for trip_id in mine.keys() | theirs.keys():
+                    if trip_id not in theirs:
+                        yield trip_id, "missing"
+                    elif trip_id not in mine:
+                        yield trip_id, "extra"
+                    elif mine[trip_id] != theirs[trip_id]:
+                        yield trip_id, "mismatch"
+                continue
+
+            width = -(-(b - a) // RECONCILE_FANOUT)
+            stats["queries"] += 2
+            stats["ranges_checked"] += 1
+            mine, theirs = mysql_digests(conn, a, b, width), mongo_digests(col, a, b, width)
+            for part in sorted(mine.keys() | theirs.keys()):
+                if mine.get(part) != theirs.get(part):
+                    differing.append((a + part * width, min(a + (part + 1) * width, b)))
+        ranges = differing
+
+
+def main():
+    start = time.time()
+    print("=" * 60)
+    print("🌳 MySQL ↔ MongoDB range checksum reconciliation")
+    print("=" * 60)
+
+    conn = get_mysql_conn()
+    mongo = MongoClient(MONGO_URI)
+    col = mongo[MONGO_DB]["taxi_trips"]
+
+    bounds = id_bounds(conn, col)
+    if bounds is None:
+        print("Both stores are empty")
+        conn.close()
+        mongo.close()
+        return
+
+    stats = {"levels": 0, "queries": 0, "ranges_checked": 0, "leaf_ranges": 0, "rows_compared": 0}
+    issues = list(reconcile(conn, col, bounds[0], bounds[1], stats))
+    counts = Counter(issue for _, issue in issues)
+    write_issue_file(issues)
+    elapsed = time.time() - start
+
+    print(f"trip_id {bounds[0]:,}–{bounds[1] - 1:,}: {stats['queries']} queries over {stats['levels']} levels, "
+          f"{stats['rows_compared']:,} rows compared individually, {elapsed:.1f}s")
+    print(f"✗ Missing in MongoDB: {counts['missing']}")
+    print(f"✗ Extra in MongoDB:   {counts['extra']}")
+    print(f"✗ Mismatched:         {counts['mismatch']}")
+    if issues:
+        print(f"Out-of-sync trip_ids written to {ISSUE_FILE}")
+
+    record_db_metrics("mysql", "reconcile", start, error_count=0, mismatch_count=len(issues),
+                      details={**stats, **{k: counts[k] for k in ("missing", "extra", "mismatch")},
+                               "fanout": RECONCILE_FANOUT, "leaf_ids": RECONCILE_LEAF_IDS})
+    conn.close()
+    mongo.close()
+
+    if issues:
+        print(f"\n⚠️  Reconciliation found {len(issues)} out-of-sync trips")
+        exit(1)
+    print("\n✅ Reconciliation PASSED - every range matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Targeted repair of the trips found out of sync by validation.
+
+validate_sync.py (batch or stream mode) and reconcile_sync.py write the
+trip_ids they found missing, extra or mismatched to logs/sync_issues.csv.
+This script re-syncs only those trips, REPAIR_BATCH at a time:
+- one MySQL IN (...) query fetches the current rows
+- trips still in MySQL are upserted into MongoDB, trips gone from MySQL are
+  deleted, in one unordered bulk write (hourly buckets follow, as in the sync)
+- the repaired documents are read back and compared column by column
+
+The cost scales with the number of issues, not with the table. Trips that are
+still out of sync afterwards are written back to the issue file, so a rerun
+retries only those.
+"""
+import os
+import time
+from collections import Counter
+from datetime import datetime
+import pymysql
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+from sync_mysql_to_mongo import to_document
+from trip_buckets import SYNC_BUCKETS, BucketWriter
+from validate_sync import (get_mysql_conn, read_issue_file, write_issue_file, values_match,
+                           COLUMN_RULES, ISSUE_FILE)
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
+
+REPAIR_BATCH = int(os.getenv("REPAIR_BATCH", "1000"))
+
+
+def fetch_rows(conn, trip_ids):
+    """Current MySQL rows of trip_ids, keyed by trip_id (absent trips are left out)."""
+    placeholders = ",".join(["%s"] * len(trip_ids))
+    with conn.cursor(pymysql.cursors.DictCursor) as cur:
+        cur.execute(f"SELECT * FROM taxi_trips WHERE trip_id IN ({placeholders})", trip_ids)
+        return {row["trip_id"]: row for row in cur.fetchall()}
+
+
+def in_sync(row, doc):
+    if row is None or doc is None:
+        return row is None and doc is None
+    return all(values_match(rule, row[name], doc.get(name)) for name, rule in COLUMN_RULES.items())
+
+
+def repair_batch(col, conn, trip_ids, buckets, synced_at, stats):
+    """Re-sync one batch of trip_ids; returns the ids still out of sync."""
+    rows = fetch_rows(conn, trip_ids)
+    docs = {trip_id: to_document(row, synced_at) for trip_id, row in rows.items()}
+    deleted = [trip_id for trip_id in trip_ids if trip_id not in rows]
+    ops = [UpdateOne({"trip_id": trip_id}, {"$set": doc}, upsert=True) for trip_id, doc in docs.items()]
+    ops += [DeleteOne({"trip_id": trip_id}) for trip_id in deleted]
+
+    marker = buckets.mark(trip_ids) if buckets else None
+    previous = buckets.previous(col, trip_ids) if buckets else None
+    try:
+        result = col.bulk_write(ops, ordered=False)
+    except PyMongoError as e:
+        print(f"❌ Repair write of {len(ops)} trips failed: {e}")
+        stats["errors"] += 1
+        return list(trip_ids)
+    if buckets:
+        buckets.apply(list(docs.values()), previous, deleted_ids=deleted, markers=[marker])
+    stats["upserted"] += result.upserted_count
+    stats["modified"] += result.modified_count
+    stats["deleted"] += result.deleted_count
+
+    # Re-verify only these trips, against the MySQL rows just written
+    projection = {name: 1 for name in COLUMN_RULES}
+    projection.update({"_id": 0, "trip_id": 1})
+    stored = {doc["trip_id"]: doc for doc in col.find({"trip_id": {"$in": list(trip_ids)}}, projection)}
+    return [trip_id for trip_id in trip_ids if not in_sync(rows.get(trip_id), stored.get(trip_id))]
+
+
+def main():
+    start = time.time()
+    issues = read_issue_file()
+    if not issues:
+        print(f"Nothing to repair ({ISSUE_FILE} lists no out-of-sync trips)")
+        return
+
+    kinds = Counter(issues.values())
+    print(f"🔧 Repairing {len(issues)} trips from {ISSUE_FILE} "
+          f"({kinds['missing']} missing, {kinds['extra']} extra, {kinds['mismatch']} mismatched)")
+
+    conn = get_mysql_conn()
+    mongo = MongoClient(MONGO_URI)
+    db = mongo[MONGO_DB]
+    col = db["taxi_trips"]
+    buckets = BucketWriter(db) if SYNC_BUCKETS else None
+    synced_at = datetime.now()
+
+    stats = {"upserted": 0, "modified": 0, "deleted": 0, "errors": 0, "batches": 0}
+    trip_ids = sorted(issues)
+    remaining = []
+    for i in range(0, len(trip_ids), REPAIR_BATCH):
+        remaining += repair_batch(col, conn, trip_ids[i:i + REPAIR_BATCH], buckets, synced_at, stats)
+        stats["batches"] += 1
+
+    write_issue_file([(trip_id, issues[trip_id]) for trip_id in remaining])
+    elapsed = time.time() - start
+    repaired = len(trip_ids) - len(remaining)
+
+    print(f"✓ Upserted {stats['upserted']} missing, rewrote {stats['modified']} mismatched, "
+          f"deleted {stats['deleted']} extra in {stats['batches']} batches ({elapsed:.1f}s)")
+    print(f"✓ Verified in sync: {repaired}/{len(trip_ids)}")
+
+    record_db_metrics("mongodb", "sync_repair", start, error_count=stats["errors"],
+                      mismatch_count=len(remaining),
+                      details={**stats, "trips": len(trip_ids), "repaired": repaired,
+                               "still_out_of_sync": len(remaining),
+                               **{k: kinds[k] for k in ("missing", "extra", "mismatch")},
+                               "buckets": buckets.summary() if buckets else None})
+    if buckets:
+        buckets.close()
+    conn.close()
+    mongo.close()
+
+    if remaining:
+        print(f"\n⚠️  {len(remaining)} trips still out of sync, left in {ISSUE_FILE}")
+        exit(1)
+    print("\n✅ Repair complete - every listed trip verified in sync")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,8 @@ def main():
         cur.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
         cur.execute(f"CREATE USER IF NOT EXISTS '{APP_USER}'@'%' IDENTIFIED BY '{APP_PASSWORD}'")
         cur.execute(f"GRANT ALL PRIVILEGES ON {DB_NAME}.* TO '{APP_USER}'@'%'")
+        # Global privileges for the binlog CDC (cdc_replicator.py)
+        cur.execute(f"GRANT REPLICATION CLIENT, REPLICATION SLAVE ON *.* TO '{APP_USER}'@'%'")
         cur.execute("FLUSH PRIVILEGES")
     root_conn.close()
 
@@ -1,4 +1,5 @@
 import os
+import sys
 import pymysql
 from dotenv import load_dotenv
 
@@ -20,7 +21,34 @@ def get_conn():
         autocommit=True
     )
 
-def run_test_file(conn, filename):
+def count_partitions(conn, table):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+        """, (table,))
+        return cur.fetchone()[0]
+
+def report_explain(conn, cursor, results, failures):
+    """Print EXPLAIN rows and check that partitioned tables were pruned; failed checks go to failures"""
+    columns = [d[0] for d in cursor.description]
+    for row in results:
+        plan = dict(zip(columns, row))
+        print(f"table={plan.get('table')} partitions={plan.get('partitions')} type={plan.get('type')} "
+              f"key={plan.get('key')} rows={plan.get('rows')}")
+
+        total = count_partitions(conn, plan.get('table')) if plan.get('table') else 0
+        if total == 0:
+            continue
+        used = len(plan['partitions'].split(',')) if plan.get('partitions') else 0
+        if used < total:
+            print(f"PASS: partition pruning reads {used} of {total} partitions")
+        else:
+            message = f"no partition pruning on {plan.get('table')} ({used} of {total} partitions)"
+            print(f"FAIL: {message}")
+            failures.append(message)
+
+def run_test_file(conn, filename, failures):
     filepath = f"{TEST_DIR}/{filename}"
     
     if not os.path.exists(filepath):
@@ -44,6 +72,10 @@ def run_test_file(conn, filename):
             cursor.execute(statement)
             results = cursor.fetchall()
             
+            if statement.upper().startswith('EXPLAIN'):
+                report_explain(conn, cursor, results, failures)
+                continue
+            
             for row in results:
                 print(row[0] if len(row) == 1 else row)
         
@@ -63,12 +95,19 @@ def main():
         "test_performance.sql"
     ]
     
+    failures = []
     for test_file in test_files:
-        run_test_file(conn, test_file)
+        run_test_file(conn, test_file, failures)
     
     conn.close()
     
     print("\n" + "="*60)
+    if failures:
+        print(f" {len(failures)} checks failed:")
+        for message in failures:
+            print(f"   - {message}")
+        print("="*60)
+        sys.exit(1)
     print(" All tests completed!")
     print("="*60)
 
@@ -1,10 +1,18 @@
 import os
+import queue
+import threading
 import pymysql
 import time
+from datetime import datetime
 from decimal import Decimal
-from pymongo import MongoClient, UpdateOne
+import bson
+from bson.decimal128 import Decimal128
+from pymongo import MongoClient, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from dotenv import load_dotenv
-from monitoring_utils import record_db_metrics
+from monitoring_utils import record_db_metrics, get_peak_rss_mb
+from batch_sizer import AdaptiveBatchSizer, split_batch
+from trip_buckets import SYNC_BUCKETS, BucketWriter
 
 load_dotenv()
 
@@ -17,17 +25,57 @@ MONGO_URI = os.getenv("MONGODB_URI")
 MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
 
 # ⚡ Batch size for MongoDB bulk write (avoid connection closed errors)
-BATCH_SIZE = 5000
+# Starting size; SYNC_ADAPTIVE_BATCHES lets it adapt between SYNC_BATCH_MIN and
+# SYNC_BATCH_MAX to the observed write rate and latency (see batch_sizer.py)
+BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "5000"))
+SYNC_ADAPTIVE_BATCHES = os.getenv("SYNC_ADAPTIVE_BATCHES", "1") == "1"
+SYNC_BATCH_MIN = int(os.getenv("SYNC_BATCH_MIN", "500"))
+SYNC_BATCH_MAX = int(os.getenv("SYNC_BATCH_MAX", "50000"))
+SYNC_TARGET_BATCH_SECONDS = float(os.getenv("SYNC_TARGET_BATCH_SECONDS", "2.0"))
+
+# Incremental sync: rows are read in (updated_at, trip_id) keyset pages after the
+# watermark stored in sync_state. Rows updated in the last SYNC_SETTLE_SECONDS are
+# left for the next run, so a transaction still open when the page is read (its rows
+# carry an older updated_at once committed) cannot end up behind the watermark.
+SYNC_NAME = "taxi_trips"
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "10000"))
+SYNC_SETTLE_SECONDS = int(os.getenv("SYNC_SETTLE_SECONDS", "10"))
+# Stop after this many rows per run (0 = drain the whole backlog)
+SYNC_MAX_ROWS = int(os.getenv("SYNC_MAX_ROWS", "0"))
+# How rows are streamed: "keyset" (one LIMIT page in memory at a time) or
+# "server" (a single unbuffered query on an SSDictCursor)
+SYNC_CURSOR = os.getenv("SYNC_CURSOR", "keyset")
+
+# Pipelined mode (SYNC_WRITERS > 1): a fetch thread, the transform stage and
+# SYNC_WRITERS concurrent bulk writers connected by queues of SYNC_QUEUE_DEPTH items
+SYNC_WRITERS = int(os.getenv("SYNC_WRITERS", "1"))
+SYNC_QUEUE_DEPTH = int(os.getenv("SYNC_QUEUE_DEPTH", "4"))
+# Rows handed from the fetch thread to the transform stage per queue item
+FETCH_BLOCK = 1000
+
+# Insert trips newer than the watermark's max_trip_id instead of upserting them
+SYNC_INSERT_FAST_PATH = os.getenv("SYNC_INSERT_FAST_PATH", "1") == "1"
+EPOCH = datetime(1970, 1, 1)
+
+# MongoDB bulk write limits: 16 MB per BSON message batch and 100,000 operations
+MONGO_MAX_BATCH_BYTES = 16 * 1024 * 1024
+MONGO_MAX_BATCH_OPS = 100000
+
+
+def new_batch_sizer():
+    return AdaptiveBatchSizer("sync_batch", BATCH_SIZE, SYNC_BATCH_MIN, SYNC_BATCH_MAX,
+                              SYNC_TARGET_BATCH_SECONDS, max_bytes=MONGO_MAX_BATCH_BYTES,
+                              max_ops=MONGO_MAX_BATCH_OPS, adaptive=SYNC_ADAPTIVE_BATCHES)
 
 
 # -----------------------------
-# Convert Decimal → float and datetime → ISO
+# Convert Decimal → Decimal128, datetime stays a BSON date
 # -----------------------------
 def convert_value(val):
+    # DECIMAL(10,2) money stays exact; dates are 8 byte BSON dates that sort and
+    # aggregate ($dateTrunc, $hour) natively instead of ISO strings
     if isinstance(val, Decimal):
-        return float(val)
-    if hasattr(val, "isoformat"):
-        return val.isoformat()
+        return Decimal128(val)
     return val
 
 
@@ -42,6 +90,536 @@ def get_mysql_conn():
     )
 
 
+# -----------------------------
+# Sync State (watermark)
+# -----------------------------
+def load_sync_state(conn, name=SYNC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT last_updated_at, last_trip_id, max_trip_id, rows_synced FROM sync_state WHERE sync_name = %s",
+            (name,)
+        )
+        state = cur.fetchone()
+    return state or {"last_updated_at": EPOCH, "last_trip_id": 0, "max_trip_id": 0, "rows_synced": 0}
+
+
+def save_sync_state(conn, state, name=SYNC_NAME):
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO sync_state (sync_name, last_updated_at, last_trip_id, max_trip_id, rows_synced)
+               VALUES (%s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE last_updated_at = VALUES(last_updated_at),
+                   last_trip_id = VALUES(last_trip_id), max_trip_id = VALUES(max_trip_id),
+                   rows_synced = VALUES(rows_synced)""",
+            (name, state["last_updated_at"], state["last_trip_id"], state["max_trip_id"], state["rows_synced"])
+        )
+
+
+def start_key(state):
+    """Keyset position to read from: the watermark."""
+    return state["last_updated_at"], state["last_trip_id"]
+
+
+def fetch_page(conn, after, limit):
+    """Next keyset page of rows changed after (updated_at, trip_id)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT * FROM taxi_trips
+               WHERE (updated_at, trip_id) > (%s, %s)
+                 AND updated_at < NOW() - INTERVAL %s SECOND
+               ORDER BY updated_at, trip_id
+               LIMIT %s""",
+            (after[0], after[1], SYNC_SETTLE_SECONDS, limit)
+        )
+        return cur.fetchall()
+
+
+# -----------------------------
+# Streaming Pipeline
+# -----------------------------
+# Rows flow one at a time: MySQL → document → batch → bulk_write, so memory
+# stays at about one page plus one batch however large the backlog is.
+def iter_rows_keyset(conn, after, max_rows=0):
+    """Rows changed after the keyset position, fetched in SYNC_PAGE_SIZE pages."""
+    fetched = 0
+    while not max_rows or fetched < max_rows:
+        limit = min(SYNC_PAGE_SIZE, max_rows - fetched) if max_rows else SYNC_PAGE_SIZE
+        rows = fetch_page(conn, after, limit)
+        if not rows:
+            return
+        fetched += len(rows)
+        after = (rows[-1]["updated_at"], rows[-1]["trip_id"])
+        yield from rows
+        del rows
+
+
+def iter_rows_server(conn, after, max_rows=0):
+    """Rows changed after the keyset position from one unbuffered server-side cursor.
+
+    The connection is busy until the result is exhausted, so sync state must
+    be written on another connection.
+    """
+    sql = """SELECT * FROM taxi_trips
+             WHERE (updated_at, trip_id) > (%s, %s)
+               AND updated_at < NOW() - INTERVAL %s SECOND
+             ORDER BY updated_at, trip_id"""
+    params = [after[0], after[1], SYNC_SETTLE_SECONDS]
+    if max_rows:
+        # Closing an unbuffered cursor early would read the rest of the result anyway
+        sql += " LIMIT %s"
+        params.append(max_rows)
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+
+
+ROW_READERS = {
+    "keyset": iter_rows_keyset,
+    "server": iter_rows_server,
+}
+
+
+def timed(items, totals, key):
+    """Pass items through, adding the time spent producing them to totals[key]."""
+    items = iter(items)
+    while True:
+        start = time.time()
+        try:
+            item = next(items)
+        except StopIteration:
+            totals[key] += time.time() - start
+            return
+        totals[key] += time.time() - start
+        yield item
+
+
+def to_document(row, synced_at):
+    """Convert Decimal/datetime fields and add the sync timestamp."""
+    doc = {k: convert_value(v) for k, v in row.items()}
+    doc["created_at"] = synced_at
+    return doc
+
+
+def iter_batches(docs, sizer):
+    """Group documents into lists of the sizer's current batch size."""
+    batch = []
+    size = sizer.size
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+            size = sizer.size
+    if batch:
+        yield batch
+
+
+def batch_watermark(batch):
+    """Keyset position of the last document of a batch (documents arrive in keyset order)."""
+    last = batch[-1]
+    return last["updated_at"], last["trip_id"]
+
+
+class WatermarkTracker:
+    """Advances and saves the watermark over the contiguous prefix of written batches.
+
+    Batches may finish out of order with concurrent writers; the watermark only
+    moves past batch n once batches 1..n are all written, and never past a
+    failed batch, so the next run re-reads anything not known to be in MongoDB.
+    """
+
+    def __init__(self, conn, state):
+        self.conn = conn
+        self.state = state
+        self.failed = False
+        self._next = 1
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def complete(self, idx, batch):
+        key = batch_watermark(batch)
+        max_trip_id = max(d["trip_id"] for d in batch)
+        with self._lock:
+            self._done[idx] = (key, max_trip_id, len(batch))
+            advanced = False
+            while not self.failed and self._next in self._done:
+                (updated_at, trip_id), batch_max, rows = self._done.pop(self._next)
+                self.state = {"last_updated_at": updated_at, "last_trip_id": trip_id,
+                              "max_trip_id": max(self.state["max_trip_id"], batch_max),
+                              "rows_synced": self.state["rows_synced"] + rows}
+                self._next += 1
+                advanced = True
+            if advanced:
+                save_sync_state(self.conn, self.state)
+
+    def fail(self):
+        with self._lock:
+            self.failed = True
+
+
+def new_stage_stats():
+    return {stage: {"rows": 0, "busy_seconds": 0.0} for stage in ("fetch", "transform", "write")}
+
+
+def report_stages(stats, wall_seconds, writers):
+    """Print and return per-stage throughput; the busiest stage is the bottleneck."""
+    summary = {"wall_seconds": round(wall_seconds, 2), "writers": writers}
+    utilisation = {}
+    print(f"{'Stage':<10} {'Rows':>10} {'Busy s':>9} {'Rows/busy s':>12} {'Utilisation':>12}")
+    for stage, st in stats.items():
+        workers = writers if stage == "write" else 1
+        rate = st["rows"] / st["busy_seconds"] if st["busy_seconds"] > 0 else None
+        utilisation[stage] = st["busy_seconds"] / workers / wall_seconds if wall_seconds > 0 else 0.0
+        summary[stage] = {"rows": st["rows"], "busy_seconds": round(st["busy_seconds"], 2),
+                          "rows_per_busy_sec": round(rate, 1) if rate else None,
+                          "utilisation": round(utilisation[stage], 3)}
+        print(f"{stage:<10} {st['rows']:>10} {st['busy_seconds']:>9.2f} "
+              f"{(f'{rate:,.0f}' if rate else '-'):>12} {utilisation[stage]:>11.0%}")
+    summary["bottleneck"] = max(utilisation, key=utilisation.get)
+    print(f"Bottleneck: {summary['bottleneck']}")
+    return summary
+
+
+# -----------------------------
+# Sequential / Pipelined Sync
+# -----------------------------
+def run_sequential(reader, writer, sizer, tracker, stats, synced_at):
+    """Fetch, transform and write in one thread. Returns (documents synced, errors)."""
+    total_synced = 0
+    error_count = 0
+    fetch_timing = {"fetch": 0.0}
+    docs_timing = {"docs": 0.0}
+    rows = timed(reader, fetch_timing, "fetch")
+    docs = timed((to_document(row, synced_at) for row in rows), docs_timing, "docs")
+
+    # ⚡ Batch bulk writes, sized by the adaptive controller
+    for batch_no, batch in enumerate(iter_batches(docs, sizer), start=1):
+        write_start = time.time()
+        counts = writer.write(batch)
+        stats["write"]["busy_seconds"] += time.time() - write_start
+        failed = counts["failed"]
+        if failed:
+            # Keep the watermark before this batch so the next run retries it
+            error_count += 1
+            tracker.fail()
+            print(f"{failed} documents of batch {batch_no} failed; watermark not advanced")
+            break
+
+        total_synced += len(batch)
+        stats["write"]["rows"] += len(batch)
+        tracker.complete(batch_no, batch)
+        print(f"Synced batch {batch_no}: {len(batch)} documents (Inserted: {counts['inserted']}, "
+              f"Upserted: {counts['upserted']}, Modified: {counts['modified']})"
+              f" | next batch size {sizer.size} | Peak RSS: {get_peak_rss_mb():.0f}MB")
+
+    stats["fetch"]["busy_seconds"] += fetch_timing["fetch"]
+    stats["transform"]["busy_seconds"] += docs_timing["docs"] - fetch_timing["fetch"]
+    stats["fetch"]["rows"] = stats["transform"]["rows"] = stats["write"]["rows"]
+    return total_synced, error_count
+
+
+_END = object()
+
+
+def put_until(q, item, stop):
+    """Put into a bounded queue, giving up (returns False) once stop is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def iter_queue(q, stop):
+    """Items from q until _END (or until stop is set)."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        yield item
+
+
+def run_pipelined(reader, writer, sizer, tracker, stats, synced_at, writers):
+    """Overlap MySQL reads, transformation and concurrent Mongo bulk writes.
+
+    fetch thread → row blocks → transform (this thread) → batches → writer threads.
+    Queues are bounded, so memory stays constant. Returns (documents synced, errors).
+    """
+    raw_q = queue.Queue(maxsize=max(SYNC_QUEUE_DEPTH, 1))
+    batch_q = queue.Queue(maxsize=max(SYNC_QUEUE_DEPTH, 1))
+    abort = threading.Event()
+    failures = []
+    lock = threading.Lock()
+    totals = {"synced": 0, "errors": 0}
+
+    def fetch():
+        try:
+            block = []
+            start = time.time()
+            for row in reader:
+                block.append(row)
+                if len(block) >= FETCH_BLOCK:
+                    stats["fetch"]["busy_seconds"] += time.time() - start
+                    stats["fetch"]["rows"] += len(block)
+                    if not put_until(raw_q, block, abort):
+                        return
+                    block = []
+                    start = time.time()
+            stats["fetch"]["busy_seconds"] += time.time() - start
+            stats["fetch"]["rows"] += len(block)
+            if block:
+                put_until(raw_q, block, abort)
+            put_until(raw_q, _END, abort)
+        except BaseException as e:
+            failures.append(e)
+            abort.set()
+
+    def write(writer_id):
+        try:
+            for idx, batch in iter_queue(batch_q, abort):
+                write_start = time.time()
+                counts = writer.write(batch)
+                failed = counts["failed"]
+                elapsed = time.time() - write_start
+                with lock:
+                    stats["write"]["busy_seconds"] += elapsed
+                    if failed:
+                        totals["errors"] += 1
+                    else:
+                        totals["synced"] += len(batch)
+                        stats["write"]["rows"] += len(batch)
+                if failed:
+                    tracker.fail()
+                    abort.set()
+                    print(f"[Writer {writer_id}] {failed} documents of batch {idx} failed; watermark not advanced")
+                    return
+                tracker.complete(idx, batch)
+                print(f"[Writer {writer_id}] Synced batch {idx}: {len(batch)} documents "
+                      f"(Inserted: {counts['inserted']}, Upserted: {counts['upserted']}, "
+                      f"Modified: {counts['modified']}) | next batch size {sizer.size}")
+        except BaseException as e:
+            failures.append(e)
+            tracker.fail()
+            abort.set()
+
+    threads = [threading.Thread(target=fetch, name="sync-fetch", daemon=True)]
+    threads += [threading.Thread(target=write, args=(n,), name=f"sync-writer-{n}", daemon=True)
+                for n in range(1, writers + 1)]
+    for t in threads:
+        t.start()
+
+    # Transform: convert row blocks and cut them into batches of the sizer's current size
+    try:
+        idx = 0
+        pending = []
+        for block in iter_queue(raw_q, abort):
+            transform_start = time.time()
+            pending.extend(to_document(row, synced_at) for row in block)
+            ready = []
+            size = sizer.size
+            while len(pending) >= size:
+                ready.append(pending[:size])
+                pending = pending[size:]
+                size = sizer.size
+            stats["transform"]["busy_seconds"] += time.time() - transform_start
+            stats["transform"]["rows"] += len(block)
+
+            for batch in ready:
+                idx += 1
+                if not put_until(batch_q, (idx, batch), abort):
+                    break
+        if pending and not abort.is_set():
+            put_until(batch_q, (idx + 1, pending), abort)
+    except BaseException as e:
+        failures.append(e)
+        abort.set()
+    finally:
+        for _ in range(writers):
+            put_until(batch_q, _END, abort)
+        for t in threads[1:]:
+            t.join()
+        # The fetch thread must be done with the reader before the caller closes it
+        abort.set()
+        threads[0].join()
+
+    if failures:
+        raise failures[0]
+    return totals["synced"], totals["errors"]
+
+
+def sync_lag(conn, state):
+    """How far MongoDB is behind MySQL: seconds of updates and rows past the watermark."""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT MIN(updated_at) AS min_updated_at, MAX(updated_at) AS max_updated_at,
+                              MAX(trip_id) AS max_trip_id FROM taxi_trips""")
+        latest = cur.fetchone()
+        cur.execute(
+            "SELECT COUNT(*) AS pending FROM taxi_trips WHERE (updated_at, trip_id) > (%s, %s)",
+            (state["last_updated_at"], state["last_trip_id"])
+        )
+        pending = cur.fetchone()["pending"]
+
+    # Before the first sync the lag is the whole table's update history
+    synced_until = state["last_updated_at"]
+    if synced_until == EPOCH and latest["min_updated_at"]:
+        synced_until = latest["min_updated_at"]
+    lag_seconds = 0.0
+    if latest["max_updated_at"] and latest["max_updated_at"] > synced_until:
+        lag_seconds = (latest["max_updated_at"] - synced_until).total_seconds()
+    return {"lag_seconds": lag_seconds, "pending_rows": pending,
+            "mysql_max_trip_id": latest["max_trip_id"] or 0, "synced_max_trip_id": state["max_trip_id"]}
+
+
+def estimate_bson_bytes(docs, sample=20):
+    """Approximate encoded size of docs from an evenly spaced sample."""
+    if not docs:
+        return 0
+    picked = docs[::max(1, len(docs) // sample)]
+    return int(sum(len(bson.encode(d)) for d in picked) / len(picked) * len(docs))
+
+
+DUPLICATE_KEY = 11000
+
+
+def empty_counts():
+    return {"inserted": 0, "upserted": 0, "modified": 0, "failed": 0}
+
+
+def add_counts(total, counts):
+    for key in total:
+        total[key] += counts[key]
+    return total
+
+
+class BatchWriter:
+    """Bulk-writes document batches to MongoDB.
+
+    Trips with trip_id above new_after (the highest trip_id already synced) are
+    new and go in as plain inserts, which skip the upsert's lookup on the
+    unique trip_id index. Everything else, and any insert that still hits a
+    duplicate key, is upserted. A failing bulk write is retried in halves.
+
+    With a BucketWriter, each written batch also updates the hourly buckets
+    (trip_buckets.py) by the difference to the previously stored trips. A batch
+    of plain inserts has no stored versions, so it is neither read back nor
+    marked; only inserts that turn out to be duplicates are, before their upsert.
+    """
+
+    def __init__(self, col, sizer, new_after=None, buckets=None):
+        self.col = col
+        self.sizer = sizer
+        self.new_after = new_after
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.totals = empty_counts()
+        # Docs and seconds of batches that were all inserts / needed upserts, to compare the two paths
+        self.paths = {"insert": [0, 0.0], "upsert": [0, 0.0]}
+
+    def _ops(self, docs):
+        ops = []
+        inserts = 0
+        for d in docs:
+            if self.new_after is not None and d["trip_id"] > self.new_after:
+                ops.append(InsertOne(d))
+                inserts += 1
+            else:
+                ops.append(UpdateOne({"trip_id": d["trip_id"]}, {"$set": d}, upsert=True))
+        return ops, inserts
+
+    @staticmethod
+    def _upsert_ops(docs):
+        for d in docs:
+            # InsertOne added an _id, which $set must not try to change
+            d.pop("_id", None)
+        return [UpdateOne({"trip_id": d["trip_id"]}, {"$set": d}, upsert=True) for d in docs]
+
+    def write(self, docs):
+        """Write one batch; returns counts of inserted, upserted, modified and failed documents."""
+        ops, inserts = self._ops(docs)
+        previous, markers = {}, []
+        if self.buckets and inserts < len(docs):
+            upserts = [d["trip_id"] for d, op in zip(docs, ops) if isinstance(op, UpdateOne)]
+            markers.append(self.buckets.mark(upserts))
+            previous.update(self.buckets.previous(self.col, upserts))
+        counts = self._write(docs, ops, inserts, previous, markers)
+        if self.buckets:
+            self.buckets.apply(docs, previous, failed=counts["failed"], markers=markers)
+        with self.lock:
+            add_counts(self.totals, counts)
+        return counts
+
+    def _write(self, docs, ops, inserts, previous=None, markers=None):
+        """Bulk-write docs; stored versions of trips upserted here are added to previous for the buckets."""
+        counts = empty_counts()
+        write_start = time.time()
+        try:
+            result = self.col.bulk_write(ops, ordered=False)
+            counts["inserted"] = result.inserted_count
+            counts["upserted"] = result.upserted_count
+            counts["modified"] = result.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            counts["inserted"] = details["nInserted"]
+            counts["upserted"] = details["nUpserted"]
+            counts["modified"] = details["nModified"]
+            # A trip already in MongoDB (e.g. written by a run that died before saving
+            # its watermark) fails as an insert: upsert those instead
+            duplicates = [docs[err["index"]] for err in details["writeErrors"]
+                          if err.get("code") == DUPLICATE_KEY and isinstance(ops[err["index"]], InsertOne)]
+            rejected = len(details["writeErrors"]) - len(duplicates)
+            if rejected:
+                print(f"Error during batch bulk write: {rejected} documents rejected")
+            counts["failed"] = rejected
+            if duplicates:
+                if self.buckets and previous is not None:
+                    # A rerun or a split shard wrote these already: retract their stored versions
+                    trip_ids = [d["trip_id"] for d in duplicates]
+                    markers.append(self.buckets.mark(trip_ids))
+                    previous.update(self.buckets.previous(self.col, trip_ids))
+                add_counts(counts, self._write(duplicates, self._upsert_ops(duplicates), 0, previous, markers))
+            return counts
+        except PyMongoError as e:
+            self.sizer.on_error()
+            if len(docs) <= 1:
+                print(f"Error during batch bulk write: {e}")
+                counts["failed"] = len(docs)
+                return counts
+            print(f"⚠️  Bulk write of {len(docs)} documents failed ({e}); retrying in halves")
+            for half in split_batch(docs):
+                add_counts(counts, self._write(half, *self._ops(half), previous, markers))
+            return counts
+
+        elapsed = time.time() - write_start
+        self.sizer.observe(len(docs), elapsed, nbytes=estimate_bson_bytes(docs))
+        with self.lock:
+            path = self.paths["insert" if inserts == len(docs) else "upsert"]
+            path[0] += len(docs)
+            path[1] += elapsed
+        return counts
+
+    def summary(self):
+        with self.lock:
+            summary = dict(self.totals)
+            rates = {name: docs / seconds if seconds > 0 else None for name, (docs, seconds) in self.paths.items()}
+        summary["insert_docs_per_sec"] = round(rates["insert"], 1) if rates["insert"] else None
+        summary["upsert_docs_per_sec"] = round(rates["upsert"], 1) if rates["upsert"] else None
+        summary["insert_speedup"] = round(rates["insert"] / rates["upsert"], 2) \
+            if rates["insert"] and rates["upsert"] else None
+        return summary
+
+
+def has_unique_trip_id_index(col):
+    """Plain inserts are only safe when MongoDB rejects a second document per trip_id."""
+    return any(index.get("unique") and index["key"] == [("trip_id", 1)]
+               for index in col.index_information().values())
+
+
 def sync_data():
     start_time = time.time()
     error_count = 0
@@ -58,41 +636,76 @@ def sync_data():
     db = mongo[MONGO_DB]
     col = db["taxi_trips"]
 
-    print("Fetching data from MySQL...")
-    fetch_start = time.time()
-    with conn.cursor() as cur:
-        cur.execute("SELECT * FROM taxi_trips ORDER BY trip_id LIMIT 100000")
-        rows = cur.fetchall()
-    record_db_metrics("mysql", "sync_fetch", fetch_start, error_count=0)
+    state = load_sync_state(conn)
+    lag_before = sync_lag(conn, state)
+    print(f"Watermark: updated_at {state['last_updated_at']}, trip_id {state['last_trip_id']} | "
+          f"{lag_before['pending_rows']} rows pending, {lag_before['lag_seconds']:.0f}s behind")
 
-    print(f"Syncing {len(rows)} records to MongoDB...")
-    sync_start = time.time()
-
-    # Convert all Decimal/datetime fields
-    rows = [{k: convert_value(v) for k, v in r.items()} for r in rows]
+    if SYNC_CURSOR not in ROW_READERS:
+        raise ValueError(f"Unknown SYNC_CURSOR '{SYNC_CURSOR}', expected one of {list(ROW_READERS)}")
+    # An unbuffered cursor holds its connection, and pipelined writers save the watermark
+    # while the fetch thread reads (PyMySQL connections are not thread-safe): sync state
+    # then goes over a second connection, used only under the tracker's lock
+    state_conn = get_mysql_conn() if SYNC_CURSOR == "server" or SYNC_WRITERS > 1 else conn
 
-    # Add timestamp
-    for r in rows:
-        r["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    sync_start = time.time()
+    stats = new_stage_stats()
+    sizer = new_batch_sizer()
+    tracker = WatermarkTracker(state_conn, state)
+    # Trips past the highest synced trip_id cannot be in MongoDB yet
+    new_after = state["max_trip_id"] if SYNC_INSERT_FAST_PATH else None
+    if new_after is not None and not has_unique_trip_id_index(col):
+        print("⚠️  No unique trip_id index on MongoDB taxi_trips (run mongo/setup_mongo.py); upserting everything")
+        new_after = None
+    buckets = BucketWriter(db) if SYNC_BUCKETS else None
+    writer = BatchWriter(col, sizer, new_after, buckets)
+    synced_at = datetime.now()
+    reader = ROW_READERS[SYNC_CURSOR](conn, start_key(state), SYNC_MAX_ROWS)
 
-    # ⚡ Batch bulk writes
-    total_synced = 0
-    for i in range(0, len(rows), BATCH_SIZE):
-        batch = rows[i:i + BATCH_SIZE]
-        ops = [UpdateOne({"trip_id": r["trip_id"]}, {"$set": r}, upsert=True) for r in batch]
+    try:
+        if SYNC_WRITERS > 1:
+            print(f"Pipelined sync: {SYNC_WRITERS} writers, queue depth {SYNC_QUEUE_DEPTH}")
+            total_synced, errors = run_pipelined(reader, writer, sizer, tracker, stats, synced_at, SYNC_WRITERS)
+        else:
+            total_synced, errors = run_sequential(reader, writer, sizer, tracker, stats, synced_at)
+        error_count += errors
+    finally:
+        reader.close()
+        if state_conn is not conn:
+            state_conn.close()
+    state = tracker.state
 
-        try:
-            result = col.bulk_write(ops, ordered=False)
-            total_synced += len(batch)
-            print(f"Synced batch {i//BATCH_SIZE + 1}: {len(batch)} documents (Inserted: {result.upserted_count}, Modified: {result.modified_count})")
-        except Exception as e:
-            error_count += 1
-            print(f"Error during batch bulk write: {e}")
+    stage_summary = report_stages(stats, time.time() - sync_start, SYNC_WRITERS)
+    record_db_metrics("mysql", "sync_fetch", time.time() - stats["fetch"]["busy_seconds"], error_count=0,
+                      details={"cursor": SYNC_CURSOR, "page_size": SYNC_PAGE_SIZE, **stage_summary["fetch"]})
+    record_db_metrics("mongodb", "sync_stages", sync_start, error_count=error_count, details=stage_summary)
+    write_summary = writer.summary()
+    print(f"Inserted {write_summary['inserted']} new, upserted {write_summary['upserted']}, "
+          f"modified {write_summary['modified']}"
+          + (f" | inserts {write_summary['insert_speedup']}x faster than upserts"
+             if write_summary["insert_speedup"] else ""))
+    record_db_metrics("mongodb", "sync_write", sync_start, error_count=error_count,
+                      details={"fast_path": new_after is not None, **write_summary})
+    if buckets:
+        bucket_summary = buckets.summary()
+        print(f"Buckets: {bucket_summary['buckets_updated']} updates for {bucket_summary['trips_applied']} trips"
+              + (f", {bucket_summary['batches_skipped']} failed batches skipped" if bucket_summary["batches_skipped"] else ""))
+        record_db_metrics("mongodb", "sync_buckets", sync_start, error_count=bucket_summary["errors"],
+                          details=bucket_summary)
+        buckets.close()
 
-    record_db_metrics("mongodb", "sync_write", sync_start, error_count=error_count)
-    record_db_metrics("mysql", "sync_complete", start_time, error_count=error_count)
+    lag = sync_lag(conn, state)
+    lag.update({"lag_seconds_before": lag_before["lag_seconds"], "pending_rows_before": lag_before["pending_rows"],
+                "rows": total_synced})
+    print(f"Lag behind MySQL: {lag['lag_seconds']:.0f}s, {lag['pending_rows']} rows pending")
+    record_db_metrics("mysql", "sync_lag", sync_start, error_count=error_count, details=lag)
+    sizing = sizer.summary()
+    record_db_metrics("mongodb", "sync_batch_size", sync_start, error_count=sizing["errors"], details=sizing)
+    peak_rss = get_peak_rss_mb()
+    record_db_metrics("mysql", "sync_complete", start_time, error_count=error_count,
+                      details={"rows": total_synced, "cursor": SYNC_CURSOR, "peak_rss_mb": round(peak_rss, 1)})
 
-    print(f"Sync completed successfully. Total documents synced: {total_synced}")
+    print(f"Sync completed successfully. Total documents synced: {total_synced} | Peak RSS: {peak_rss:.0f}MB")
 
     conn.close()
     mongo.close()
@@ -0,0 +1,171 @@
+"""
+Checks for the dataset download cache (dataset_cache.py) against a local HTTP server.
+
+A ThreadingHTTPServer on 127.0.0.1 serves files whose body, ETag and
+Content-Length each case controls, and counts the GET requests it receives.
+The cache runs in a temporary working directory, so data/cache is untouched.
+
+Cases:
+- a second fetch of an unchanged file is a cache hit (no GET)
+- a changed ETag downloads the file again into a new object
+- a truncated body raises, leaves no partial file and is not cached
+- concurrent fetch_all downloads every file once and indexes them all
+"""
+import os
+import sys
+import glob
+import json
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import dataset_cache  # noqa: E402
+
+# path -> {"body": bytes, "etag": str, "truncate": bool}
+FILES = {}
+GETS = {}
+_gets_lock = threading.Lock()
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    def _headers(self, spec):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(spec["body"])))
+        self.send_header("ETag", spec["etag"])
+        self.end_headers()
+
+    def do_HEAD(self):
+        spec = FILES.get(self.path)
+        if spec is None:
+            self.send_error(404)
+            return
+        self._headers(spec)
+
+    def do_GET(self):
+        spec = FILES.get(self.path)
+        if spec is None:
+            self.send_error(404)
+            return
+        with _gets_lock:
+            GETS[self.path] = GETS.get(self.path, 0) + 1
+        self._headers(spec)
+        body = spec["body"]
+        if spec.get("truncate"):
+            # Announce the full length, send half and drop the connection
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(path, body, etag, truncate=False):
+    FILES[path] = {"body": body, "etag": etag, "truncate": truncate}
+
+
+def gets(path):
+    with _gets_lock:
+        return GETS.get(path, 0)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def part_files():
+    return glob.glob(os.path.join(dataset_cache.CACHE_DIR, "*.part"))
+
+
+# -----------------------------
+#  Cases
+# -----------------------------
+def test_cache_hit(base):
+    serve("/hit.parquet", b"a" * 300000, '"v1"')
+    url = base + "/hit.parquet"
+    first = dataset_cache.fetch(url)
+    second = dataset_cache.fetch(url)
+    assert first == second, "second fetch returned another path"
+    assert gets("/hit.parquet") == 1, f"expected 1 GET, got {gets('/hit.parquet')}"
+    assert read(second) == FILES["/hit.parquet"]["body"], "cached body differs"
+
+
+def test_changed_etag(base):
+    serve("/etag.parquet", b"old" * 1000, '"v1"')
+    url = base + "/etag.parquet"
+    old = dataset_cache.fetch(url)
+    serve("/etag.parquet", b"new" * 1000, '"v2"')
+    new = dataset_cache.fetch(url)
+    assert gets("/etag.parquet") == 2, f"expected a second GET, got {gets('/etag.parquet')}"
+    assert new != old, "changed file was stored under the old object"
+    assert read(new) == b"new" * 1000, "re-downloaded body differs"
+    with open(dataset_cache.INDEX_PATH, encoding="utf-8") as f:
+        assert json.load(f)[url]["etag"] == '"v2"', "index still has the old ETag"
+
+
+def test_truncated_body(base):
+    serve("/short.parquet", b"x" * 500000, '"v1"', truncate=True)
+    url = base + "/short.parquet"
+    try:
+        dataset_cache.fetch(url)
+    except Exception:
+        pass
+    else:
+        raise AssertionError("truncated download did not raise")
+    assert not part_files(), f"partial files left behind: {part_files()}"
+    assert dataset_cache._cached_path(url, None) is None, "truncated download was cached"
+
+
+def test_concurrent_fetch_all(base):
+    urls = []
+    for n in range(6):
+        serve(f"/month-{n}.parquet", bytes([n]) * (200000 + n), f'"m{n}"')
+        urls.append(f"{base}/month-{n}.parquet")
+    results = list(dataset_cache.fetch_all(urls, workers=4))
+    assert [url for url, _ in results] == urls, "fetch_all changed the manifest order"
+    for n, (url, path) in enumerate(results):
+        assert read(path) == bytes([n]) * (200000 + n), f"{url} body differs"
+        assert gets(f"/month-{n}.parquet") == 1, f"{url} downloaded {gets(f'/month-{n}.parquet')} times"
+    with open(dataset_cache.INDEX_PATH, encoding="utf-8") as f:
+        index = json.load(f)
+    missing = [url for url in urls if url not in index]
+    assert not missing, f"index lost concurrent entries: {missing}"
+
+
+TESTS = [test_cache_hit, test_changed_etag, test_truncated_body, test_concurrent_fetch_all]
+
+
+def main():
+    print(" Testing dataset cache against a local HTTP server...")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="dataset_cache_test_")
+    os.chdir(workdir)
+    failures = 0
+    try:
+        for test in TESTS:
+            try:
+                test(base)
+                print(f"PASS: {test.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"FAIL: {test.__name__}: {e}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.shutdown()
+
+    print(f"\n{len(TESTS) - failures} of {len(TESTS)} cache checks passed")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
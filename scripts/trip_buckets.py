@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated hourly buckets of taxi_trips in MongoDB.
+
+trip_buckets_hourly holds one document per (pickup hour, pu_location_id) with
+the trip count, sums of fare, total, tip and distance, and min/max of fare,
+distance and tip. Dashboard questions such as trips and revenue per hour per
+zone read a few thousand buckets instead of aggregating millions of trips.
+
+The sync (BatchWriter) and the CDC replicator keep the buckets current. Before
+a batch is written, the stored versions of its trips are read with one $in
+query. After the write, each affected bucket gets a single $inc that adds the new
+values and subtracts the old ones, so updated trips and trips whose pickup moved
+to another hour or zone are not counted twice. $min/$max only ever widen, so after
+updates and deletes they are bounds of every value seen rather than exact extremes.
+
+Trip and bucket writes are not atomic together, and a crash between them
+cannot be replayed: the rerun would diff against the already written trips.
+So every BucketWriter holds a lease in trip_buckets_writers, renewed by a
+heartbeat thread, and marks each batch that may replace stored trips with one
+document (owner, trip_id range) in trip_buckets_pending, removed once the
+bucket update succeeded. Insert-only batches of new trips are not marked. A
+batch that partly failed or whose bucket update failed keeps its marker
+(counted as skipped).
+
+A new BucketWriter that finds markers of writers whose lease expired rebuilds
+the buckets, under a rebuild lock and only while no other writer is live
+(otherwise the rebuild is left to a later run); writers starting meanwhile
+wait for the lock. `python scripts/trip_buckets.py rebuild` recomputes every
+bucket exactly from taxi_trips with one aggregation, under the same lock.
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import PyMongoError, DuplicateKeyError
+from dotenv import load_dotenv
+from monitoring_utils import record_db_metrics
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
+
+SYNC_BUCKETS = os.getenv("SYNC_BUCKETS", "1") == "1"
+BUCKET_COLLECTION = "trip_buckets_hourly"
+PENDING_COLLECTION = "trip_buckets_pending"
+WRITER_COLLECTION = "trip_buckets_writers"
+REBUILD_LOCK = "rebuild"
+# A writer whose heartbeat is older than this is treated as dead
+BUCKET_LEASE_SECONDS = float(os.getenv("BUCKET_LEASE_SECONDS", "60"))
+
+MONEY_SUMS = {"fare_sum": "fare_amount", "total_sum": "total_amount", "tip_sum": "tip_amount"}
+FLOAT_SUMS = {"distance_sum": "trip_distance"}
+EXTREMES = {"fare": "fare_amount", "distance": "trip_distance", "tip": "tip_amount"}
+SOURCE_FIELDS = ["trip_id", "pickup_datetime", "pu_location_id",
+                 "fare_amount", "total_amount", "tip_amount", "trip_distance"]
+
+
+def _hour(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _money(value):
+    """Exact Decimal of a Decimal128, Decimal or (pre-migration) float amount."""
+    if value is None:
+        return Decimal(0)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def bucket_key(doc):
+    if doc.get("pickup_datetime") is None or doc.get("pu_location_id") is None:
+        return None
+    return _hour(doc["pickup_datetime"]), doc["pu_location_id"]
+
+
+def new_bucket():
+    bucket = {"trips": 0, "distance_sum": 0.0, "min": {}, "max": {}}
+    bucket.update({name: Decimal(0) for name in MONEY_SUMS})
+    return bucket
+
+
+def add_trip(buckets, doc, sign):
+    """Add (sign=1) or retract (sign=-1) one trip's contribution."""
+    key = bucket_key(doc)
+    if key is None:
+        return
+    bucket = buckets.setdefault(key, new_bucket())
+    bucket["trips"] += sign
+    for name, field in MONEY_SUMS.items():
+        bucket[name] += sign * _money(doc.get(field))
+    for name, field in FLOAT_SUMS.items():
+        bucket[name] += sign * float(doc.get(field) or 0)
+    if sign < 0:
+        return
+    for name, field in EXTREMES.items():
+        value = doc.get(field)
+        if value is None:
+            continue
+        value = float(_money(value)) if field != "trip_distance" else float(value)
+        bucket["min"][name] = min(bucket["min"].get(name, value), value)
+        bucket["max"][name] = max(bucket["max"].get(name, value), value)
+
+
+def changed(bucket):
+    """False when an update left the bucket's totals as they were and set no extremes."""
+    return bool(bucket["trips"] or bucket["min"] or bucket["distance_sum"]
+                or any(bucket[name] for name in MONEY_SUMS))
+
+
+def bucket_update(key, bucket, now):
+    hour, pu_location_id = key
+    update = {
+        "$inc": {"trips": bucket["trips"], "distance_sum": bucket["distance_sum"],
+                 **{name: Decimal128(bucket[name]) for name in MONEY_SUMS}},
+        "$set": {"updated_at": now},
+    }
+    if bucket["min"]:
+        update["$min"] = {f"{name}_min": value for name, value in bucket["min"].items()}
+        update["$max"] = {f"{name}_max": value for name, value in bucket["max"].items()}
+    return UpdateOne({"hour": hour, "pu_location_id": pu_location_id}, update, upsert=True)
+
+
+def _lease(expired):
+    """Filter on heartbeats older (expired=True) or newer than the lease, by the server's clock."""
+    cutoff = {"$subtract": ["$$NOW", int(BUCKET_LEASE_SECONDS * 1000)]}
+    return {"$expr": {"$lt" if expired else "$gte": ["$heartbeat", cutoff]}}
+
+
+class WriterLease:
+    """Lease of one bucket writer in trip_buckets_writers, renewed by a daemon thread until close()."""
+
+    def __init__(self, db):
+        self.col = db[WRITER_COLLECTION]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Leases of writers that died; their markers stay until a rebuild covers them
+        self.col.delete_many({"_id": {"$ne": REBUILD_LOCK}, **_lease(expired=True)})
+        self.col.update_one({"_id": self.owner}, {"$currentDate": {"heartbeat": True},
+                                                  "$set": {"started_at": datetime.now()}}, upsert=True)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="bucket-lease", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop.wait(BUCKET_LEASE_SECONDS / 3):
+            try:
+                # Renews the rebuild lock too while this writer holds it
+                self.col.update_many({"$or": [{"_id": self.owner}, {"owner": self.owner}]},
+                                     {"$currentDate": {"heartbeat": True}})
+            except PyMongoError as e:
+                print(f"⚠️  Bucket writer heartbeat failed: {e}")
+
+    def live_owners(self):
+        return {doc["_id"] for doc in self.col.find({"_id": {"$ne": REBUILD_LOCK}, **_lease(expired=False)}, {"_id": 1})}
+
+    def acquire_rebuild(self):
+        """True once this writer holds the rebuild lock (a lock whose holder died is taken over)."""
+        try:
+            self.col.insert_one({"_id": REBUILD_LOCK, "owner": self.owner, "heartbeat": datetime.now()})
+            self.col.update_one({"_id": REBUILD_LOCK}, {"$currentDate": {"heartbeat": True}})
+            return True
+        except DuplicateKeyError:
+            pass
+        held = self.col.find_one({"_id": REBUILD_LOCK, **_lease(expired=True)})
+        if held is None:
+            return False
+        # Compare-and-swap on the expired heartbeat, so only one writer takes the lock over
+        taken = self.col.update_one({"_id": REBUILD_LOCK, "heartbeat": held["heartbeat"]},
+                                    {"$set": {"owner": self.owner}, "$currentDate": {"heartbeat": True}})
+        return taken.modified_count == 1
+
+    def release_rebuild(self):
+        self.col.delete_one({"_id": REBUILD_LOCK, "owner": self.owner})
+
+    def wait_for_rebuild(self):
+        """Block while another writer holds the rebuild lock."""
+        while self.col.count_documents({"_id": REBUILD_LOCK, "owner": {"$ne": self.owner}, **_lease(expired=False)}):
+            time.sleep(1)
+
+    def close(self):
+        self.stop.set()
+        self.col.delete_many({"$or": [{"_id": self.owner}, {"owner": self.owner}]})
+
+
+def locked_rebuild(db, lease):
+    """Rebuild the buckets under the rebuild lock; None when locked or another writer is live."""
+    if not lease.acquire_rebuild():
+        return None
+    try:
+        if lease.live_owners() - {lease.owner}:
+            return None
+        # Writers starting from here on wait for the lock, so every marker left is a dead writer's
+        return rebuild(db)
+    finally:
+        lease.release_rebuild()
+
+
+class BucketWriter:
+    """Applies the bucket deltas of written trip batches; safe to share between writer threads."""
+
+    def __init__(self, db):
+        self.col = db[BUCKET_COLLECTION]
+        self.pending = db[PENDING_COLLECTION]
+        self.lock = threading.Lock()
+        self.stats = {"trips_applied": 0, "buckets_updated": 0, "batches_skipped": 0,
+                      "errors": 0, "seconds": 0.0, "recovered_trips": 0}
+        # Register before looking at markers and the lock: a rebuild started later sees this writer
+        self.lease = WriterLease(db)
+        self._recover(db)
+        self.lease.wait_for_rebuild()
+
+    def _recover(self, db):
+        """Rebuild the buckets if a dead writer stopped between a trip write and its bucket update."""
+        left = list(self.pending.find({"owner": {"$nin": list(self.lease.live_owners())}}, {"trips": 1}))
+        if not left:
+            return
+        trips = sum(marker.get("trips", 0) for marker in left)
+        print(f"⚠️  {len(left)} batches ({trips} trips) have bucket updates pending from an interrupted run")
+        if locked_rebuild(db, self.lease) is None:
+            print("   Other bucket writers are live; the rebuild is left to a later run")
+            return
+        print(f"   Rebuilt {BUCKET_COLLECTION}")
+        self.stats["recovered_trips"] = trips
+
+    def mark(self, trip_ids):
+        """Mark a batch whose write may replace stored trips; returns the marker for apply()."""
+        if not trip_ids:
+            return None
+        return self.pending.insert_one({"owner": self.lease.owner, "lo": min(trip_ids), "hi": max(trip_ids),
+                                        "trips": len(trip_ids), "since": datetime.now()}).inserted_id
+
+    @staticmethod
+    def previous(trips_col, trip_ids):
+        """Currently stored versions of trip_ids, keyed by trip_id."""
+        if not trip_ids:
+            return {}
+        projection = {field: 1 for field in SOURCE_FIELDS}
+        projection["_id"] = 0
+        return {doc["trip_id"]: doc for doc in trips_col.find({"trip_id": {"$in": list(trip_ids)}}, projection)}
+
+    def apply(self, docs, previous, deleted_ids=(), failed=0, markers=()):
+        """Move the buckets from the previous versions to docs (and drop deleted_ids).
+
+        The batch's markers are removed once the buckets are updated; a failed
+        batch keeps them, so a later run rebuilds the buckets.
+        """
+        if failed:
+            with self.lock:
+                self.stats["batches_skipped"] += 1
+            return
+        start = time.time()
+        buckets = {}
+        for doc in docs:
+            old = previous.get(doc["trip_id"])
+            if old:
+                add_trip(buckets, old, -1)
+            add_trip(buckets, doc, 1)
+        for trip_id in deleted_ids:
+            if trip_id in previous:
+                add_trip(buckets, previous[trip_id], -1)
+
+        now = datetime.now()
+        ops = [bucket_update(key, bucket, now) for key, bucket in buckets.items() if changed(bucket)]
+        errors = 0
+        if ops:
+            try:
+                self.col.bulk_write(ops, ordered=False)
+            except PyMongoError as e:
+                errors = 1
+                print(f"⚠️  Bucket update failed ({e}); buckets are rebuilt on the next run")
+        markers = [marker for marker in markers if marker is not None]
+        if markers and not errors:
+            self.pending.delete_many({"_id": {"$in": markers}})
+        with self.lock:
+            self.stats["trips_applied"] += len(docs) + len(deleted_ids)
+            self.stats["buckets_updated"] += len(ops)
+            self.stats["errors"] += errors
+            self.stats["seconds"] += time.time() - start
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["seconds"] = round(stats["seconds"], 3)
+        return stats
+
+    def close(self):
+        """End the lease; markers of failed batches stay for the next run to recover."""
+        self.lease.close()
+
+
+def ensure_indexes(db):
+    col = db[BUCKET_COLLECTION]
+    col.create_index([("hour", ASCENDING), ("pu_location_id", ASCENDING)], unique=True)
+    col.create_index([("pu_location_id", ASCENDING), ("hour", ASCENDING)])
+
+
+# -----------------------------
+# Full Rebuild
+# -----------------------------
+def rebuild_pipeline():
+    return [
+        {"$match": {"pickup_datetime": {"$type": "date"}, "pu_location_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"hour": {"$dateTrunc": {"date": "$pickup_datetime", "unit": "hour"}},
+                    "pu_location_id": "$pu_location_id"},
+            "trips": {"$sum": 1},
+            **{name: {"$sum": {"$toDecimal": f"${field}"}} for name, field in MONEY_SUMS.items()},
+            **{name: {"$sum": f"${field}"} for name, field in FLOAT_SUMS.items()},
+            **{f"{name}_min": {"$min": {"$toDouble": f"${field}"}} for name, field in EXTREMES.items()},
+            **{f"{name}_max": {"$max": {"$toDouble": f"${field}"}} for name, field in EXTREMES.items()},
+        }},
+        {"$set": {"hour": "$_id.hour", "pu_location_id": "$_id.pu_location_id", "updated_at": "$$NOW"}},
+        {"$unset": "_id"},
+        {"$out": BUCKET_COLLECTION},
+    ]
+
+
+def rebuild(db):
+    """Recompute every bucket; callers hold the rebuild lock with no other writer live (locked_rebuild)."""
+    # Only markers set before the aggregation are covered by it
+    pending = [doc["_id"] for doc in db[PENDING_COLLECTION].find({}, {"_id": 1})]
+    db["taxi_trips"].aggregate(rebuild_pipeline(), allowDiskUse=True)
+    ensure_indexes(db)
+    for i in range(0, len(pending), 10000):
+        db[PENDING_COLLECTION].delete_many({"_id": {"$in": pending[i:i + 10000]}})
+    return db[BUCKET_COLLECTION].estimated_document_count()
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    if command != "rebuild":
+        raise SystemExit(f"Unknown command '{command}', expected rebuild")
+
+    start = time.time()
+    print(f"🧮 Rebuilding {BUCKET_COLLECTION} from taxi_trips...")
+    mongo = MongoClient(MONGO_URI)
+    db = mongo[MONGO_DB]
+    error_count = 0
+    buckets = 0
+    lease = WriterLease(db)
+    try:
+        buckets = locked_rebuild(db, lease)
+        if buckets is None:
+            error_count += 1
+            print("❌ Bucket writers are live or another rebuild is running; rerun once they finish")
+        else:
+            trips = db["taxi_trips"].estimated_document_count()
+            print(f"✅ {buckets:,} buckets for {trips:,} trips in {time.time() - start:.1f}s")
+    except PyMongoError as e:
+        error_count += 1
+        print(f"❌ Rebuild failed: {e}")
+    finally:
+        lease.close()
+    record_db_metrics("mongodb", "bucket_rebuild", start, error_count=error_count, details={"buckets": buckets or 0})
+    mongo.close()
+    if error_count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
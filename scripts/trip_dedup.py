@@ -0,0 +1,215 @@
+"""
+Ingest-time duplicate detection for taxi_trips.
+
+Every cleaned row gets a 64-bit trip fingerprint computed with numpy from
+vendor, pickup/dropoff time, PU/DO location and total_amount (in cents). The
+fingerprint is stored in taxi_trips.trip_fingerprint, which has a unique key.
+
+Before a chunk is inserted it is checked against a Bloom filter persisted as a
+memory-mapped bit array in data/dedup/. Rows the filter has never seen are new
+and are inserted without a lookup. Only "maybe seen" rows are confirmed with one
+indexed IN (...) query, and confirmed duplicates are dropped before the insert.
+The unique key still guards the rare row the filter misses (e.g. a lost filter
+file), so correctness never depends on the filter.
+"""
+import os
+import json
+import math
+import threading
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ETL_DEDUP = os.getenv("ETL_DEDUP", "1") == "1"
+# Expected number of distinct trips and target false positive rate of the filter
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", "20000000"))
+BLOOM_FP_RATE = float(os.getenv("BLOOM_FP_RATE", "0.001"))
+BLOOM_DIR = os.path.join("data", "dedup")
+
+FINGERPRINT_COLUMN = "trip_fingerprint"
+LOOKUP_BATCH = 1000
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(z):
+    """splitmix64 finaliser, vectorised; uint64 arithmetic wraps around"""
+    z = (z ^ (z >> np.uint64(30))) * _M1
+    z = (z ^ (z >> np.uint64(27))) * _M2
+    return z ^ (z >> np.uint64(31))
+
+
+def trip_fingerprints(df, vendor=None):
+    """Signed 64-bit fingerprint per row of a cleaned chunk (fits MySQL BIGINT and BSON int64).
+
+    vendor is the numeric vendor_id as an int64 array when the caller has it;
+    otherwise the cleaned vendor_id strings are parsed (non-numeric ones hash as -1).
+    """
+    n = len(df)
+    if vendor is None:
+        vendor = pd.to_numeric(df["vendor_id"], errors="coerce").fillna(-1).to_numpy("int64")
+    parts = [
+        vendor,
+        df["pickup_datetime"].to_numpy("datetime64[s]").view("int64"),
+        df["dropoff_datetime"].to_numpy("datetime64[s]").view("int64"),
+        df["pu_location_id"].to_numpy("int64"),
+        df["do_location_id"].to_numpy("int64"),
+        np.rint(df["total_amount"].to_numpy("float64") * 100).astype("int64"),
+    ]
+    h = np.full(n, _GOLDEN, dtype=np.uint64)
+    for part in parts:
+        h = _mix(h ^ part.view(np.uint64))
+        h = h + _GOLDEN
+    return _mix(h).view(np.int64)
+
+
+# -----------------------------
+#  Persistent Bloom Filter
+# -----------------------------
+class BloomFilter:
+    """Bloom filter over fingerprints, memory-mapped from disk so it persists across runs."""
+
+    def __init__(self, path, capacity=BLOOM_CAPACITY, fp_rate=BLOOM_FP_RATE):
+        self.path = path
+        self.meta_path = path + ".json"
+        self.lock = threading.Lock()
+
+        bits = int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.m = (bits + 7) // 8 * 8
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.count = 0
+
+        meta = self._read_meta()
+        if meta and (meta["m"], meta["k"]) == (self.m, self.k) and os.path.exists(path):
+            self.count = meta["count"]
+        else:
+            # New filter or different sizing: start empty (duplicates are still caught by the unique key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(self.m // 8)
+        self.bits = np.memmap(path, dtype=np.uint8, mode="r+", shape=(self.m // 8,))
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _positions(self, fingerprints):
+        h1 = fingerprints.view(np.uint64)
+        h2 = _mix(h1) | np.uint64(1)
+        i = np.arange(self.k, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.m)
+
+    def might_contain(self, fingerprints):
+        if len(fingerprints) == 0:
+            return np.zeros(0, dtype=bool)
+        pos = self._positions(fingerprints)
+        masks = np.left_shift(np.uint8(1), (pos & np.uint64(7)).astype(np.uint8))
+        with self.lock:
+            hits = self.bits[(pos >> np.uint64(3)).astype(np.int64)] & masks
+        return hits.astype(bool).all(axis=1)
+
+    def add(self, fingerprints):
+        if len(fingerprints) == 0:
+            return
+        pos = self._positions(fingerprints).ravel()
+        masks = np.left_shift(np.uint8(1), (pos & np.uint64(7)).astype(np.uint8))
+        with self.lock:
+            np.bitwise_or.at(self.bits, (pos >> np.uint64(3)).astype(np.int64), masks)
+            self.count += len(fingerprints)
+
+    @property
+    def size_mb(self):
+        return self.m / 8 / 1024 ** 2
+
+    @property
+    def estimated_fp_rate(self):
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+    def flush(self):
+        with self.lock:
+            self.bits.flush()
+            tmp = self.meta_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"m": self.m, "k": self.k, "count": self.count}, f)
+            os.replace(tmp, self.meta_path)
+
+    def replace(self, other_path):
+        """Move this filter's files over other_path's (used when a staging table is swapped in)."""
+        self.flush()
+        del self.bits
+        os.replace(self.path, other_path)
+        os.replace(self.meta_path, other_path + ".json")
+
+
+def remove_filter(path):
+    for name in (path, path + ".json"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+# -----------------------------
+#  Deduplicator
+# -----------------------------
+class Deduplicator:
+    """Drops duplicate trips from cleaned chunks before they are inserted into table."""
+
+    def __init__(self, table, bloom_path):
+        self.table = table
+        self.bloom = BloomFilter(bloom_path)
+        self.lock = threading.Lock()
+        self.stats = {"rows_checked": 0, "in_chunk_duplicates": 0, "bloom_maybe": 0,
+                      "db_duplicates": 0, "bloom_false_positives": 0}
+
+    def _existing(self, conn, fingerprints):
+        found = set()
+        with conn.cursor() as cur:
+            for i in range(0, len(fingerprints), LOOKUP_BATCH):
+                batch = [int(fp) for fp in fingerprints[i:i + LOOKUP_BATCH]]
+                placeholders = ",".join(["%s"] * len(batch))
+                cur.execute(
+                    f"SELECT {FINGERPRINT_COLUMN} FROM {self.table} WHERE {FINGERPRINT_COLUMN} IN ({placeholders})",
+                    batch
+                )
+                found.update(row[0] for row in cur.fetchall())
+        return found
+
+    def filter(self, conn, df):
+        """Return df without rows already loaded (or repeated within the chunk)."""
+        checked = len(df)
+        unique = df[~df[FINGERPRINT_COLUMN].duplicated()]
+        fingerprints = unique[FINGERPRINT_COLUMN].to_numpy()
+
+        maybe = self.bloom.might_contain(fingerprints)
+        existing = self._existing(conn, fingerprints[maybe]) if maybe.any() else set()
+        if existing:
+            unique = unique[~unique[FINGERPRINT_COLUMN].isin(existing)]
+
+        with self.lock:
+            self.stats["rows_checked"] += checked
+            self.stats["in_chunk_duplicates"] += checked - len(fingerprints)
+            self.stats["bloom_maybe"] += int(maybe.sum())
+            self.stats["db_duplicates"] += len(existing)
+            self.stats["bloom_false_positives"] += int(maybe.sum()) - len(existing)
+        return unique
+
+    def record(self, df):
+        """Remember fingerprints of rows that were committed."""
+        self.bloom.add(df[FINGERPRINT_COLUMN].to_numpy())
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        dropped = stats["in_chunk_duplicates"] + stats["db_duplicates"]
+        stats["duplicates_dropped"] = dropped
+        stats["dedup_rate"] = round(dropped / stats["rows_checked"], 6) if stats["rows_checked"] else 0.0
+        stats["bloom_mb"] = round(self.bloom.size_mb, 2)
+        stats["bloom_items"] = self.bloom.count
+        stats["bloom_estimated_fp_rate"] = round(self.bloom.estimated_fp_rate, 6)
+        return stats
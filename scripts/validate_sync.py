@@ -1,7 +1,16 @@
 import os
+import sys
+import math
+import random
 import pymysql
 import time
+from collections import Counter
+from statistics import NormalDist
+from datetime import datetime
+from decimal import Decimal
+import pandas as pd
 from pymongo import MongoClient
+from bson.decimal128 import Decimal128
 from dotenv import load_dotenv
 from monitoring_utils import record_db_metrics
 
@@ -15,91 +24,517 @@ MYSQL_DB = os.getenv("MYSQL_DB_NAME")
 MONGO_URI = os.getenv("MONGODB_URI")
 MONGO_DB = os.getenv("MONGODB_DB_NAME", "nyc_taxi_db")
 
+# Documents to check (0 = every document) and trip_ids per round trip to each store
+VALIDATE_ROWS = int(os.getenv("VALIDATE_ROWS", "1000"))
+VALIDATE_BATCH = int(os.getenv("VALIDATE_BATCH", "5000"))
+TOLERANCE = 0.01
+# trip_ids found out of sync, one "trip_id,issue,columns" line each (missing, extra or mismatch)
+ISSUE_FILE = os.path.join("logs", "sync_issues.csv")
+
+# Stream mode compares every synced column with its rule:
+# exact, numeric (within a tolerance) or datetime (DATETIME, BSON date and ISO string alike)
+COLUMN_RULES = {
+    "vendor_id": ("exact",),
+    "pickup_datetime": ("datetime",),
+    "dropoff_datetime": ("datetime",),
+    "passenger_count": ("exact",),
+    "trip_distance": ("numeric", 1e-6),
+    "rate_code_id": ("exact",),
+    "store_and_fwd_flag": ("exact",),
+    "pu_location_id": ("exact",),
+    "do_location_id": ("exact",),
+    "payment_type": ("exact",),
+    "fare_amount": ("numeric", TOLERANCE),
+    "extra": ("numeric", TOLERANCE),
+    "mta_tax": ("numeric", TOLERANCE),
+    "tip_amount": ("numeric", TOLERANCE),
+    "tolls_amount": ("numeric", TOLERANCE),
+    "improvement_surcharge": ("numeric", TOLERANCE),
+    "total_amount": ("numeric", TOLERANCE),
+    "congestion_surcharge": ("numeric", TOLERANCE),
+    "airport_fee": ("numeric", TOLERANCE),
+    "trip_fingerprint": ("exact",),
+}
+PROGRESS_ROWS = 500000
+
+# Sample mode: margin of error of the estimated mismatch rate at VALIDATE_CONFIDENCE,
+# and the number of trip_id ranges the MySQL side is stratified into
+VALIDATE_ERROR_BOUND = float(os.getenv("VALIDATE_ERROR_BOUND", "0.02"))
+VALIDATE_CONFIDENCE = float(os.getenv("VALIDATE_CONFIDENCE", "0.95"))
+VALIDATE_STRATA = int(os.getenv("VALIDATE_STRATA", "16"))
+
 def get_mysql_conn():
     return pymysql.connect(
         host=MYSQL_HOST, user=MYSQL_USER,
         password=MYSQL_PASSWORD, database=MYSQL_DB
     )
 
-def main():
-    start_time = time.time()
-    
-    print("Validating MySQL ↔ MongoDB sync...")
-    
-    conn = get_mysql_conn()
-    mongo = MongoClient(MONGO_URI)
-    col = mongo[MONGO_DB]["taxi_trips"]
+def open_issue_file(path=ISSUE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "w", encoding="utf-8")
+    f.write("trip_id,issue,columns\n")
+    return f
 
-    # ✅ FIX: Get trip_ids from MongoDB (not MySQL)
-    # This ensures we're checking records that were actually synced
-    print("Fetching sample trip_ids from MongoDB...")
-    mongo_docs = list(col.find({}, {"trip_id": 1}).limit(1000))
-    
-    if not mongo_docs:
-        print("\n❌ ERROR: MongoDB has no data!")
-        print("   Run: python scripts/sync_mysql_to_mongo.py")
-        conn.close()
-        mongo.close()
-        exit(1)
-    
-    mongo_trip_ids = [doc["trip_id"] for doc in mongo_docs]
-    print(f"Checking {len(mongo_trip_ids)} records...")
-    
-    # Now verify these exist in MySQL
+def write_issue(f, trip_id, issue, columns=()):
+    f.write(f"{trip_id},{issue},{'|'.join(columns)}\n")
+
+def write_issue_file(issues, path=ISSUE_FILE):
+    """Write (trip_id, issue) pairs sorted by trip_id; returns the number written."""
+    count = 0
+    with open_issue_file(path) as f:
+        for trip_id, issue in sorted(issues):
+            write_issue(f, trip_id, issue)
+            count += 1
+    return count
+
+def read_issue_file(path=ISSUE_FILE):
+    """{trip_id: issue} from an issue file; empty when there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        next(f, None)
+        return {int(line.split(",", 2)[0]): line.split(",", 2)[1] for line in f if line.strip()}
+
+def to_float(val):
+    """Money is Decimal128 in synced documents (float in ones synced before the BSON type migration)"""
+    if isinstance(val, Decimal128):
+        return float(val.to_decimal())
+    return float(val)
+
+def iter_mongo_batches(col, limit, batch_size):
+    """MongoDB documents in trip_id order, batch_size per query (keyset on the trip_id index)."""
+    last = None
+    remaining = limit or None
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        query = {"trip_id": {"$gt": last}} if last is not None else {}
+        docs = list(col.find(query, {"_id": 0, "trip_id": 1, "total_amount": 1})
+                    .sort("trip_id", 1).limit(size))
+        if not docs:
+            return
+        yield docs
+        last = docs[-1]["trip_id"]
+        if remaining is not None:
+            remaining -= len(docs)
+
+def fetch_mysql_batch(conn, trip_ids):
+    """MySQL side of a batch as a DataFrame, one IN (...) query."""
+    placeholders = ",".join(["%s"] * len(trip_ids))
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT trip_id, total_amount FROM taxi_trips WHERE trip_id IN ({placeholders})",
+            trip_ids
+        )
+        rows = cur.fetchall()
+    frame = pd.DataFrame(rows, columns=["trip_id", "total_amount"])
+    frame["total_amount"] = frame["total_amount"].astype(float)
+    return frame
+
+def compare_batch(mongo_docs, mysql_frame):
+    """(not_found, mismatches) trip_ids of one batch, compared column-wise."""
+    mongo_frame = pd.DataFrame(mongo_docs, columns=["trip_id", "total_amount"])
+    mongo_frame["total_amount"] = mongo_frame["total_amount"].map(
+        lambda v: to_float(v) if v is not None else float("nan"))
+
+    merged = mongo_frame.merge(mysql_frame, on="trip_id", how="left",
+                               suffixes=("_mongo", "_mysql"), indicator=True)
+    found = merged["_merge"] == "both"
+    diff = (merged["total_amount_mysql"] - merged["total_amount_mongo"]).abs()
+    # A missing amount on either side counts as a mismatch, like the old float() failure did
+    mismatched = found & ~(diff <= TOLERANCE)
+    return merged.loc[~found, "trip_id"].tolist(), merged.loc[mismatched, "trip_id"].tolist()
+
+def validate_batch(conn, col, start_time):
+    """Check VALIDATE_ROWS documents' total_amount against MySQL; returns the number of issues."""
+    # ✅ Check trip_ids taken from MongoDB (records that were actually synced) against MySQL,
+    # VALIDATE_BATCH at a time: one MongoDB query and one MySQL IN (...) query per batch
+    scope = f"first {VALIDATE_ROWS}" if VALIDATE_ROWS else "all"
+    print(f"Checking {scope} MongoDB documents in batches of {VALIDATE_BATCH}...")
+
+    checked = 0
     mismatches = 0
     not_found = 0
+    issues = []
+    for batch_no, docs in enumerate(iter_mongo_batches(col, VALIDATE_ROWS, VALIDATE_BATCH), start=1):
+        mysql_frame = fetch_mysql_batch(conn, [doc["trip_id"] for doc in docs])
+        batch_not_found, batch_mismatches = compare_batch(docs, mysql_frame)
+        checked += len(docs)
+        not_found += len(batch_not_found)
+        mismatches += len(batch_mismatches)
+        # Not found in MySQL means the MongoDB document is extra
+        issues += [(trip_id, "extra") for trip_id in batch_not_found]
+        issues += [(trip_id, "mismatch") for trip_id in batch_mismatches]
+        if batch_no % 20 == 0:
+            elapsed = time.time() - start_time
+            print(f"  {checked:,} checked ({checked / elapsed:,.0f} rows/s)")
 
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
-        for trip_id in mongo_trip_ids:
-            # Get from MySQL
-            cur.execute(
-                "SELECT trip_id, fare_amount, total_amount FROM taxi_trips WHERE trip_id = %s",
-                (trip_id,)
-            )
-            mysql_row = cur.fetchone()
-            
-            if not mysql_row:
-                not_found += 1
-                continue
-            
-            # Get from MongoDB
-            mongo_doc = col.find_one({"trip_id": trip_id})
-            
-            if not mongo_doc:
-                not_found += 1
-                continue
-            
-            # Compare values
-            try:
-                mysql_total = float(mysql_row["total_amount"])
-                mongo_total = float(mongo_doc.get("total_amount", 0))
-                
-                if abs(mysql_total - mongo_total) > 0.01:
-                    mismatches += 1
-            except (ValueError, TypeError, KeyError):
-                mismatches += 1
+    if checked == 0:
+        print("\n❌ ERROR: MongoDB has no data!")
+        print("   Run: python scripts/sync_mysql_to_mongo.py")
+        return None
+
+    elapsed = time.time() - start_time
+    rows_per_sec = checked / elapsed if elapsed > 0 else 0.0
 
     print("\n" + "="*50)
     print("Validation Results:")
     print("="*50)
-    print(f"✓ Rows checked:    {len(mongo_trip_ids)}")
+    print(f"✓ Rows checked:    {checked}")
     print(f"✗ Not found:       {not_found}")
     print(f"✗ Mismatches:      {mismatches}")
+    print(f"⏱  Throughput:     {rows_per_sec:,.0f} rows/s")
+    write_issue_file(issues)
+    if issues:
+        print(f"Out-of-sync trip_ids written to {ISSUE_FILE}")
     print("="*50)
 
     # Record metrics
     total_issues = mismatches + not_found
-    record_db_metrics("mysql", "validation", start_time, error_count=0, mismatch_count=total_issues)
+    record_db_metrics("mysql", "validation", start_time, error_count=0, mismatch_count=total_issues,
+                      details={"rows_checked": checked, "not_found": not_found, "mismatches": mismatches,
+                               "rows_per_sec": round(rows_per_sec, 1), "batch_size": VALIDATE_BATCH})
+    return total_issues
+
+# -----------------------------
+# Stream mode: sorted merge join of both stores
+# -----------------------------
+def _number(val):
+    if isinstance(val, Decimal128):
+        return val.to_decimal()
+    if isinstance(val, float):
+        return Decimal(repr(val))
+    return Decimal(val)
+
+def _datetime(val):
+    if isinstance(val, str):
+        return datetime.fromisoformat(val)
+    return val
+
+def values_match(rule, mysql_val, mongo_val):
+    if mysql_val is None or mongo_val is None:
+        return mysql_val is None and mongo_val is None
+    kind = rule[0]
+    if kind == "numeric":
+        return abs(_number(mysql_val) - _number(mongo_val)) <= Decimal(str(rule[1]))
+    if kind == "datetime":
+        return _datetime(mysql_val) == _datetime(mongo_val)
+    return mysql_val == mongo_val
+
+def mismatched_columns(row, doc):
+    return [name for name, rule in COLUMN_RULES.items() if not values_match(rule, row[name], doc.get(name))]
+
+def iter_mysql_sorted(conn, columns):
+    """All taxi_trips rows in trip_id order over an unbuffered cursor (constant memory)."""
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+        cur.execute(f"SELECT trip_id, {', '.join(columns)} FROM taxi_trips ORDER BY trip_id")
+        while True:
+            rows = cur.fetchmany(VALIDATE_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+def iter_mongo_sorted(col, columns):
+    projection = {name: 1 for name in columns}
+    projection.update({"_id": 0, "trip_id": 1})
+    return iter(col.find({}, projection).sort("trip_id", 1).batch_size(VALIDATE_BATCH))
+
+def merge_join(mysql_rows, mongo_docs):
+    """Yield (trip_id, mysql row or None, mongo doc or None) from two trip_id-sorted streams."""
+    row, doc = next(mysql_rows, None), next(mongo_docs, None)
+    while row is not None or doc is not None:
+        if doc is None or (row is not None and row["trip_id"] < doc["trip_id"]):
+            yield row["trip_id"], row, None
+            row = next(mysql_rows, None)
+        elif row is None or doc["trip_id"] < row["trip_id"]:
+            yield doc["trip_id"], None, doc
+            doc = next(mongo_docs, None)
+        else:
+            yield row["trip_id"], row, doc
+            row, doc = next(mysql_rows, None), next(mongo_docs, None)
+
+def validate_stream(conn, col, start_time):
+    """Compare every row and synced column of both stores; returns the number of issues."""
+    columns = list(COLUMN_RULES)
+    print(f"Streaming both stores in trip_id order, comparing {len(columns)} columns...")
+
+    histogram = Counter()
+    counts = Counter()
+    compared = 0
+    with open_issue_file() as issues:
+        for trip_id, row, doc in merge_join(iter_mysql_sorted(conn, columns), iter_mongo_sorted(col, columns)):
+            compared += 1
+            if doc is None:
+                counts["missing"] += 1
+                write_issue(issues, trip_id, "missing")
+            elif row is None:
+                counts["extra"] += 1
+                write_issue(issues, trip_id, "extra")
+            else:
+                bad = mismatched_columns(row, doc)
+                if bad:
+                    counts["mismatch"] += 1
+                    histogram.update(bad)
+                    write_issue(issues, trip_id, "mismatch", bad)
+            if compared % PROGRESS_ROWS == 0:
+                elapsed = time.time() - start_time
+                print(f"  {compared:,} rows ({compared / elapsed:,.0f} rows/s)")
+
+    if compared == 0:
+        print("\n❌ ERROR: both stores are empty!")
+        return None
+
+    elapsed = time.time() - start_time
+    rows_per_sec = compared / elapsed if elapsed > 0 else 0.0
+    total_issues = sum(counts.values())
+
+    print("\n" + "="*50)
+    print("Validation Results (stream):")
+    print("="*50)
+    print(f"✓ Rows compared:   {compared}")
+    print(f"✗ Missing in Mongo: {counts['missing']}")
+    print(f"✗ Extra in Mongo:  {counts['extra']}")
+    print(f"✗ Mismatched rows: {counts['mismatch']}")
+    for name, n in histogram.most_common():
+        print(f"    {name:<24}{n:>10}")
+    print(f"⏱  Throughput:     {rows_per_sec:,.0f} rows/s")
+    if total_issues:
+        print(f"Out-of-sync trip_ids written to {ISSUE_FILE}")
+    print("="*50)
+
+    record_db_metrics("mysql", "validation_stream", start_time, error_count=0, mismatch_count=total_issues,
+                      details={"rows_compared": compared, "missing": counts["missing"], "extra": counts["extra"],
+                               "mismatched_rows": counts["mismatch"], "column_mismatches": dict(histogram),
+                               "rows_per_sec": round(rows_per_sec, 1)})
+    return total_issues
+
+# -----------------------------
+# Sample mode: stratified random sample with a confidence interval
+# -----------------------------
+def sample_size(error_bound, z, population):
+    """Sample size for a proportion within ±error_bound, worst case p = 0.5, finite population corrected."""
+    n0 = z * z * 0.25 / (error_bound * error_bound)
+    return max(1, math.ceil(n0 / (1 + (n0 - 1) / max(population, 1))))
+
+def allocate(total, populations):
+    """Split a sample over strata in proportion to their populations, at least one each."""
+    size = sum(populations)
+    return [min(pop, max(1, round(total * pop / size))) for pop in populations]
+
+def wilson_interval(p, n, z):
+    if n <= 0:
+        return 0.0, 1.0
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+def stratified_estimate(strata, z):
+    """(rate, ci_low, ci_high) of out-of-sync trips from per-stratum population, sampled and issues."""
+    strata = [s for s in strata if s["sampled"]]
+    population = sum(s["population"] for s in strata)
+    if not population:
+        return 0.0, 0.0, 1.0
+    rate = 0.0
+    variance = 0.0
+    for s in strata:
+        weight = s["population"] / population
+        p = s["issues"] / s["sampled"]
+        rate += weight * p
+        fpc = max(0.0, 1 - s["sampled"] / s["population"]) if s["population"] else 0.0
+        variance += weight * weight * p * (1 - p) / s["sampled"] * fpc
+    # Wilson interval at the design's effective sample size: stays informative when no issue was sampled
+    n = sum(s["sampled"] for s in strata)
+    n_eff = rate * (1 - rate) / variance if variance > 0 else n
+    low, high = wilson_interval(rate, n_eff, z)
+    return rate, low, high
+
+def fetch_mysql_rows(conn, trip_ids, columns):
+    placeholders = ",".join(["%s"] * len(trip_ids))
+    with conn.cursor(pymysql.cursors.DictCursor) as cur:
+        cur.execute(f"SELECT trip_id, {', '.join(columns)} FROM taxi_trips WHERE trip_id IN ({placeholders})",
+                    trip_ids)
+        return {row["trip_id"]: row for row in cur.fetchall()}
+
+def fetch_mongo_docs(col, trip_ids, columns):
+    projection = {name: 1 for name in columns}
+    projection.update({"_id": 0, "trip_id": 1})
+    return {doc["trip_id"]: doc for doc in col.find({"trip_id": {"$in": list(trip_ids)}}, projection)}
+
+def pick_trip_ids(conn, lo, hi, k, columns, rounds=5):
+    """Up to k random existing rows with lo <= trip_id < hi, by random primary key lookups.
+
+    Each round draws fresh random ids and keeps a random subset of those that
+    exist, so every row in the range is equally likely. Returns (rows, ids
+    drawn, ids found); found / drawn estimates how densely the range is populated.
+    """
+    rows = {}
+    drawn = set()
+    hits = 0
+    for _ in range(rounds):
+        want = k - len(rows)
+        free = (hi - lo) - len(drawn)
+        if want <= 0 or free <= 0:
+            break
+        # Oversample by the hit rate so far to cover gaps in the id range
+        hit_rate = hits / len(drawn) if drawn else 1.0
+        count = min(free, math.ceil(want / max(hit_rate, 0.05) * 1.1) + 1)
+        ids = set()
+        while len(ids) < count:
+            ids.update(random.randrange(lo, hi) for _ in range(count - len(ids)))
+            ids -= drawn
+        drawn |= ids
+        found = fetch_mysql_rows(conn, sorted(ids), columns)
+        hits += len(found)
+        # found is in trip_id order, so truncating it would favour low ids
+        rows.update(random.sample(list(found.items()), min(want, len(found))))
+    return rows, len(drawn), hits
+
+def month_strata(col):
+    """(month start, next month start, document count) of every non-empty pickup month in MongoDB."""
+    strata = []
+    first = col.find_one({"pickup_datetime": {"$type": "date"}}, {"pickup_datetime": 1},
+                         sort=[("pickup_datetime", 1)])
+    month = first["pickup_datetime"].replace(day=1, hour=0, minute=0, second=0, microsecond=0) if first else None
+    while month is not None:
+        end = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+        count = col.count_documents({"pickup_datetime": {"$gte": month, "$lt": end}})
+        strata.append((month, end, count))
+        # Jump straight to the next month that has trips (outlier dates leave long gaps)
+        following = col.find_one({"pickup_datetime": {"$gte": end}}, {"pickup_datetime": 1},
+                                 sort=[("pickup_datetime", 1)])
+        month = following["pickup_datetime"].replace(day=1, hour=0, minute=0, second=0, microsecond=0) \
+            if following else None
+    return strata
+
+def sample_mysql_side(conn, col, z, columns, issues):
+    """Sample MySQL by trip_id range; finds missing and mismatched trips."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(trip_id), MAX(trip_id) FROM taxi_trips")
+        lo, hi = cur.fetchone()
+    if lo is None:
+        return []
+    hi += 1
+    width = -(-(hi - lo) // VALIDATE_STRATA)
+    ranges = [(a, min(a + width, hi)) for a in range(lo, hi, width)]
+    quotas = allocate(sample_size(VALIDATE_ERROR_BOUND, z, hi - lo), [b - a for a, b in ranges])
+
+    strata = []
+    for (a, b), quota in zip(ranges, quotas):
+        rows, drawn, hits = pick_trip_ids(conn, a, b, quota, columns)
+        docs = fetch_mongo_docs(col, rows, columns) if rows else {}
+        found = 0
+        for trip_id, row in rows.items():
+            doc = docs.get(trip_id)
+            bad = mismatched_columns(row, doc) if doc else None
+            if doc is None or bad:
+                found += 1
+                issues.append((trip_id, "missing" if doc is None else "mismatch", bad or ()))
+        population = round((b - a) * hits / drawn) if drawn else 0
+        strata.append({"stratum": f"trip_id {a}-{b - 1}", "population": population,
+                       "sampled": len(rows), "issues": found})
+    return strata
+
+def sample_mongo_side(conn, col, z, columns, issues):
+    """$sample MongoDB by pickup month; finds extra and mismatched trips."""
+    months = [m for m in month_strata(col) if m[2]]
+    if not months:
+        return []
+    quotas = allocate(sample_size(VALIDATE_ERROR_BOUND, z, sum(m[2] for m in months)), [m[2] for m in months])
+
+    projection = {name: 1 for name in columns}
+    projection.update({"_id": 0, "trip_id": 1})
+    strata = []
+    for (month, end, count), quota in zip(months, quotas):
+        docs = list(col.aggregate([
+            {"$match": {"pickup_datetime": {"$gte": month, "$lt": end}}},
+            {"$sample": {"size": quota}},
+            {"$project": projection},
+        ]))
+        rows = fetch_mysql_rows(conn, [doc["trip_id"] for doc in docs], columns) if docs else {}
+        found = 0
+        for doc in docs:
+            row = rows.get(doc["trip_id"])
+            bad = mismatched_columns(row, doc) if row else None
+            if row is None or bad:
+                found += 1
+                issues.append((doc["trip_id"], "extra" if row is None else "mismatch", bad or ()))
+        strata.append({"stratum": f"{month:%Y-%m}", "population": count, "sampled": len(docs), "issues": found})
+    return strata
+
+def validate_sample(conn, col, start_time):
+    """Estimate the out-of-sync rate from a stratified random sample; returns the number of issues sampled."""
+    z = NormalDist().inv_cdf((1 + VALIDATE_CONFIDENCE) / 2)
+    columns = list(COLUMN_RULES)
+    print(f"Stratified sample for ±{VALIDATE_ERROR_BOUND:.1%} at {VALIDATE_CONFIDENCE:.0%} confidence...")
+
+    issues = []
+    sides = {
+        "mysql_by_trip_id": sample_mysql_side(conn, col, z, columns, issues),
+        "mongo_by_pickup_month": sample_mongo_side(conn, col, z, columns, issues),
+    }
+    sampled = sum(s["sampled"] for strata in sides.values() for s in strata)
+    if sampled == 0:
+        print("\n❌ ERROR: both stores are empty!")
+        return None
+
+    elapsed = time.time() - start_time
+    print("\n" + "="*50)
+    print("Validation Results (sample):")
+    print("="*50)
+    estimates = {}
+    for side, strata in sides.items():
+        rate, low, high = stratified_estimate(strata, z)
+        n = sum(s["sampled"] for s in strata)
+        found = sum(s["issues"] for s in strata)
+        estimates[side] = {"sampled": n, "issues": found, "strata": len(strata), "rate": round(rate, 6),
+                           "ci_low": round(low, 6), "ci_high": round(high, 6)}
+        print(f"{side:<22} {n:>6} sampled in {len(strata):>3} strata, {found} out of sync: "
+              f"{rate:.2%} (CI {low:.2%}–{high:.2%})")
+    print(f"⏱  Elapsed:        {elapsed:.1f}s")
+
+    # Deduplicate: a trip can be sampled from both sides
+    unique = {}
+    for trip_id, issue, bad in issues:
+        unique.setdefault(trip_id, (issue, bad))
+    with open_issue_file() as f:
+        for trip_id in sorted(unique):
+            write_issue(f, trip_id, *unique[trip_id])
+    if unique:
+        print(f"Out-of-sync trip_ids written to {ISSUE_FILE}")
+    print("="*50)
+
+    record_db_metrics("mysql", "validation_sample", start_time, error_count=0, mismatch_count=len(unique),
+                      details={**estimates, "error_bound": VALIDATE_ERROR_BOUND,
+                               "confidence": VALIDATE_CONFIDENCE, "seconds": round(elapsed, 2)})
+    return len(unique)
+
+VALIDATORS = {"batch": validate_batch, "stream": validate_stream, "sample": validate_sample}
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else "batch"
+    if mode not in VALIDATORS:
+        raise SystemExit(f"Unknown mode '{mode}', expected one of {list(VALIDATORS)}")
+    start_time = time.time()
+
+    print(f"Validating MySQL ↔ MongoDB sync ({mode})...")
+
+    conn = get_mysql_conn()
+    mongo = MongoClient(MONGO_URI)
+    col = mongo[MONGO_DB]["taxi_trips"]
+
+    total_issues = VALIDATORS[mode](conn, col, start_time)
 
     conn.close()
     mongo.close()
 
-    if mismatches == 0 and not_found == 0:
+    if total_issues == 0:
         print("\n✅ Validation PASSED - Data is in sync!")
         exit(0)
+    elif total_issues is None:
+        exit(1)
     else:
         print(f"\n⚠️  Validation found {total_issues} issues")
         exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,6 @@
+-- Extra monitoring columns:
+--   peak_rss_mb  high-water mark of the reporting process' resident memory
+--   details      free-form JSON for operation specific counters (rows, engine, batch size, ...)
+ALTER TABLE db_metrics
+    ADD COLUMN peak_rss_mb DOUBLE,
+    ADD COLUMN details JSON;
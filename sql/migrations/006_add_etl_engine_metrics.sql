@@ -0,0 +1,4 @@
+-- Record which load engine ran and its insert throughput so engines can be compared
+ALTER TABLE etl_metrics
+    ADD COLUMN engine VARCHAR(20),
+    ADD COLUMN rows_per_sec DOUBLE;
@@ -0,0 +1,10 @@
+-- One row per committed ETL chunk, written in the same transaction as the chunk's rows.
+-- A restarted load skips row ranges already present here instead of inserting duplicates.
+CREATE TABLE IF NOT EXISTS etl_chunk_ledger (
+    source_file VARCHAR(255) NOT NULL,      -- source file name, e.g. yellow_tripdata_2023-01.parquet
+    row_offset BIGINT NOT NULL,             -- first source row of the chunk
+    row_count INT NOT NULL,                 -- source rows covered by the chunk
+    rows_loaded INT NOT NULL,               -- rows actually inserted into taxi_trips
+    committed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_file, row_offset)
+);
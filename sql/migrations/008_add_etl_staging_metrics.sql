@@ -0,0 +1,5 @@
+-- Staging loads: how long the deferred index build took and how long the RENAME TABLE swap blocked readers
+ALTER TABLE etl_metrics
+    ADD COLUMN mode VARCHAR(20),
+    ADD COLUMN index_build_seconds DOUBLE,
+    ADD COLUMN swap_ms DOUBLE;
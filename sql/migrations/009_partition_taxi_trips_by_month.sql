@@ -0,0 +1,30 @@
+-- Monthly RANGE partitioning of taxi_trips on pickup_datetime.
+-- Every unique key of a partitioned table must contain the partitioning column,
+-- so the primary key becomes (trip_id, pickup_datetime) and pickup_datetime NOT NULL
+-- (the ETL drops source rows without a pickup time).
+-- Date-range queries only read the matching month partitions, and retention
+-- drops whole partitions instead of running large DELETEs.
+-- Partitions after 2023-12 are created ahead of each load by scripts/manage_partitions.py,
+-- which splits them out of p_future.
+ALTER TABLE taxi_trips
+    MODIFY pickup_datetime DATETIME NOT NULL,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (trip_id, pickup_datetime);
+
+ALTER TABLE taxi_trips
+PARTITION BY RANGE COLUMNS (pickup_datetime) (
+    PARTITION p_history VALUES LESS THAN ('2023-01-01'),
+    PARTITION p202301 VALUES LESS THAN ('2023-02-01'),
+    PARTITION p202302 VALUES LESS THAN ('2023-03-01'),
+    PARTITION p202303 VALUES LESS THAN ('2023-04-01'),
+    PARTITION p202304 VALUES LESS THAN ('2023-05-01'),
+    PARTITION p202305 VALUES LESS THAN ('2023-06-01'),
+    PARTITION p202306 VALUES LESS THAN ('2023-07-01'),
+    PARTITION p202307 VALUES LESS THAN ('2023-08-01'),
+    PARTITION p202308 VALUES LESS THAN ('2023-09-01'),
+    PARTITION p202309 VALUES LESS THAN ('2023-10-01'),
+    PARTITION p202310 VALUES LESS THAN ('2023-11-01'),
+    PARTITION p202311 VALUES LESS THAN ('2023-12-01'),
+    PARTITION p202312 VALUES LESS THAN ('2024-01-01'),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
@@ -0,0 +1,8 @@
+-- Ingest-time duplicate detection.
+-- trip_fingerprint is a 64-bit hash of vendor, pickup/dropoff time, PU/DO location
+-- and total_amount computed by the ETL (scripts/trip_dedup.py).
+-- The unique key has to include pickup_datetime because taxi_trips is partitioned by it.
+-- Rows loaded before this migration keep a NULL fingerprint.
+ALTER TABLE taxi_trips
+    ADD COLUMN trip_fingerprint BIGINT NULL,
+    ADD UNIQUE KEY uq_trip_fingerprint (trip_fingerprint, pickup_datetime);
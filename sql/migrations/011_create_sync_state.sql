@@ -0,0 +1,16 @@
+-- Incremental MySQL -> MongoDB sync.
+-- updated_at changes on every write, so new and modified trips can be read in
+-- (updated_at, trip_id) keyset order from idx_updated_trip.
+ALTER TABLE taxi_trips
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_updated_trip (updated_at, trip_id);
+
+-- One row per sync job holding its watermark (the last synced row in keyset order)
+CREATE TABLE IF NOT EXISTS sync_state (
+    sync_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    last_updated_at DATETIME NOT NULL,      -- updated_at of the last synced row
+    last_trip_id BIGINT NOT NULL,           -- trip_id of the last synced row (tie-break within one second)
+    max_trip_id BIGINT NOT NULL DEFAULT 0,  -- highest trip_id synced so far
+    rows_synced BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,12 @@
+-- Binlog change-data-capture replicator (scripts/cdc_replicator.py).
+-- One row per replicator holding the binlog position after the last transaction
+-- whose changes were applied to MongoDB. Positions are only taken at transaction
+-- commits (Xid events) so a restart never resumes in the middle of a transaction.
+CREATE TABLE IF NOT EXISTS cdc_checkpoint (
+    replicator_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    log_file VARCHAR(255) NOT NULL,
+    log_pos BIGINT NOT NULL,
+    events_applied BIGINT NOT NULL DEFAULT 0,  -- row changes applied since the checkpoint was created
+    last_event_at DATETIME NULL,               -- binlog timestamp of the last applied change
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,17 @@
+-- Range-sharded parallel MySQL -> MongoDB sync (scripts/parallel_sync.py).
+-- One row per trip_id range of the current full sync. Each worker process
+-- checkpoints next_trip_id after every written page, so an interrupted run
+-- resumes where each shard stopped. Splitting a straggler lowers its range_end
+-- and adds a shard for the rest of its range.
+CREATE TABLE IF NOT EXISTS sync_shards (
+    sync_name VARCHAR(64) NOT NULL,
+    shard_id INT NOT NULL,
+    range_start BIGINT NOT NULL,            -- first trip_id of the shard
+    range_end BIGINT NOT NULL,              -- exclusive upper trip_id
+    next_trip_id BIGINT NOT NULL,           -- resume point
+    rows_synced BIGINT NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',  -- pending, running or done
+    snapshot_at DATETIME NOT NULL,          -- incremental sync watermark handed over once all shards are done
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (sync_name, shard_id)
+);
@@ -91,4 +91,14 @@ SELECT
 FROM taxi_trips t
 INNER JOIN anomalies_taxi a ON t.trip_id = a.trip_id
 ORDER BY a.score ASC
-LIMIT 20;
\ No newline at end of file
+LIMIT 20;
+
+-- Query 9: Daily revenue for one month (partition-aware: reads only p202301)
+SELECT 
+    DATE(pickup_datetime) AS trip_date,
+    COUNT(*) AS total_trips,
+    ROUND(SUM(total_amount), 2) AS total_revenue
+FROM taxi_trips
+WHERE pickup_datetime >= '2023-01-01' AND pickup_datetime < '2023-02-01'
+GROUP BY DATE(pickup_datetime)
+ORDER BY trip_date;
\ No newline at end of file
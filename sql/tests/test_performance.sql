@@ -42,6 +42,19 @@ FROM taxi_trips
 WHERE total_amount > (SELECT AVG(total_amount) * 2 FROM taxi_trips)
 LIMIT 10;
 
+-- Test 6: Partition pruning (one month should read only its own partition)
+SELECT 'Test 6: Partition pruning for a one-month range (should read only p202301)' AS test;
+EXPLAIN SELECT COUNT(*)
+FROM taxi_trips
+WHERE pickup_datetime >= '2023-01-01' AND pickup_datetime < '2023-02-01';
+
+-- Test 7: Partition pruning for the aggregation over a date range
+SELECT 'Test 7: Partition pruning for a 7-day window (should skip older months)' AS test;
+EXPLAIN SELECT DATE(pickup_datetime), COUNT(*)
+FROM taxi_trips
+WHERE pickup_datetime >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+GROUP BY DATE(pickup_datetime);
+
 -- Show index usage
 SELECT 'Index Usage Analysis' AS test;
 EXPLAIN SELECT * FROM taxi_trips WHERE pickup_datetime > '2023-01-01' LIMIT 100;